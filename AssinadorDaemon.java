@@ -0,0 +1,92 @@
+import net.sf.jsignpdf.SignerLogic;
+import net.sf.jsignpdf.SignerOptionsFromCmdLine;
+
+import java.io.BufferedReader;
+import java.io.FileDescriptor;
+import java.io.FileOutputStream;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import java.nio.charset.StandardCharsets;
+import java.util.Arrays;
+
+/**
+ * Processo assinador de longa duração usado pelo pool de assinador.py.
+ *
+ * Executado em modo "source file" (JDK 11+), com o JSignPdf no classpath:
+ *   java -cp JSignPdf.jar AssinadorDaemon.java
+ *
+ * Protocolo: uma requisição por linha em stdin, campos separados por TAB,
+ * uma resposta por linha em stdout.
+ *   PING                                   -> PONG
+ *   SIGN entrada saida [args JSignPdf...]  -> OK | ERR mensagem
+ *   SIGNBATCH n ent1 sai1 ... entN saiN [args JSignPdf...]
+ *                                          -> RES r1 ... rN   (cada r: OK | ERR mensagem)
+ *
+ * No SIGNBATCH as opções (certificado, senha...) são lidas uma vez e valem
+ * para os N arquivos.
+ *
+ * Os logs do JSignPdf vão para stderr para não misturar com o protocolo.
+ */
+public class AssinadorDaemon {
+
+    public static void main(String[] args) throws Exception {
+        BufferedReader in = new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8));
+        PrintStream out = new PrintStream(new FileOutputStream(FileDescriptor.out), true, "UTF-8");
+        System.setOut(System.err);
+
+        out.println("READY");
+        String linha;
+        while ((linha = in.readLine()) != null) {
+            String[] campos = linha.split("\t", -1);
+            String comando = campos[0];
+            try {
+                if ("PING".equals(comando)) {
+                    out.println("PONG");
+                } else if ("SIGN".equals(comando) && campos.length >= 3) {
+                    out.println(assinar(campos[1], campos[2], Arrays.copyOfRange(campos, 3, campos.length)));
+                } else if ("SIGNBATCH".equals(comando) && campos.length >= 2) {
+                    out.println(assinarLote(campos));
+                } else {
+                    out.println("ERR comando invalido");
+                }
+            } catch (Throwable t) {
+                out.println("ERR " + String.valueOf(t).replace('\n', ' ').replace('\r', ' '));
+            }
+        }
+    }
+
+    private static String assinar(String entrada, String saida, String[] argsJSignPdf) throws Exception {
+        SignerOptionsFromCmdLine opts = new SignerOptionsFromCmdLine();
+        opts.setCmdLine(argsJSignPdf);
+        opts.loadCmdLine();
+        opts.setInFile(entrada);
+        opts.setOutFile(saida);
+        boolean ok = new SignerLogic(opts).signFile();
+        return ok ? "OK" : "ERR falha ao assinar " + entrada;
+    }
+
+    private static String assinarLote(String[] campos) throws Exception {
+        int n = Integer.parseInt(campos[1]);
+        if (n < 1 || campos.length < 2 + 2 * n) {
+            return "ERR SIGNBATCH com numero de arquivos invalido";
+        }
+        SignerOptionsFromCmdLine opts = new SignerOptionsFromCmdLine();
+        opts.setCmdLine(Arrays.copyOfRange(campos, 2 + 2 * n, campos.length));
+        opts.loadCmdLine();
+
+        StringBuilder res = new StringBuilder("RES");
+        for (int i = 0; i < n; i++) {
+            String entrada = campos[2 + 2 * i];
+            String r;
+            try {
+                opts.setInFile(entrada);
+                opts.setOutFile(campos[3 + 2 * i]);
+                r = new SignerLogic(opts).signFile() ? "OK" : "ERR falha ao assinar " + entrada;
+            } catch (Throwable t) {
+                r = "ERR " + String.valueOf(t);
+            }
+            res.append('\t').append(r.replace('\t', ' ').replace('\n', ' ').replace('\r', ' '));
+        }
+        return res.toString();
+    }
+}
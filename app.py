@@ -1,9 +1,24 @@
-from flask import Flask
+from flask import Flask, request
 from flask_cors import CORS
 from atestado import atestado_bp
 from declaracao import declaracao_bp
 from receita import receita_bp
 from pedido_medicos import exames_bp  # ✅ arquivo certo
+from jobs import jobs_bp
+from validacao import validacao_bp, invalidar_validacao
+from assinador import status_pool
+from credenciais import invalidar_credenciais
+from db import estatisticas_pool
+from perfil_medico import obter_perfil, invalidar_perfis, estatisticas_perfis
+from esquema import recarregar_esquema, estatisticas_esquema
+from invalidacao import publicar_invalidacao, sincronizar_invalidacoes, estatisticas_invalidacao
+from rodape import estatisticas_rodapes
+from limpeza import iniciar_varredor, varrer_agora, estatisticas_limpeza
+from armazenamento import estatisticas_armazenamento
+from entrega import estatisticas_entrega
+from pipeline import estatisticas_pipeline
+from metricas import metricas_bp
+from captura import instalar_captura, estatisticas_captura
 
 app = Flask(__name__)
 CORS(app)
@@ -13,6 +28,82 @@ app.register_blueprint(atestado_bp)
 app.register_blueprint(declaracao_bp)
 app.register_blueprint(receita_bp)
 app.register_blueprint(exames_bp)
+app.register_blueprint(jobs_bp)
+app.register_blueprint(validacao_bp)
+app.register_blueprint(metricas_bp)
+
+# captura de tráfego para o replay (só com CAPTURA_ARQUIVO definido)
+instalar_captura(app)
+
+# esquema do banco + clinica_config uma vez na subida (depois, refresh lento)
+recarregar_esquema()
+
+# invalidações publicadas por outros workers (perfis, credenciais, validação, esquema)
+sincronizar_invalidacoes(forcar=True)
+
+@app.before_request
+def sincronizar_caches():
+    sincronizar_invalidacoes()
+
+# rotas de operação: sem autenticação própria, o nginx não as expõe
+# (nginx-medicos/default.conf, igual ao /metrics); chamar api-medicos:6969 direto
+@app.route('/api/assinador/status')
+def assinador_status():
+    return status_pool()
+
+@app.route('/api/assinador/credenciais/invalidar', methods=['POST'])
+def assinador_invalidar_credenciais():
+    medico_id = request.args.get('medico_id', type=int)
+    return {"removidas": invalidar_credenciais(medico_id)}
+
+@app.route('/api/medicos/perfil/invalidar', methods=['POST'])
+def medico_perfil_invalidar():
+    # chamado pelo painel da clínica depois de alterar médico/papel/timbrado/conselho
+    medico_id = request.args.get('medico_id', type=int)
+    if medico_id is None:
+        # mudança geral da clínica: relê também clinica_config/esquema (em todos os workers)
+        publicar_invalidacao("esquema")
+    # nome/conselho/assinatura aparecem nas páginas de validação já em cache
+    invalidar_validacao(medico_id=medico_id)
+    return {"removidos": invalidar_perfis(medico_id)}
+
+@app.route('/api/medicos/<int:medico_id>/perfil')
+def medico_perfil(medico_id):
+    return {"perfil": obter_perfil(medico_id).como_dict(), "cache": estatisticas_perfis(),
+            "rodapes": estatisticas_rodapes()}
+
+@app.route('/api/cache/invalidacao')
+def cache_invalidacao_status():
+    return estatisticas_invalidacao()
+
+@app.route('/api/db/esquema')
+def db_esquema_status():
+    return estatisticas_esquema()
+
+@app.route('/api/db/pool')
+def db_pool_status():
+    return estatisticas_pool()
+
+@app.route('/api/limpeza')
+def limpeza_status():
+    return estatisticas_limpeza()
+
+@app.route('/api/limpeza/executar', methods=['POST'])
+def limpeza_executar():
+    return {"resultado": varrer_agora(), "total": estatisticas_limpeza()}
+
+@app.route('/api/armazenamento')
+def armazenamento_status():
+    return {**estatisticas_armazenamento(), "entrega": estatisticas_entrega()}
+
+@app.route('/api/pipeline')
+def pipeline_status():
+    return estatisticas_pipeline()
+
+@app.route('/api/captura')
+def captura_status():
+    return estatisticas_captura()
 
 if __name__ == '__main__':
+    iniciar_varredor()
     app.run(host="0.0.0.0", port=6969, debug=True)  
@@ -0,0 +1,119 @@
+# aquecimento.py
+"""
+Aquecimento dos caches antes do fork dos workers (gunicorn.conf.py).
+
+Com preload_app o gunicorn importa o app no processo mestre; `aquecer()`
+roda ali e tudo que é só memória fica pronto para os workers herdarem
+(copy-on-write), em vez de cada worker pagar o custo no 1º documento:
+
+- esquema do banco + clinica_config
+- fontes do ReportLab (métricas) e um render vazio (módulos/encodings)
+- perfis dos médicos (até AQUECER_MEDICOS), timbrados e blocos de rodapé
+  de cada tipo de documento, credenciais (PKCS12 já aberto)
+
+No fim as conexões abertas no mestre são fechadas: socket não atravessa
+fork. Processos Java do assinador e threads (jobs, lotes) continuam sendo
+criados sob demanda em cada worker.
+"""
+import os, io, time, logging
+
+from reportlab.lib.pagesizes import A4, A5
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfgen import canvas
+
+from db import conectar, pool
+from esquema import recarregar_esquema
+from perfil_medico import obter_perfil
+from rodape import LAYOUTS, obter_bloco_rodape
+from credenciais import obter_credencial
+from utils import precarregar_fundo_papel
+
+AQUECER_MEDICOS = int(os.getenv("AQUECER_MEDICOS", "200"))
+FONTES = ("Helvetica", "Helvetica-Bold", "Helvetica-Oblique", "Times-Roman")
+
+logger = logging.getLogger(__name__)
+
+
+def _aquecer_fontes():
+    for fonte in FONTES:
+        pdfmetrics.getFont(fonte)
+        pdfmetrics.stringWidth("Aquecimento áéíóú çÇ", fonte, 11)
+    pdf = canvas.Canvas(io.BytesIO(), pagesize=A4)
+    for fonte in FONTES:
+        pdf.setFont(fonte, 11)
+        pdf.drawString(50, 50, "Aquecimento")
+    pdf.save()
+    return len(FONTES)
+
+
+def _medicos(limite):
+    conn = conectar()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM medicos ORDER BY id DESC LIMIT %s", (limite,))
+        ids = [int(r[0]) for r in cur.fetchall() or []]
+        cur.close()
+        return ids
+    finally:
+        conn.close()
+
+
+def _aquecer_medico(medico_id, resumo):
+    perfil = obter_perfil(medico_id)
+    if not perfil.existe:
+        return
+    resumo["perfis"] += 1
+
+    for tam, pagesize in (("A4", A4), ("A5", A5)):
+        caminho = perfil.timbrado(tam)
+        try:
+            if precarregar_fundo_papel(caminho, *pagesize):
+                resumo["timbrados"] += 1
+        except Exception as e:
+            logger.warning("[AQUECIMENTO] timbrado %s do médico %s: %s", caminho, medico_id, e)
+
+    label = perfil.conselho_label(perfil.crm)
+    for doc_tipo in LAYOUTS:
+        obter_bloco_rodape(medico_id, doc_tipo, perfil.papel(doc_tipo), perfil.nome,
+                           label, perfil.assinatura_img_path)
+        resumo["rodapes"] += 1
+
+    if perfil.cert_path and os.path.isfile(perfil.cert_path) and perfil.cert_senha:
+        try:
+            obter_credencial(medico_id, perfil.cert_path, perfil.cert_senha)
+            resumo["credenciais"] += 1
+        except Exception as e:
+            logger.warning("[AQUECIMENTO] credencial do médico %s: %s", medico_id, e)
+
+
+def aquecer(limite_medicos: int = AQUECER_MEDICOS):
+    """Preenche os caches do processo atual. Nunca levanta: falhas só viram log."""
+    inicio = time.perf_counter()
+    resumo = {"fontes": 0, "perfis": 0, "timbrados": 0, "rodapes": 0, "credenciais": 0, "erros": 0}
+    esq = recarregar_esquema()
+    resumo["esquema_conhecido"] = esq.conhecido
+    try:
+        resumo["fontes"] = _aquecer_fontes()
+    except Exception as e:
+        resumo["erros"] += 1
+        logger.warning("[AQUECIMENTO] fontes: %s", e)
+
+    ids = []
+    if esq.conhecido and limite_medicos > 0:
+        try:
+            ids = _medicos(limite_medicos)
+        except Exception as e:
+            resumo["erros"] += 1
+            logger.warning("[AQUECIMENTO] lista de médicos indisponível: %s", e)
+    for medico_id in ids:
+        try:
+            _aquecer_medico(medico_id, resumo)
+        except Exception as e:
+            resumo["erros"] += 1
+            logger.warning("[AQUECIMENTO] médico %s: %s", medico_id, e)
+
+    # conexões do mestre não podem ser herdadas pelos workers
+    pool.fechar_todas()
+    resumo["tempo_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+    logger.info("[AQUECIMENTO] %s", resumo)
+    return resumo
@@ -0,0 +1,141 @@
+# armazenamento.py
+"""
+Armazenamento dos PDFs gerados: por data e prefixo do hash, endereçado pelo conteúdo.
+
+    receitas/2025/07/3f/3fa9...e1.pdf      (<pasta>/<AAAA>/<MM>/<sha[:2]>/<sha256>.pdf)
+
+- o nome é o SHA-256 do arquivo: o mesmo conteúdo gravado duas vezes vira
+  um arquivo só (dedup) e o nome já serve de verificação de integridade
+- gravação atômica: arquivo temporário no mesmo diretório + os.replace,
+  ninguém enxerga PDF pela metade
+- pdf_assinado_path continua com o caminho absoluto; se a tabela tiver as
+  colunas pdf_sha256/pdf_tamanho (esquema.py) elas são preenchidas. As
+  colunas vêm de migracoes/001_pdf_sha256.sql (python ferramentas/migrar.py)
+
+- `resolver()` é o shim das URLs: aceita o caminho relativo novo, os nomes
+  antigos da pasta plana (receita_<uuid>.pdf, pedido_exames_<id>_<ts>.pdf)
+  e o nome só com o hash (<sha256>.pdf)
+"""
+import os, glob, hashlib, re, tempfile, threading
+from datetime import datetime
+
+from esquema import esquema
+
+ARMAZENAMENTO_FSYNC = (os.getenv("ARMAZENAMENTO_FSYNC") or "1").strip().lower() not in ("0", "false", "nao", "não")
+
+_RE_HASH = re.compile(r"^[0-9a-f]{64}\.pdf$")
+
+_lock = threading.Lock()
+_stats = {"gravados": 0, "deduplicados": 0, "bytes": 0, "legado": 0, "por_hash": 0, "nao_encontrados": 0}
+
+
+def _contar(chave, n=1):
+    with _lock:
+        _stats[chave] += n
+
+
+class DocumentoGravado:
+    def __init__(self, pasta, caminho, sha256, tamanho, deduplicado):
+        self.pasta = pasta
+        self.caminho = caminho
+        self.relativo = os.path.relpath(caminho, pasta).replace(os.sep, "/")
+        self.nome = os.path.basename(caminho)
+        self.sha256 = sha256
+        self.tamanho = tamanho
+        self.deduplicado = deduplicado
+
+    def como_dict(self):
+        return {"caminho": self.caminho, "relativo": self.relativo, "sha256": self.sha256,
+                "tamanho": self.tamanho, "deduplicado": self.deduplicado}
+
+
+def caminho_relativo(sha256: str, quando: datetime = None) -> str:
+    quando = quando or datetime.now()
+    return f"{quando:%Y}/{quando:%m}/{sha256[:2]}/{sha256}.pdf"
+
+
+def gravar(pasta: str, pdf_bytes: bytes, quando: datetime = None) -> DocumentoGravado:
+    """Grava `pdf_bytes` em `pasta` (atômico, com dedup) e devolve onde ficou."""
+    pdf_bytes = pdf_bytes or b""
+    sha = hashlib.sha256(pdf_bytes).hexdigest()
+    destino = os.path.join(pasta, *caminho_relativo(sha, quando).split("/"))
+    diretorio = os.path.dirname(destino)
+    os.makedirs(diretorio, exist_ok=True)
+
+    if os.path.isfile(destino) and os.path.getsize(destino) == len(pdf_bytes):
+        _contar("deduplicados")
+        return DocumentoGravado(pasta, destino, sha, len(pdf_bytes), True)
+
+    fd, tmp = tempfile.mkstemp(dir=diretorio, prefix=".tmp-", suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(pdf_bytes)
+            if ARMAZENAMENTO_FSYNC:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, destino)
+    except Exception:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    with _lock:
+        _stats["gravados"] += 1
+        _stats["bytes"] += len(pdf_bytes)
+    return DocumentoGravado(pasta, destino, sha, len(pdf_bytes), False)
+
+
+def sha_do_nome(nome: str):
+    """SHA-256 embutido num nome endereçado pelo conteúdo (<sha256>.pdf), ou None (nome antigo)."""
+    base = (nome or "").replace("\\", "/").rsplit("/", 1)[-1]
+    return base[:-4] if _RE_HASH.match(base) else None
+
+
+def resolver(pasta: str, nome: str):
+    """Caminho relativo (para send_from_directory) de `nome` dentro de `pasta`, ou None."""
+    nome = (nome or "").replace("\\", "/").strip("/")
+    if not nome or ".." in nome.split("/"):
+        return None
+    if os.path.isfile(os.path.join(pasta, *nome.split("/"))):
+        if "/" not in nome:
+            _contar("legado")
+        return nome
+    base = nome.rsplit("/", 1)[-1]
+    if _RE_HASH.match(base):
+        # só o hash: procura nos meses (poucos diretórios, não os arquivos)
+        achados = glob.glob(os.path.join(pasta, "[0-9][0-9][0-9][0-9]", "[0-9][0-9]", base[:2], base))
+        if achados:
+            _contar("por_hash")
+            return os.path.relpath(achados[0], pasta).replace(os.sep, "/")
+    _contar("nao_encontrados")
+    return None
+
+
+def nome_publico(pasta: str, caminho_salvo) -> str:
+    """O que vai na URL para um pdf_assinado_path do banco (novo: relativo; antigo: basename)."""
+    if not caminho_salvo:
+        return ""
+    caminho = str(caminho_salvo).strip().replace("\r", "").replace("\n", "").replace("\\", "/")
+    raiz = os.path.abspath(pasta).replace("\\", "/").rstrip("/") + "/"
+    if caminho.startswith(raiz):
+        return caminho[len(raiz):]
+    return caminho.split("/")[-1]
+
+
+def atualizar_registro(cur, tabela: str, documento_id, doc: DocumentoGravado):
+    """UPDATE de pdf_assinado_path (+ pdf_sha256/pdf_tamanho quando as colunas existem)."""
+    esq = esquema()
+    campos, valores = ["pdf_assinado_path=%s"], [doc.caminho.replace("\\", "/")]
+    if esq.tem_coluna(tabela, "pdf_sha256"):
+        campos.append("pdf_sha256=%s")
+        valores.append(doc.sha256)
+    if esq.tem_coluna(tabela, "pdf_tamanho"):
+        campos.append("pdf_tamanho=%s")
+        valores.append(doc.tamanho)
+    cur.execute(f"UPDATE {tabela} SET {', '.join(campos)} WHERE id=%s", (*valores, documento_id))
+
+
+def estatisticas_armazenamento():
+    with _lock:
+        return {**_stats, "fsync": ARMAZENAMENTO_FSYNC}
@@ -0,0 +1,610 @@
+# assinador.py
+"""
+Cliente único de assinatura digital (JSignPdf) usado por todos os blueprints.
+
+Em vez de subir uma JVM (`java -jar JSignPdf.jar`) por documento, mantém um
+pool de processos Java de longa duração (AssinadorDaemon.java) que recebem
+pedidos de assinatura por stdin/stdout. Cada processo é verificado
+periodicamente (PING) e reiniciado automaticamente se morrer ou travar.
+
+Se o daemon não puder ser usado, cai no modo antigo (`java -jar`).
+
+Pedidos para o mesmo certificado que chegam juntos são agrupados (fila de
+coalescência): o primeiro espera até ASSINADOR_LOTE_JANELA_MS ou até
+ASSINADOR_LOTE_MAX pedidos e o lote inteiro sai numa chamada só (SIGNBATCH
+no daemon, vários arquivos num `java -jar`). Cada pedido recebe o seu
+resultado. ASSINADOR_LOTE_JANELA_MS=0 desliga o agrupamento.
+
+Os blueprints assinam via `assinar_documento()`, que escolhe o backend
+(JSignPdf ou pyHanko em processo) por tipo de documento:
+  ASSINADOR_BACKEND_<DOC_TIPO>  ->  ASSINADOR_BACKEND  ->  "jsignpdf"
+"""
+import os, io, queue, shutil, subprocess, tempfile, threading, time, logging
+from pathlib import Path
+
+try:
+    from pyhanko.sign import signers
+    from pyhanko.sign.fields import SigSeedSubFilter
+    from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
+except Exception:
+    signers = None
+
+from credenciais import obter_credencial, estatisticas_credenciais
+
+CAMINHO_JSIGNPDF = os.getenv("JSIGNPDF_JAR", "JSignPdf.jar")
+CAMINHO_DAEMON = os.getenv(
+    "ASSINADOR_DAEMON_SRC",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "AssinadorDaemon.java"),
+)
+ASSINADOR_MODO = (os.getenv("ASSINADOR_MODO") or "daemon").strip().lower()   # daemon | cli
+ASSINADOR_WORKERS = int(os.getenv("ASSINADOR_WORKERS", "2"))
+ASSINADOR_TIMEOUT = float(os.getenv("ASSINADOR_TIMEOUT", "60"))
+ASSINADOR_TIMEOUT_INICIO = float(os.getenv("ASSINADOR_TIMEOUT_INICIO", "60"))
+ASSINADOR_HEALTH_INTERVALO = float(os.getenv("ASSINADOR_HEALTH_INTERVALO", "30"))
+ASSINADOR_BACKEND = (os.getenv("ASSINADOR_BACKEND") or "jsignpdf").strip().lower()   # jsignpdf | pyhanko
+ASSINADOR_LOTE_JANELA_MS = float(os.getenv("ASSINADOR_LOTE_JANELA_MS", "15"))
+ASSINADOR_LOTE_MAX = int(os.getenv("ASSINADOR_LOTE_MAX", "8"))
+# o JSignPdf só assina arquivos: os de trabalho ficam em memória (tmpfs) quando possível
+ASSINADOR_TMPDIR = os.getenv("ASSINADOR_TMPDIR") or (
+    "/dev/shm" if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK) else None
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ErroAssinatura(RuntimeError):
+    pass
+
+
+# -------------------- processo assinador --------------------
+class _ProcessoAssinador:
+    """Um processo Java (AssinadorDaemon) com protocolo de uma linha por pedido."""
+
+    def __init__(self, indice: int):
+        self.indice = indice
+        self.proc = None
+        self.reinicios = 0
+        self.pedidos = 0
+        self._respostas = queue.Queue()
+
+    def iniciar(self):
+        cmd = ["java", "-cp", CAMINHO_JSIGNPDF, CAMINHO_DAEMON]
+        self._respostas = queue.Queue()
+        self.proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            text=True, encoding="utf-8", bufsize=1,
+        )
+        threading.Thread(target=self._ler_stdout, args=(self.proc, self._respostas), daemon=True).start()
+        threading.Thread(target=self._ler_stderr, args=(self.proc,), daemon=True).start()
+        pronto = self._aguardar_resposta(ASSINADOR_TIMEOUT_INICIO)
+        if pronto != "READY":
+            self.parar()
+            raise ErroAssinatura(f"Assinador #{self.indice} não iniciou (resposta: {pronto!r})")
+
+    def parar(self):
+        proc, self.proc = self.proc, None
+        if proc is None:
+            return
+        try:
+            proc.stdin.close()
+        except Exception:
+            pass
+        try:
+            proc.wait(timeout=5)
+        except Exception:
+            proc.kill()
+
+    def reiniciar(self):
+        self.parar()
+        self.reinicios += 1
+        self.iniciar()
+
+    def vivo(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def requisitar(self, campos, timeout: float) -> str:
+        if any(("\t" in c) or ("\n" in c) for c in campos):
+            raise ErroAssinatura("Argumento inválido para o assinador (TAB/quebra de linha)")
+        try:
+            self.proc.stdin.write("\t".join(campos) + "\n")
+            self.proc.stdin.flush()
+        except Exception as e:
+            raise ErroAssinatura(f"Assinador #{self.indice} indisponível: {e}")
+        self.pedidos += 1
+        return self._aguardar_resposta(timeout)
+
+    def _aguardar_resposta(self, timeout: float) -> str:
+        try:
+            resp = self._respostas.get(timeout=timeout)
+        except queue.Empty:
+            raise ErroAssinatura(f"Assinador #{self.indice} não respondeu em {timeout:.0f}s")
+        if resp is None:
+            raise ErroAssinatura(f"Assinador #{self.indice} encerrou inesperadamente")
+        return resp
+
+    @staticmethod
+    def _ler_stdout(proc, respostas):
+        for linha in proc.stdout:
+            respostas.put(linha.rstrip("\r\n"))
+        respostas.put(None)
+
+    def _ler_stderr(self, proc):
+        for linha in proc.stderr:
+            logger.debug("[ASSINADOR #%s] %s", self.indice, linha.rstrip())
+
+
+# -------------------- pool --------------------
+class PoolAssinadores:
+    def __init__(self, workers: int = ASSINADOR_WORKERS):
+        self.workers = max(1, workers)
+        self._processos = []
+        self._livres = queue.Queue()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._monitor = None
+
+    def _garantir_iniciado(self):
+        # pid diferente => processo filho (fork): os pipes herdados não servem
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._processos = []
+            self._livres = queue.Queue()
+            for i in range(self.workers):
+                p = _ProcessoAssinador(i)
+                p.iniciar()
+                self._processos.append(p)
+                self._livres.put(p)
+            self._pid = os.getpid()
+            self._monitor = threading.Thread(target=self._verificar_saude, daemon=True)
+            self._monitor.start()
+            logger.info("[ASSINADOR] pool iniciado com %s processo(s)", self.workers)
+
+    def assinar(self, entrada: str, saida: str, args_jsignpdf, timeout: float = ASSINADOR_TIMEOUT):
+        self._garantir_iniciado()
+        try:
+            proc = self._livres.get(timeout=timeout)
+        except queue.Empty:
+            raise ErroAssinatura("Nenhum assinador livre no pool")
+        try:
+            if not proc.vivo():
+                proc.reiniciar()
+            try:
+                resp = proc.requisitar(["SIGN", entrada, saida, *args_jsignpdf], timeout)
+            except ErroAssinatura:
+                # processo travado/morto: reinicia para o próximo pedido
+                try:
+                    proc.reiniciar()
+                except Exception as e:
+                    logger.warning("[ASSINADOR] falha ao reiniciar #%s: %s", proc.indice, e)
+                raise
+        finally:
+            self._livres.put(proc)
+        if resp != "OK":
+            raise ErroAssinatura(resp[4:] if resp.startswith("ERR ") else resp)
+
+    def assinar_lote(self, itens, args_jsignpdf, timeout: float = ASSINADOR_TIMEOUT):
+        """Assina [(entrada, saida), ...] num único SIGNBATCH; devolve a lista de erros (None = ok)."""
+        self._garantir_iniciado()
+        try:
+            proc = self._livres.get(timeout=timeout)
+        except queue.Empty:
+            raise ErroAssinatura("Nenhum assinador livre no pool")
+        campos = ["SIGNBATCH", str(len(itens))]
+        for entrada, saida in itens:
+            campos += [entrada, saida]
+        try:
+            if not proc.vivo():
+                proc.reiniciar()
+            try:
+                resp = proc.requisitar([*campos, *args_jsignpdf], timeout * len(itens))
+            except ErroAssinatura:
+                try:
+                    proc.reiniciar()
+                except Exception as e:
+                    logger.warning("[ASSINADOR] falha ao reiniciar #%s: %s", proc.indice, e)
+                raise
+        finally:
+            self._livres.put(proc)
+        partes = resp.split("\t")
+        if partes[0] != "RES" or len(partes) != len(itens) + 1:
+            # o lote inteiro falhou (ex.: certificado não abriu)
+            erro = resp[4:] if resp.startswith("ERR ") else resp
+            return [erro] * len(itens)
+        return [None if r == "OK" else (r[4:] if r.startswith("ERR ") else r) for r in partes[1:]]
+
+    def _verificar_saude(self):
+        while True:
+            time.sleep(ASSINADOR_HEALTH_INTERVALO)
+            for _ in range(len(self._processos)):
+                try:
+                    proc = self._livres.get_nowait()
+                except queue.Empty:
+                    break  # os demais estão ocupados (logo, vivos)
+                try:
+                    if not proc.vivo() or proc.requisitar(["PING"], 10) != "PONG":
+                        raise ErroAssinatura("health check falhou")
+                except Exception as e:
+                    logger.warning("[ASSINADOR] #%s sem resposta (%s); reiniciando", proc.indice, e)
+                    try:
+                        proc.reiniciar()
+                    except Exception as e2:
+                        logger.warning("[ASSINADOR] reinício #%s falhou: %s", proc.indice, e2)
+                finally:
+                    self._livres.put(proc)
+
+    def ocupacao(self):
+        """Processos do pool deste worker e quantos estão assinando agora."""
+        if self._pid != os.getpid():
+            return {"processos": 0, "ocupados": 0, "vivos": 0}
+        total = len(self._processos)
+        return {"processos": total,
+                "ocupados": max(0, total - self._livres.qsize()),
+                "vivos": sum(1 for p in self._processos if p.vivo())}
+
+    def status(self):
+        return [
+            {"indice": p.indice, "vivo": p.vivo(), "pedidos": p.pedidos, "reinicios": p.reinicios}
+            for p in self._processos
+        ]
+
+    def encerrar(self):
+        with self._lock:
+            for p in self._processos:
+                p.parar()
+            self._processos = []
+            self._livres = queue.Queue()
+            self._pid = None
+
+
+_pool = PoolAssinadores()
+
+
+def _daemon_disponivel() -> bool:
+    return (ASSINADOR_MODO == "daemon"
+            and shutil.which("java") is not None
+            and os.path.isfile(CAMINHO_JSIGNPDF)
+            and os.path.isfile(CAMINHO_DAEMON))
+
+
+def _assinar_cli(itens, args_jsignpdf):
+    """Um `java -jar` para o lote inteiro; devolve a lista de erros (None = ok)."""
+    lote_dir = Path(tempfile.mkdtemp(prefix="jsign_", dir=ASSINADOR_TMPDIR))
+    try:
+        # nomes 0.pdf, 1.pdf... no diretório do lote: entradas com o mesmo nome não colidem
+        entradas = []
+        for i, (entrada, _) in enumerate(itens):
+            link = lote_dir / f"{i}.pdf"
+            try:
+                os.symlink(os.path.abspath(entrada), link)
+            except OSError:
+                shutil.copyfile(entrada, link)
+            entradas.append(str(link))
+        cmd = [
+            "java", "-jar", CAMINHO_JSIGNPDF, *args_jsignpdf,
+            "-d", str(lote_dir), "-op", "", "-os", "_signed",
+            *entradas,
+        ]
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        erros = []
+        for i, (_, saida) in enumerate(itens):
+            gerado = lote_dir / f"{i}_signed.pdf"
+            if gerado.exists():
+                shutil.move(str(gerado), saida)
+                erros.append(None)
+            else:
+                erros.append(f"JSignPdf falhou (exit {proc.returncode}).\nSTDOUT:\n{proc.stdout}\nSTDERR:\n{proc.stderr}")
+        return erros
+    finally:
+        shutil.rmtree(lote_dir, ignore_errors=True)
+
+
+def _assinar_lote(itens, args_jsignpdf):
+    """Daemon (SIGNBATCH) e, para o que falhar nele, `java -jar`."""
+    erros = [None] * len(itens)
+    pendentes = list(range(len(itens)))
+    if _daemon_disponivel():
+        try:
+            erros = _pool.assinar_lote(itens, args_jsignpdf)
+            pendentes = [i for i, e in enumerate(erros) if e]
+        except ErroAssinatura as e:
+            logger.warning("[ASSINADOR] daemon falhou (%s); usando java -jar", e)
+        if pendentes and len(pendentes) < len(itens):
+            logger.warning("[ASSINADOR] %s de %s falharam no daemon; usando java -jar",
+                           len(pendentes), len(itens))
+    if pendentes:
+        for i, erro in zip(pendentes, _assinar_cli([itens[i] for i in pendentes], args_jsignpdf)):
+            erros[i] = erro
+    return erros
+
+
+# -------------------- fila de coalescência --------------------
+class _PedidoAssinatura:
+    __slots__ = ("entrada", "saida", "chegada", "evento", "erro")
+
+    def __init__(self, entrada, saida):
+        self.entrada = entrada
+        self.saida = saida
+        self.chegada = time.monotonic()
+        self.evento = threading.Event()
+        self.erro = None
+
+
+class FilaAssinatura:
+    """
+    Agrupa pedidos do mesmo certificado (mesmos args do JSignPdf).
+
+    Sem thread própria: quem chega primeiro num grupo vira o "líder", espera a
+    janela (ou o grupo encher), assina o lote e acorda os demais.
+    """
+
+    def __init__(self, janela_ms: float = ASSINADOR_LOTE_JANELA_MS, maximo: int = ASSINADOR_LOTE_MAX):
+        self.janela = max(0.0, janela_ms) / 1000.0
+        self.maximo = max(1, maximo)
+        self._cond = threading.Condition()
+        self._grupos = {}   # args -> [_PedidoAssinatura]
+        self._stats = {"lotes": 0, "pedidos": 0, "maior_lote": 0, "tamanhos": {},
+                       "espera_total_ms": 0.0, "espera_max_ms": 0.0, "execucao_total_ms": 0.0}
+
+    @property
+    def ativa(self) -> bool:
+        return self.janela > 0 and self.maximo > 1
+
+    def assinar(self, entrada: str, saida: str, args_jsignpdf):
+        pedido = _PedidoAssinatura(entrada, saida)
+        if not self.ativa:
+            self._executar([pedido], args_jsignpdf)
+        else:
+            chave = tuple(args_jsignpdf)
+            with self._cond:
+                grupo = self._grupos.get(chave)
+                lider = grupo is None
+                if lider:
+                    grupo = self._grupos[chave] = []
+                grupo.append(pedido)
+                if len(grupo) >= self.maximo:
+                    # cheio: o próximo pedido abre outro grupo
+                    del self._grupos[chave]
+                    self._cond.notify_all()
+                if lider:
+                    prazo = pedido.chegada + self.janela
+                    while len(grupo) < self.maximo:
+                        resta = prazo - time.monotonic()
+                        if resta <= 0:
+                            break
+                        self._cond.wait(resta)
+                    if self._grupos.get(chave) is grupo:
+                        del self._grupos[chave]
+            if lider:
+                self._executar(grupo, args_jsignpdf)
+            elif not pedido.evento.wait(ASSINADOR_TIMEOUT * self.maximo + self.janela):
+                raise ErroAssinatura("Tempo esgotado aguardando o lote de assinatura")
+        if pedido.erro:
+            raise ErroAssinatura(pedido.erro)
+
+    def _executar(self, grupo, args_jsignpdf):
+        inicio = time.monotonic()
+        esperas = [(inicio - p.chegada) * 1000 for p in grupo]
+        try:
+            erros = _assinar_lote([(p.entrada, p.saida) for p in grupo], list(args_jsignpdf))
+        except Exception as e:
+            erros = [str(e)] * len(grupo)
+        execucao = (time.monotonic() - inicio) * 1000
+        for p, erro in zip(grupo, erros):
+            p.erro = erro
+            p.evento.set()
+        n = len(grupo)
+        with self._cond:
+            st = self._stats
+            st["lotes"] += 1
+            st["pedidos"] += n
+            st["maior_lote"] = max(st["maior_lote"], n)
+            st["tamanhos"][n] = st["tamanhos"].get(n, 0) + 1
+            st["espera_total_ms"] += sum(esperas)
+            st["espera_max_ms"] = max(st["espera_max_ms"], max(esperas))
+            st["execucao_total_ms"] += execucao
+        if n > 1:
+            logger.info("[ASSINADOR] lote de %s PDFs assinado em %.0f ms", n, execucao)
+
+    def estatisticas(self):
+        with self._cond:
+            st = self._stats
+            return {
+                "janela_ms": self.janela * 1000,
+                "max_lote": self.maximo,
+                "aguardando": sum(len(g) for g in self._grupos.values()),
+                "lotes": st["lotes"],
+                "pedidos": st["pedidos"],
+                "maior_lote": st["maior_lote"],
+                "media_lote": (st["pedidos"] / st["lotes"]) if st["lotes"] else None,
+                "tamanhos": {str(k): v for k, v in sorted(st["tamanhos"].items())},
+                "espera_media_ms": (st["espera_total_ms"] / st["pedidos"]) if st["pedidos"] else None,
+                "espera_max_ms": st["espera_max_ms"],
+                "execucao_media_ms": (st["execucao_total_ms"] / st["lotes"]) if st["lotes"] else None,
+            }
+
+
+_fila = FilaAssinatura()
+
+
+# -------------------- API pública --------------------
+def assinar_pdf(caminho_entrada: str, cert_path: str, cert_senha: str, opcoes_extra=None) -> str:
+    """
+    Assina `caminho_entrada` com o PKCS12 informado e retorna o caminho do PDF
+    assinado, gravado num diretório `jsign_*` exclusivo deste pedido.
+    Use `descartar_assinado()` depois de ler o resultado.
+    """
+    entrada = Path(caminho_entrada)
+    workdir = Path(tempfile.mkdtemp(prefix="jsign_", dir=ASSINADOR_TMPDIR))
+    saida = workdir / f"{entrada.stem}_signed.pdf"
+    args = ["-kst", "PKCS12", "-ksf", cert_path, "-ksp", str(cert_senha), *(opcoes_extra or [])]
+
+    inicio = time.perf_counter()
+    try:
+        _fila.assinar(str(entrada), str(saida), args)
+        if not saida.exists():
+            raise FileNotFoundError("PDF assinado não encontrado pelo JSignPdf.")
+    except Exception:
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise
+    logger.info("[ASSINADOR] %s assinado em %.0f ms", entrada.name, (time.perf_counter() - inicio) * 1000)
+    return str(saida)
+
+
+def descartar_assinado(caminho_assinado: str):
+    """Remove o PDF assinado e o diretório `jsign_*` criado por assinar_pdf()."""
+    if not caminho_assinado:
+        return
+    pasta = os.path.dirname(caminho_assinado)
+    try:
+        if os.path.basename(pasta).startswith("jsign_"):
+            shutil.rmtree(pasta, ignore_errors=True)
+        elif os.path.exists(caminho_assinado):
+            os.remove(caminho_assinado)
+    except Exception:
+        pass
+
+
+# -------------------- backends plugáveis --------------------
+class ResultadoAssinatura:
+    def __init__(self, pdf_bytes: bytes, backend: str, tempo_ms: float):
+        self.pdf_bytes = pdf_bytes
+        self.backend = backend
+        self.tempo_ms = tempo_ms
+
+
+class BackendJSignPdf:
+    """JSignPdf (pool de daemons ou java -jar). Arquivos de trabalho em ASSINADOR_TMPDIR (tmpfs)."""
+    nome = "jsignpdf"
+
+    def assinar(self, pdf_bytes: bytes, cred) -> bytes:
+        fd, entrada = tempfile.mkstemp(suffix=".pdf", dir=ASSINADOR_TMPDIR)
+        assinado = None
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(pdf_bytes)
+            assinado = assinar_pdf(entrada, cred.cert_path, cred.senha)
+            with open(assinado, "rb") as f:
+                return f.read()
+        finally:
+            try:
+                os.remove(entrada)
+            except Exception:
+                pass
+            descartar_assinado(assinado)
+
+
+class BackendPyHanko:
+    """Assinatura PAdES em processo, direto sobre os bytes do ReportLab (sem JVM, sem arquivos).
+
+    É o caminho 100% em memória: ASSINADOR_BACKEND=pyhanko (ou por documento).
+    """
+    nome = "pyhanko"
+
+    def carregar_signer(self, cred):
+        """SimpleSigner montado uma vez por credencial (o PKCS12 não é reaberto a cada PDF)."""
+        if signers is None:
+            raise ErroAssinatura("pyHanko não está instalado")
+        signer = cred.extras.get(self.nome)
+        if signer is None:
+            signer = signers.SimpleSigner.load_pkcs12_data(
+                cred.pfx_bytes, other_certs=None, passphrase=cred.senha.encode("utf-8")
+            )
+            if signer is None:
+                raise ErroAssinatura(f"Não foi possível abrir o certificado {cred.cert_path}")
+            cred.extras[self.nome] = signer
+        return signer
+
+    def assinar(self, pdf_bytes: bytes, cred) -> bytes:
+        signer = self.carregar_signer(cred)
+        meta = signers.PdfSignatureMetadata(
+            field_name="Signature1",
+            subfilter=SigSeedSubFilter.PADES,
+            md_algorithm="sha256",
+        )
+        writer = IncrementalPdfFileWriter(io.BytesIO(pdf_bytes))
+        out = signers.sign_pdf(writer, meta, signer=signer)
+        return out.getvalue()
+
+
+BACKENDS = {
+    BackendJSignPdf.nome: BackendJSignPdf(),
+    BackendPyHanko.nome: BackendPyHanko(),
+}
+
+_tempos = {}
+_tempos_lock = threading.Lock()
+
+
+def backend_para(doc_tipo: str | None = None):
+    nome = None
+    if doc_tipo:
+        nome = os.getenv(f"ASSINADOR_BACKEND_{doc_tipo.upper()}")
+    nome = (nome or ASSINADOR_BACKEND).strip().lower()
+    if nome not in BACKENDS:
+        logger.warning("[ASSINADOR] backend desconhecido '%s'; usando jsignpdf", nome)
+        nome = BackendJSignPdf.nome
+    return BACKENDS[nome]
+
+
+def _registrar_tempo(backend: str, doc_tipo: str, ms: float, ok: bool):
+    with _tempos_lock:
+        t = _tempos.setdefault(backend, {"assinaturas": 0, "falhas": 0, "total_ms": 0.0, "min_ms": None, "max_ms": 0.0})
+        if not ok:
+            t["falhas"] += 1
+            return
+        t["assinaturas"] += 1
+        t["total_ms"] += ms
+        t["min_ms"] = ms if t["min_ms"] is None else min(t["min_ms"], ms)
+        t["max_ms"] = max(t["max_ms"], ms)
+    logger.info("[ASSINADOR] %s assinado via %s em %.0f ms", doc_tipo or "documento", backend, ms)
+
+
+def assinar_documento(pdf_bytes: bytes, cert_path: str, cert_senha: str,
+                      doc_tipo: str | None = None, medico_id=None) -> ResultadoAssinatura:
+    """
+    Assina `pdf_bytes` com o backend configurado para `doc_tipo` e mede o tempo.
+    Certificado vencido/senha errada levanta CertificadoInvalido antes de
+    qualquer backend ser acionado.
+    """
+    cred = obter_credencial(medico_id, cert_path, cert_senha)
+    backend = backend_para(doc_tipo)
+    inicio = time.perf_counter()
+    try:
+        assinado = backend.assinar(pdf_bytes, cred)
+    except Exception:
+        _registrar_tempo(backend.nome, doc_tipo, 0.0, ok=False)
+        raise
+    ms = (time.perf_counter() - inicio) * 1000
+    _registrar_tempo(backend.nome, doc_tipo, ms, ok=True)
+    return ResultadoAssinatura(assinado, backend.nome, ms)
+
+
+def estatisticas_backends():
+    with _tempos_lock:
+        out = {}
+        for nome, t in _tempos.items():
+            media = (t["total_ms"] / t["assinaturas"]) if t["assinaturas"] else None
+            out[nome] = {**t, "media_ms": media}
+        return out
+
+
+def encerrar_assinadores():
+    """Para os processos Java deste processo (saída do worker)."""
+    _pool.encerrar()
+
+
+def status_pool():
+    return {
+        "modo": ASSINADOR_MODO,
+        "backend_padrao": ASSINADOR_BACKEND,
+        "daemon_disponivel": _daemon_disponivel(),
+        "processos": _pool.status(),
+        "ocupacao": _pool.ocupacao(),
+        "fila": _fila.estatisticas(),
+        "backends": estatisticas_backends(),
+        "credenciais": estatisticas_credenciais(),
+    }
@@ -0,0 +1,217 @@
+# captura.py
+"""
+Captura opcional do tráfego real, para reproduzir depois com
+ferramentas/replay.py (benchmark com a mistura real de receitas e pedidos).
+
+- desligada por padrão; liga com CAPTURA_ARQUIVO (ex.: /srv/medicos/captura/trafego.jsonl).
+  O requests.jsonl da raiz do repositório não é aceito como destino.
+- uma linha JSON por requisição: instante de chegada (epoch), método, rota,
+  corpo anonimizado, status, tempo no servidor, tamanho da resposta e o
+  X-Documento-Id criado (o replay liga as validações aos documentos que ele
+  mesmo gerar)
+- só as rotas de CAPTURA_ROTAS (padrão: POST /api/gerar-* e GET /validar_*),
+  CAPTURA_AMOSTRA (0..1) das requisições
+- anonimização antes de gravar: nome, CPF, nascimento e id do paciente
+  viram pseudônimos estáveis (HMAC com CAPTURA_SEGREDO: o mesmo paciente continua o mesmo
+  paciente; sem segredo, um sorteado a cada subida); textos livres mantêm o
+  formato (tamanho, quebras de linha, pontuação), o que pesa no layout,
+  mas as letras viram "x" e os dígitos "0"; só os campos de CAMPOS_MANTIDOS
+  passam como vieram
+- cada linha vai num write() só, em modo append: vários workers podem
+  gravar no mesmo arquivo
+"""
+import os, re, json, hmac, hashlib, threading, time, logging
+
+from flask import request, g
+
+CAPTURA_ARQUIVO = (os.getenv("CAPTURA_ARQUIVO") or "").strip()
+CAPTURA_AMOSTRA = float(os.getenv("CAPTURA_AMOSTRA", "1"))
+CAPTURA_ROTAS = os.getenv("CAPTURA_ROTAS", r"^/(api/gerar-[\w-]+|validar_\w+/\d+)$")
+CAPTURA_SEGREDO = (os.getenv("CAPTURA_SEGREDO") or "").encode() or os.urandom(16)
+
+# o backlog do repositório, não um destino de captura
+PROIBIDO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "requests.jsonl")
+
+CAMPOS_MANTIDOS = {"medico_id", "mid", "receita_controlada", "dias_afastamento",
+                   "hora_inicio", "hora_fim", "data_declaracao", "async", "sexo"}
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------- anonimização --------------------
+def _hmac(valor) -> bytes:
+    return hmac.new(CAPTURA_SEGREDO, str(valor).encode("utf-8"), hashlib.sha256).digest()
+
+
+def mascarar_texto(texto: str) -> str:
+    """Mesmo formato, sem conteúdo: letras -> x/X, dígitos -> 0."""
+    out = []
+    for c in texto:
+        if c.isdigit():
+            out.append("0")
+        elif c.isalpha():
+            out.append("X" if c.isupper() else "x")
+        else:
+            out.append(c)
+    return "".join(out)
+
+
+def _pseudo_nome(valor):
+    return f"Paciente {_hmac(valor).hex()[:8].upper()}" if valor else valor
+
+
+def _pseudo_cpf(valor):
+    if not valor:
+        return valor
+    return f"{int.from_bytes(_hmac(valor)[:8], 'big') % 10 ** 11:011d}"
+
+
+def _pseudo_id(valor):
+    # inteiro estável (mesmo paciente, mesmo id), nunca 0: o pedido trata 0 como "sem paciente"
+    if not valor:
+        return valor
+    return int.from_bytes(_hmac(valor)[:8], "big") % 10 ** 9 + 1
+
+
+def _pseudo_nascimento(valor):
+    # só o ano sobrevive (idade aproximada, formato de data preservado)
+    m = re.search(r"(\d{4})", str(valor or ""))
+    return f"{m.group(1)}-01-01" if m else valor
+
+
+PSEUDONIMOS = {
+    "nome_paciente": _pseudo_nome,
+    "nomepaciente": _pseudo_nome,
+    "cpf_paciente": _pseudo_cpf,
+    "cpf": _pseudo_cpf,
+    "data_nascimento": _pseudo_nascimento,
+    "paciente_id": _pseudo_id,
+    "id_paciente": _pseudo_id,
+}
+
+
+def anonimizar(valor, campo=None):
+    if campo in CAMPOS_MANTIDOS:
+        return valor
+    if campo in PSEUDONIMOS and isinstance(valor, (str, int)):
+        return PSEUDONIMOS[campo](valor)
+    if isinstance(valor, dict):
+        return {k: anonimizar(v, k) for k, v in valor.items()}
+    if isinstance(valor, list):
+        return [anonimizar(v) for v in valor]
+    if isinstance(valor, str):
+        return mascarar_texto(valor)
+    return valor
+
+
+# -------------------- gravação --------------------
+class Captura:
+    def __init__(self, arquivo: str = CAPTURA_ARQUIVO, amostra: float = CAPTURA_AMOSTRA,
+                 rotas: str = CAPTURA_ROTAS):
+        self.arquivo = arquivo
+        self.amostra = max(0.0, min(1.0, amostra))
+        self.rotas = re.compile(rotas)
+        self._fd = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._contador = 0
+        self.gravadas = 0
+        self.ignoradas = 0
+        self.erros = 0
+        if arquivo and os.path.realpath(arquivo) == os.path.realpath(PROIBIDO):
+            logger.error("[CAPTURA] %s é o backlog do repositório; captura desligada", arquivo)
+            self.arquivo = ""
+
+    @property
+    def ativa(self) -> bool:
+        return bool(self.arquivo) and self.amostra > 0
+
+    def deve_capturar(self, caminho: str) -> bool:
+        if not self.ativa or not self.rotas.match(caminho):
+            return False
+        with self._lock:
+            self._contador += 1
+            # amostragem determinística: 1 a cada 1/amostra
+            escolhida = int(self._contador * self.amostra) != int((self._contador - 1) * self.amostra)
+            if not escolhida:
+                self.ignoradas += 1
+        return escolhida
+
+    def _descritor(self):
+        # um fd por processo (depois do fork do gunicorn o do mestre não serve)
+        if self._fd is None or self._pid != os.getpid():
+            pasta = os.path.dirname(os.path.abspath(self.arquivo))
+            os.makedirs(pasta, exist_ok=True)
+            self._fd = os.open(self.arquivo, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o640)
+            self._pid = os.getpid()
+        return self._fd
+
+    def gravar(self, registro: dict):
+        linha = (json.dumps(registro, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        try:
+            with self._lock:
+                os.write(self._descritor(), linha)
+                self.gravadas += 1
+        except OSError as e:
+            with self._lock:
+                self.erros += 1
+            logger.warning("[CAPTURA] falha gravando %s: %s", self.arquivo, e)
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "ativa": self.ativa,
+                "arquivo": self.arquivo or None,
+                "amostra": self.amostra,
+                "gravadas": self.gravadas,
+                "ignoradas": self.ignoradas,
+                "erros": self.erros,
+            }
+
+
+_captura = Captura()
+
+
+def _antes():
+    if not _captura.deve_capturar(request.path):
+        return
+    g.captura = {"ts": time.time(), "inicio": time.perf_counter()}
+
+
+def _depois(resp):
+    info = g.pop("captura", None)
+    if info is None:
+        return resp
+    corpo = None
+    if request.method == "POST":
+        dados = request.get_json(force=True, silent=True)
+        corpo = anonimizar(dados) if dados is not None else None
+    registro = {
+        "ts": round(info["ts"], 4),
+        "metodo": request.method,
+        "rota": request.path,
+        "query": anonimizar(request.args.to_dict()) or None,
+        "corpo": corpo,
+        "status": resp.status_code,
+        "ms": round((time.perf_counter() - info["inicio"]) * 1000, 1),
+        "bytes": resp.content_length,
+        "documento_id": resp.headers.get("X-Documento-Id"),
+        "pid": os.getpid(),
+    }
+    _captura.gravar(registro)
+    return resp
+
+
+def instalar_captura(app):
+    """Liga os hooks no app se CAPTURA_ARQUIVO estiver definido. True se ligou."""
+    if not _captura.ativa:
+        return False
+    app.before_request(_antes)
+    app.after_request(_depois)
+    logger.warning("[CAPTURA] gravando %s de %s em %s", f"{_captura.amostra:.0%}",
+                   _captura.rotas.pattern, _captura.arquivo)
+    return True
+
+
+def estatisticas_captura():
+    return _captura.estatisticas()
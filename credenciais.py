@@ -0,0 +1,176 @@
+# credenciais.py
+"""
+Cache de credenciais de assinatura (PKCS12 já aberto) por médico.
+
+Chave: (medico_id, caminho do .pfx, mtime, sha256 do arquivo). Trocar o
+arquivo gera outra chave, então o cache nunca entrega um certificado velho.
+Entradas expiram por TTL e o total é limitado (LRU).
+
+`obter_credencial()` também faz a pré-checagem (arquivo, senha, validade):
+um certificado ruim é rejeitado aqui, sem abrir JVM nenhuma. Falhas também
+ficam em cache (com o hash da senha), então repetir o erro custa um dict lookup.
+"""
+import os, hashlib, threading, time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from cryptography.hazmat.primitives.serialization import pkcs12
+
+from invalidacao import registrar_invalidador, publicar_invalidacao
+
+CRED_CACHE_MAX = int(os.getenv("CRED_CACHE_MAX", "64"))
+# por processo; outros workers: ver invalidacao.py (sem a tabela, até o TTL de atraso;
+# troca do .pfx não depende disso, o arquivo faz parte da chave)
+CRED_CACHE_TTL = float(os.getenv("CRED_CACHE_TTL", "900"))
+
+
+class CertificadoInvalido(RuntimeError):
+    pass
+
+
+class Credencial:
+    """PKCS12 aberto: chave, certificado e cadeia, prontos para os backends."""
+
+    def __init__(self, medico_id, cert_path, senha, pfx_bytes, chave, certificado, cadeia, senha_hash):
+        self.medico_id = medico_id
+        self.cert_path = cert_path
+        self.senha = senha   # o JSignPdf ainda precisa dela para abrir o .pfx
+        self.pfx_bytes = pfx_bytes
+        self.chave = chave
+        self.certificado = certificado
+        self.cadeia = cadeia
+        self.senha_hash = senha_hash
+        self.valido_ate = _valido_ate(certificado)
+        self.carregado_em = time.monotonic()
+        self.erro = None
+        self.extras = {}   # objetos derivados por backend (ex.: signer do pyHanko)
+
+    def verificar_validade(self):
+        if self.valido_ate and self.valido_ate < datetime.now(timezone.utc):
+            raise CertificadoInvalido(
+                f"Certificado de {self.cert_path} expirou em {self.valido_ate:%d/%m/%Y}"
+            )
+
+
+def _valido_ate(cert):
+    if cert is None:
+        return None
+    try:
+        return cert.not_valid_after_utc
+    except AttributeError:
+        return cert.not_valid_after.replace(tzinfo=timezone.utc)
+
+
+def _hash_senha(senha: str) -> str:
+    return hashlib.sha256(str(senha or "").encode("utf-8")).hexdigest()
+
+
+class CacheCredenciais:
+    def __init__(self, maximo: int = CRED_CACHE_MAX, ttl: float = CRED_CACHE_TTL):
+        self.maximo = max(1, maximo)
+        self.ttl = ttl
+        self._itens = OrderedDict()
+        self._digests = {}   # (path, mtime_ns, size) -> (sha256, bytes): evita reler o .pfx a cada pedido
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _digest(self, cert_path: str, st):
+        k = (cert_path, st.st_mtime_ns, st.st_size)
+        d = self._digests.get(k)
+        if d is None:
+            with open(cert_path, "rb") as f:
+                dados = f.read()
+            d = (hashlib.sha256(dados).hexdigest(), dados)
+            if len(self._digests) > self.maximo * 2:
+                self._digests.clear()
+            self._digests[k] = d
+        return d
+
+    def obter(self, medico_id, cert_path: str, senha: str) -> Credencial:
+        if not cert_path:
+            raise CertificadoInvalido("Médico sem certificado cadastrado")
+        try:
+            st = os.stat(cert_path)
+        except OSError:
+            raise CertificadoInvalido(f"Certificado não encontrado: {cert_path}")
+        sha, dados = self._digest(cert_path, st)
+        chave = (medico_id, cert_path, st.st_mtime_ns, sha)
+        senha_hash = _hash_senha(senha)
+
+        with self._lock:
+            cred = self._itens.get(chave)
+            if cred and cred.senha_hash == senha_hash and (time.monotonic() - cred.carregado_em) < self.ttl:
+                self._itens.move_to_end(chave)
+                self.hits += 1
+            else:
+                cred = None
+                self.misses += 1
+
+        if cred is None:
+            cred = self._carregar(medico_id, cert_path, dados, senha, senha_hash)
+            with self._lock:
+                self._itens[chave] = cred
+                self._itens.move_to_end(chave)
+                while len(self._itens) > self.maximo:
+                    self._itens.popitem(last=False)
+
+        if cred.erro:
+            raise CertificadoInvalido(cred.erro)
+        cred.verificar_validade()
+        return cred
+
+    @staticmethod
+    def _carregar(medico_id, cert_path, dados, senha, senha_hash) -> Credencial:
+        try:
+            key, cert, cadeia = pkcs12.load_key_and_certificates(dados, str(senha or "").encode("utf-8"))
+        except Exception:
+            cred = Credencial(medico_id, cert_path, None, None, None, None, [], senha_hash)
+            cred.erro = f"Senha incorreta ou arquivo PKCS12 inválido: {cert_path}"
+            return cred
+        cred = Credencial(medico_id, cert_path, str(senha or ""), dados, key, cert, list(cadeia or []), senha_hash)
+        if key is None or cert is None:
+            cred.erro = f"PKCS12 sem chave privada/certificado: {cert_path}"
+        return cred
+
+    def invalidar(self, medico_id=None):
+        with self._lock:
+            if medico_id is None:
+                n = len(self._itens)
+                self._itens.clear()
+                self._digests.clear()
+                return n
+            alvo = [k for k in self._itens if k[0] == medico_id]
+            for k in alvo:
+                del self._itens[k]
+            return len(alvo)
+
+    def estatisticas(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "itens": len(self._itens),
+                "maximo": self.maximo,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / total) if total else None,
+            }
+
+
+_cache = CacheCredenciais()
+registrar_invalidador("credenciais", _cache.invalidar)
+
+
+def obter_credencial(medico_id, cert_path: str, senha: str) -> Credencial:
+    """Credencial aberta (do cache quando possível). Levanta CertificadoInvalido."""
+    return _cache.obter(medico_id, cert_path, senha)
+
+
+def invalidar_credenciais(medico_id=None) -> int:
+    """Invalida neste processo e publica para os outros workers."""
+    return publicar_invalidacao("credenciais", medico_id=medico_id)
+
+
+def estatisticas_credenciais():
+    return _cache.estatisticas()
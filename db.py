@@ -0,0 +1,206 @@
+# db.py
+"""
+Pool de conexões MySQL compartilhado por todos os blueprints.
+
+`conectar()` devolve uma conexão do pool com a mesma interface do pymysql;
+`conn.close()` apenas a devolve ao pool. Assim os helpers existentes
+(`_db()`, `_db_conn()`, `cur.close(); conn.close()`) continuam iguais.
+
+- tamanho: DB_POOL_SIZE; espera máxima por uma conexão livre: DB_POOL_TIMEOUT
+- conexões ociosas há mais de DB_POOL_PING_INTERVALO segundos levam um
+  ping (com reconnect) antes de serem entregues
+- após fork (gunicorn/multiprocessing) o filho descarta as conexões herdadas
+  sem fechá-las, para não derrubar os sockets do processo pai
+"""
+import os, threading, time, logging
+import pymysql
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_PING_INTERVALO = float(os.getenv("DB_POOL_PING_INTERVALO", "30"))
+
+logger = logging.getLogger(__name__)
+
+
+class PoolEsgotado(RuntimeError):
+    pass
+
+
+def _nova_conexao():
+    return pymysql.connect(
+        host=os.getenv("DB_HOST"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASS"),
+        database=os.getenv("DB_NAME"),
+        connect_timeout=15,
+        charset="utf8mb4",
+        autocommit=True,
+    )
+
+
+class _ConexaoPool:
+    """Proxy de uma conexão pymysql; close() devolve ao pool."""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+        self._pid = os.getpid()
+
+    def __getattr__(self, nome):
+        if self._conn is None:
+            raise pymysql.err.InterfaceError(0, "Conexão já devolvida ao pool")
+        return getattr(self._conn, nome)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None and self._pid == os.getpid():
+            self._pool._devolver(conn)
+
+    def descartar(self):
+        """Fecha de verdade (ex.: conexão em estado duvidoso)."""
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool._devolver(conn, descartar=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __del__(self):
+        # helper que esqueceu o close() (ex.: exceção no meio) não vaza a vaga
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class PoolConexoes:
+    def __init__(self, tamanho: int = DB_POOL_SIZE, timeout: float = DB_POOL_TIMEOUT,
+                 fabrica=_nova_conexao):
+        self.tamanho = max(1, tamanho)
+        self.timeout = timeout
+        self._fabrica = fabrica
+        self._cond = threading.Condition()
+        self._resetar()
+
+    def _resetar(self):
+        self._pid = os.getpid()
+        self._livres = []     # [(conn, devolvida_em)]; LIFO mantém as quentes em uso
+        self._abertas = 0
+        self._stats = {
+            "checkouts": 0, "esperas": 0, "timeouts": 0,
+            "espera_total_ms": 0.0, "espera_max_ms": 0.0,
+            "criadas": 0, "descartadas": 0, "pings": 0,
+        }
+
+    def _verificar_fork(self):
+        if self._pid != os.getpid():
+            # não fecha: os sockets ainda pertencem ao processo pai
+            self._resetar()
+
+    def obter(self, timeout: float | None = None) -> _ConexaoPool:
+        timeout = self.timeout if timeout is None else timeout
+        inicio = time.monotonic()
+        esperou = False
+        with self._cond:
+            self._verificar_fork()
+            while True:
+                if self._livres:
+                    conn, devolvida_em = self._livres.pop()
+                    break
+                if self._abertas < self.tamanho:
+                    self._abertas += 1
+                    conn, devolvida_em = None, None
+                    break
+                restante = timeout - (time.monotonic() - inicio)
+                if restante <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolEsgotado(f"Nenhuma conexão livre em {timeout:.1f}s (pool={self.tamanho})")
+                esperou = True
+                self._cond.wait(restante)
+            espera_ms = (time.monotonic() - inicio) * 1000
+            self._stats["checkouts"] += 1
+            if esperou:
+                self._stats["esperas"] += 1
+            self._stats["espera_total_ms"] += espera_ms
+            self._stats["espera_max_ms"] = max(self._stats["espera_max_ms"], espera_ms)
+
+        try:
+            if conn is None:
+                conn = self._fabrica()
+                self._contar("criadas")
+            elif time.monotonic() - devolvida_em > DB_POOL_PING_INTERVALO:
+                self._contar("pings")
+                try:
+                    conn.ping(reconnect=True)
+                except Exception:
+                    self._fechar(conn)
+                    self._contar("descartadas")
+                    conn = self._fabrica()
+                    self._contar("criadas")
+        except Exception:
+            with self._cond:
+                self._abertas -= 1
+                self._cond.notify()
+            raise
+        return _ConexaoPool(self, conn)
+
+    def _devolver(self, conn, descartar: bool = False):
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            if descartar or not getattr(conn, "open", True):
+                self._abertas -= 1
+                self._stats["descartadas"] += 1
+                fechar = True
+            else:
+                self._livres.append((conn, time.monotonic()))
+                fechar = False
+            self._cond.notify()
+        if fechar:
+            self._fechar(conn)
+
+    def _contar(self, chave):
+        with self._cond:
+            self._stats[chave] += 1
+
+    @staticmethod
+    def _fechar(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def estatisticas(self):
+        with self._cond:
+            self._verificar_fork()
+            checkouts = self._stats["checkouts"]
+            return {
+                "tamanho": self.tamanho,
+                "abertas": self._abertas,
+                "livres": len(self._livres),
+                "em_uso": self._abertas - len(self._livres),
+                **self._stats,
+                "espera_media_ms": (self._stats["espera_total_ms"] / checkouts) if checkouts else 0.0,
+            }
+
+    def fechar_todas(self):
+        with self._cond:
+            livres, self._livres = self._livres, []
+            self._abertas -= len(livres)
+        for conn, _ in livres:
+            self._fechar(conn)
+
+
+pool = PoolConexoes()
+
+
+def conectar() -> _ConexaoPool:
+    """Conexão do pool compartilhado (use conn.close() para devolver)."""
+    return pool.obter()
+
+
+def estatisticas_pool():
+    return pool.estatisticas()
@@ -0,0 +1,120 @@
+# entrega.py
+"""
+Entrega dos PDFs gerados (/receitas, /atestados, /declaracoes, /files/pedidos).
+
+O Flask só resolve o arquivo (armazenamento.resolver: caminho novo, nome
+antigo ou só o hash) e decide; quem manda os bytes depende do modo:
+
+- atrás do nginx-medicos: resposta vazia com `X-Accel-Redirect` apontando
+  para uma location `internal` (nginx-medicos/default.conf), o nginx serve
+  com sendfile e cuida de Range; o worker Python fica livre na hora
+- direto (python app.py, testes): send_from_directory com conditional=True
+  (Range / If-None-Match / If-Modified-Since pelo Werkzeug)
+
+DOWNLOAD_MODO:
+  auto   (padrão) X-Accel só quando o nginx avisa com o cabeçalho
+         `X-Accel-Disponivel: 1` (proxy_set_header no default.conf)
+  nginx  sempre X-Accel
+  flask  nunca X-Accel
+
+ETag forte = SHA-256 do conteúdo: nos arquivos novos é o próprio nome; nos
+antigos é calculado uma vez e guardado (caminho, mtime, tamanho). If-None-Match
+que bate responde 304 aqui mesmo, sem passar pelo nginx. Arquivos novos
+nunca mudam (o nome é o hash) e vão com `immutable`.
+"""
+import os, hashlib, threading
+from collections import OrderedDict
+
+from flask import request, send_from_directory, current_app
+
+from armazenamento import resolver, sha_do_nome
+
+DOWNLOAD_MODO = (os.getenv("DOWNLOAD_MODO") or "auto").strip().lower()
+DOWNLOAD_ACCEL_PREFIXO = "/" + (os.getenv("DOWNLOAD_ACCEL_PREFIXO") or "/_interno").strip("/")
+DOWNLOAD_MAX_AGE = int(os.getenv("DOWNLOAD_MAX_AGE", "86400"))
+DOWNLOAD_MAX_AGE_LEGADO = int(os.getenv("DOWNLOAD_MAX_AGE_LEGADO", "300"))
+DOWNLOAD_CACHE_HASHES = int(os.getenv("DOWNLOAD_CACHE_HASHES", "4096"))
+
+_lock = threading.Lock()
+_hashes = OrderedDict()     # caminho -> (mtime_ns, tamanho, sha256) dos arquivos antigos
+_stats = {"nginx": 0, "flask": 0, "nao_modificado": 0, "nao_encontrado": 0,
+          "hash_calculado": 0, "hash_cache": 0}
+
+
+def _contar(chave):
+    with _lock:
+        _stats[chave] += 1
+
+
+def _hash_arquivo(caminho: str) -> str:
+    st = os.stat(caminho)
+    with _lock:
+        item = _hashes.get(caminho)
+        if item and item[0] == st.st_mtime_ns and item[1] == st.st_size:
+            _hashes.move_to_end(caminho)
+            _stats["hash_cache"] += 1
+            return item[2]
+    h = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloco)
+    sha = h.hexdigest()
+    with _lock:
+        _hashes[caminho] = (st.st_mtime_ns, st.st_size, sha)
+        _hashes.move_to_end(caminho)
+        while len(_hashes) > DOWNLOAD_CACHE_HASHES:
+            _hashes.popitem(last=False)
+        _stats["hash_calculado"] += 1
+    return sha
+
+
+def _usar_accel() -> bool:
+    if DOWNLOAD_MODO == "nginx":
+        return True
+    if DOWNLOAD_MODO == "flask":
+        return False
+    return request.headers.get("X-Accel-Disponivel") == "1"
+
+
+def _cache_control(imutavel: bool) -> str:
+    if imutavel:
+        return f"private, max-age={DOWNLOAD_MAX_AGE}, immutable"
+    return f"private, max-age={DOWNLOAD_MAX_AGE_LEGADO}"
+
+
+def servir_documento(pasta: str, local: str, nome: str, nao_encontrado=None):
+    """
+    Resposta de download de `nome` dentro de `pasta`.
+    `local` é o nome da location interna no nginx (receitas, atestados, ...);
+    `nao_encontrado` é o retorno da rota quando o arquivo não existe.
+    """
+    relativo = resolver(pasta, nome)
+    if not relativo:
+        _contar("nao_encontrado")
+        return nao_encontrado if nao_encontrado is not None else ("Arquivo não encontrado", 404)
+
+    sha = sha_do_nome(relativo)
+    imutavel = sha is not None
+    if not imutavel:
+        sha = _hash_arquivo(os.path.join(pasta, *relativo.split("/")))
+
+    if request.if_none_match.contains(sha):
+        _contar("nao_modificado")
+        resp = current_app.response_class(status=304)
+    elif _usar_accel():
+        _contar("nginx")
+        resp = current_app.response_class(mimetype="application/pdf")
+        resp.headers["X-Accel-Redirect"] = f"{DOWNLOAD_ACCEL_PREFIXO}/{local}/{relativo}"
+        resp.headers["Accept-Ranges"] = "bytes"
+    else:
+        _contar("flask")
+        resp = send_from_directory(pasta, relativo, mimetype="application/pdf", conditional=True, etag=sha)
+    resp.set_etag(sha)
+    resp.headers["Cache-Control"] = _cache_control(imutavel)
+    return resp
+
+
+def estatisticas_entrega():
+    with _lock:
+        return {**_stats, "modo": DOWNLOAD_MODO, "prefixo": DOWNLOAD_ACCEL_PREFIXO,
+                "hashes_em_cache": len(_hashes)}
@@ -0,0 +1,154 @@
+# esquema.py
+"""
+Retrato (snapshot) do esquema do banco e da configuração da clínica.
+
+Carregado uma vez na subida do app e recarregado a cada ESQUEMA_REFRESH
+segundos, no máximo. O caminho quente (gerar documento) só consulta este
+objeto em memória: nada de `SHOW TABLES LIKE` nem de `clinica_config`
+chave a chave por requisição.
+
+- tabelas/colunas: uma consulta em information_schema.columns
+- clinica_config: um SELECT de todas as chaves
+- se o banco estiver fora na carga, o snapshot fica "desconhecido"
+  (tem_tabela() responde True) e nova tentativa sai após ESQUEMA_RETRY s
+"""
+import os, threading, time, logging
+
+from db import conectar
+
+ESQUEMA_REFRESH = float(os.getenv("ESQUEMA_REFRESH", "600"))
+ESQUEMA_RETRY = float(os.getenv("ESQUEMA_RETRY", "30"))
+PAPEIS = ("A4", "A5")
+
+logger = logging.getLogger(__name__)
+
+
+def papel_valido(v):
+    v = (str(v or "")).strip().upper()
+    return v if v in PAPEIS else None
+
+
+def _papeis_clinica(config: dict) -> dict:
+    """{'DEFAULT_PAPER_RECEITA': 'A5', 'paper_atestado': 'a4'} -> {'RECEITA': 'A5', 'ATESTADO': 'A4'}"""
+    out, prioridade = {}, {}
+    for chave, valor in config.items():
+        chave = str(chave or "").strip().upper()
+        v = papel_valido(valor)
+        if not v:
+            continue
+        if chave.startswith("DEFAULT_PAPER_"):
+            doc, prio = chave[len("DEFAULT_PAPER_"):], 0
+        elif chave.startswith("PAPER_"):
+            doc, prio = chave[len("PAPER_"):], 1
+        else:
+            continue
+        if doc and prio <= prioridade.get(doc, 9):
+            out[doc], prioridade[doc] = v, prio
+    return out
+
+
+class EsquemaSnapshot:
+    def __init__(self, colunas=None, clinica_config=None, erro=None):
+        self.colunas = {t: frozenset(cs) for t, cs in (colunas or {}).items()}
+        self.tabelas = frozenset(self.colunas)
+        self.clinica_config = dict(clinica_config or {})
+        self.papeis_clinica = _papeis_clinica(self.clinica_config)
+        self.erro = erro
+        self.conhecido = erro is None
+        self.carregado_em = time.monotonic()
+
+    def tem_tabela(self, tabela: str) -> bool:
+        # sem snapshot válido, assume que existe (a consulta falha e cai no fallback)
+        return (tabela in self.tabelas) if self.conhecido else True
+
+    def tem_coluna(self, tabela: str, coluna: str) -> bool:
+        if not self.conhecido:
+            return False
+        return coluna in self.colunas.get(tabela, ())
+
+    def config(self, chave: str, padrao=None):
+        if chave in self.clinica_config:
+            return self.clinica_config[chave]
+        alvo = chave.upper()
+        for k, v in self.clinica_config.items():
+            if str(k).upper() == alvo:
+                return v
+        return padrao
+
+    def como_dict(self):
+        return {
+            "conhecido": self.conhecido,
+            "erro": self.erro,
+            "idade_s": round(time.monotonic() - self.carregado_em, 1),
+            "tabelas": sorted(self.tabelas),
+            "clinica_config": sorted(self.clinica_config),
+            "papeis_clinica": dict(self.papeis_clinica),
+        }
+
+
+def _carregar() -> EsquemaSnapshot:
+    conn = conectar()
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT table_name, column_name
+              FROM information_schema.columns
+             WHERE table_schema = DATABASE()
+        """)
+        colunas = {}
+        for tabela, coluna in cur.fetchall() or []:
+            colunas.setdefault(str(tabela), set()).add(str(coluna))
+        config = {}
+        if "clinica_config" in colunas:
+            cur.execute("SELECT chave, valor FROM clinica_config")
+            for chave, valor in cur.fetchall() or []:
+                if chave is not None:
+                    config[str(chave).strip()] = (str(valor).strip() if valor is not None else None)
+        cur.close()
+    finally:
+        conn.close()
+    return EsquemaSnapshot(colunas, config)
+
+
+_snapshot = None
+_lock = threading.Lock()
+_recargas = {"ok": 0, "falhas": 0}
+
+
+def recarregar_esquema(bloquear: bool = True) -> EsquemaSnapshot:
+    """Recarrega agora (startup, ou depois que o admin mexe na clínica)."""
+    global _snapshot
+    if not _lock.acquire(blocking=bloquear):
+        return _snapshot   # outra thread já está recarregando
+    try:
+        try:
+            novo = _carregar()
+            _recargas["ok"] += 1
+        except Exception as e:
+            logger.warning("Falha ao carregar esquema/clinica_config: %s", e)
+            _recargas["falhas"] += 1
+            # mantém o último snapshot bom; só agenda nova tentativa
+            if _snapshot is not None and _snapshot.conhecido:
+                _snapshot.carregado_em = time.monotonic() - ESQUEMA_REFRESH + ESQUEMA_RETRY
+                return _snapshot
+            novo = EsquemaSnapshot(erro=str(e))
+        _snapshot = novo
+        return novo
+    finally:
+        _lock.release()
+
+
+def esquema() -> EsquemaSnapshot:
+    """Snapshot atual; recarrega só quando venceu (sem bloquear quem já tem um)."""
+    snap = _snapshot
+    if snap is None:
+        return recarregar_esquema()
+    idade = time.monotonic() - snap.carregado_em
+    limite = ESQUEMA_REFRESH if snap.conhecido else ESQUEMA_RETRY
+    if idade >= limite:
+        return recarregar_esquema(bloquear=False) or snap
+    return snap
+
+
+def estatisticas_esquema():
+    return {**esquema().como_dict(), "recargas": dict(_recargas)}
@@ -0,0 +1,266 @@
+# ferramentas/bench.py
+"""
+Micro-benchmarks das etapas de render e assinatura, offline: banco e
+assinador simulados (ferramentas/simulado.py), timbrados e assinatura
+reais do repositório (papelA4/ccmA4.pdf, papelA5/A5ccm.pdf, assinaturas/).
+
+Mede, cada um isolado:
+  - desenhar_fundo_papel           (modo configurado; PNG/raster com cache quente)
+  - obter_timbrado frio            (convert_from_path; só com poppler instalado)
+  - aplicar_timbrado               (timbrado PDF como Form XObject; antigo _merge_with_bg_as_base)
+  - desenhar_texto_multilinha      (prescrição de 30 linhas)
+  - gerar_qrcode / desenhar_qrcode (PNG antigo x vetorial, mesma máscara: QR_MASCARA)
+  - desenhar_rodape_digital        (bloco QR + assinatura, desenhado antes de assinar;
+                                    substitui o merge de overlay com PyPDF2)
+  - documento completo             (Documento.preparar + produzir dos 4 tipos, A4 e A5)
+
+Cada execução é acrescentada em ferramentas/bench_resultados.jsonl com o
+commit atual; a tabela compara com a última execução de outro commit.
+
+    python ferramentas/bench.py
+    python ferramentas/bench.py --repeticoes 50 --filtro documento
+    python ferramentas/bench.py --sem-gravar
+
+Sai com código 1 se `--limite-regressao` (%) for ultrapassado em algum item.
+"""
+import os, sys, io, re, json, argparse, statistics, subprocess, time, shutil, platform
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import simulado
+
+RAIZ = simulado.RAIZ
+TIMBRADOS = {"A4": os.path.join(RAIZ, "papelA4", "ccmA4.pdf"), "A5": os.path.join(RAIZ, "papelA5", "A5ccm.pdf")}
+ASSINATURA = os.path.join(RAIZ, "assinaturas", "anderson.png")
+SAIDA_PADRAO = os.path.join(RAIZ, "ferramentas", "bench_resultados.jsonl")
+
+PRESCRICAO = "\n".join(
+    f"{i}) Medicamento de uso contínuo número {i} 500mg — tomar 1 comprimido a cada 8 horas por 7 dias"
+    for i in range(1, 31))
+
+
+class Pulado(Exception):
+    pass
+
+
+def medir(funcao, repeticoes, aquecimento=2):
+    for _ in range(aquecimento):
+        funcao()
+    amostras = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        amostras.append((time.perf_counter() - inicio) * 1000)
+    amostras.sort()
+    return {
+        "n": len(amostras),
+        "min_ms": amostras[0],
+        "p50_ms": statistics.median(amostras),
+        "media_ms": statistics.fmean(amostras),
+        "p95_ms": amostras[max(0, int(len(amostras) * 0.95) - 1)],
+        "ops_s": 1000.0 / statistics.fmean(amostras) if amostras[0] > 0 else None,
+    }
+
+
+# -------------------- casos --------------------
+def _canvas(tamanho, buf=None):
+    from reportlab.lib.pagesizes import A4, A5
+    from reportlab.pdfgen import canvas
+    ps = A5 if tamanho == "A5" else A4
+    return canvas.Canvas(buf or io.BytesIO(), pagesize=ps), ps
+
+
+def casos_isolados(amb):
+    from reportlab.lib.pagesizes import A4
+    import utils, rodape, papel_timbrado
+
+    casos = {}
+    png = amb.medicos[2].timbrados["A4"] if len(amb.medicos) > 2 else None   # médico 3: timbrado PNG
+
+    def fundo(caminho, tamanho):
+        def f():
+            pdf, (w, h) = _canvas(tamanho)
+            utils.desenhar_fundo_papel(pdf, caminho, w, h)
+        return f
+
+    for tam, caminho in TIMBRADOS.items():
+        casos[f"desenhar_fundo_papel[pdf {tam}]"] = fundo(caminho, tam)
+    if png:
+        casos["desenhar_fundo_papel[png A4, cache quente]"] = fundo(png, "A4")
+
+    def timbrado_frio():
+        if not shutil.which("pdftoppm"):
+            raise Pulado("poppler (pdftoppm) não instalado")
+        utils._rasterizar_timbrado(TIMBRADOS["A4"], A4[0], A4[1], utils.TIMBRADO_DPI)
+    casos["obter_timbrado[pdf A4, frio: convert_from_path]"] = timbrado_frio
+
+    conteudo = {}
+    for tam in TIMBRADOS:
+        buf = io.BytesIO()
+        pdf, _ = _canvas(tam, buf)
+        pdf.drawString(50, 500, "conteúdo")
+        pdf.save()
+        conteudo[tam] = buf.getvalue()
+
+    def timbrar(tam):
+        def f():
+            if not papel_timbrado.TIMBRADO_VETORIAL:
+                raise Pulado("TIMBRADO_MODO=raster")
+            papel_timbrado.aplicar_timbrado(conteudo[tam], TIMBRADOS[tam])
+        return f
+    for tam in TIMBRADOS:
+        casos[f"aplicar_timbrado[{tam}]"] = timbrar(tam)
+
+    def texto():
+        pdf, (w, _) = _canvas("A4")
+        pdf.setFont("Helvetica", 11)
+        utils.desenhar_texto_multilinha(pdf, PRESCRICAO, 50, 700, w - 100, fontsize=11, leading=15)
+    casos["desenhar_texto_multilinha[30 linhas]"] = texto
+
+    url = "https://api-medicos.exemplo/validar_receita/123456"
+    casos["gerar_qrcode[png]"] = lambda: utils.gerar_qrcode(url)
+
+    def qr_vetorial():
+        pdf, _ = _canvas("A4")
+        utils.desenhar_qrcode(pdf, url, 50, 90, rodape.QR_SIZE)
+    casos["desenhar_qrcode[vetorial]"] = qr_vetorial
+
+    def bloco(tam):
+        def f():
+            pdf, (w, _) = _canvas(tam)
+            rodape.desenhar_rodape_digital(pdf, w, url, 1, "RECEITA", tam,
+                                           "Dr. Benchmark", "CRM-SP 123456", ASSINATURA)
+        return f
+    for tam in TIMBRADOS:
+        casos[f"desenhar_rodape_digital[{tam}]"] = bloco(tam)
+    return casos
+
+
+def _payload(doc, medico_id, seq):
+    p = {"medico_id": medico_id, "nome_paciente": f"Paciente Bench {seq}", "cpf_paciente": f"{seq:011d}",
+         "data_nascimento": "1980-05-17", "sexo": "F"}
+    if doc == "RECEITA":
+        p["receita_texto"] = PRESCRICAO
+    elif doc == "ATESTADO":
+        p.update(cid="J11", dias_afastamento=2)
+    elif doc == "DECLARACAO":
+        p.update(hora_inicio="08:00", hora_fim="09:30")
+    else:
+        p["lista_exames"] = ["Hemograma completo", "TSH", "Glicemia de jejum", "Creatinina", "Ureia"]
+    return p
+
+
+def casos_documentos(amb):
+    from receita import RECEITA
+    from atestado import ATESTADO
+    from declaracao import DECLARACAO
+    from pedido_medicos import PEDIDO_EXAMES
+
+    casos = {}
+    seq = iter(range(10 ** 6, 10 ** 7))
+    for medico in amb.medicos[:2]:            # médico 1: A5, médico 2: A4 (simulado.papel_medico)
+        for documento in (RECEITA, ATESTADO, DECLARACAO, PEDIDO_EXAMES):
+            def f(documento=documento, medico=medico):
+                ctx, erro = documento.preparar(_payload(documento.doc_tipo, medico.id, next(seq)))
+                if erro:
+                    raise RuntimeError(erro)
+                ctx["base_url"] = "http://bench"
+                documento.produzir(ctx)
+            casos[f"documento[{documento.doc_tipo} {medico.papel}]"] = f
+    return casos
+
+
+# -------------------- resultados --------------------
+def _commit():
+    try:
+        sha = subprocess.run(["git", "-C", RAIZ, "rev-parse", "--short", "HEAD"],
+                             capture_output=True, text=True, timeout=10).stdout.strip()
+        sujo = subprocess.run(["git", "-C", RAIZ, "status", "--porcelain", "--untracked-files=no"],
+                              capture_output=True, text=True, timeout=10).stdout.strip()
+        return (sha + "+" if sujo else sha) or None
+    except Exception:
+        return None
+
+
+def _anterior(caminho, commit):
+    """Última execução gravada de um commit diferente do atual."""
+    if not os.path.isfile(caminho):
+        return None
+    ultima = None
+    with open(caminho, encoding="utf-8") as f:
+        for linha in f:
+            try:
+                ex = json.loads(linha)
+            except ValueError:
+                continue
+            if ex.get("commit") != commit:
+                ultima = ex
+    return ultima
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--repeticoes", type=int, default=30)
+    ap.add_argument("--repeticoes-documento", type=int, default=10)
+    ap.add_argument("--filtro", help="regex no nome do item")
+    ap.add_argument("--latencia-assinatura-ms", type=float, default=0.0,
+                    help="assinador simulado (0 = mede só o nosso lado)")
+    ap.add_argument("--saida", default=SAIDA_PADRAO)
+    ap.add_argument("--sem-gravar", action="store_true")
+    ap.add_argument("--limite-regressao", type=float, help="%% acima do p50 anterior que conta como regressão")
+    args = ap.parse_args()
+
+    amb = simulado.preparar_ambiente(medicos=3, latencia_assinatura_ms=args.latencia_assinatura_ms)
+    for m in amb.medicos[:2]:
+        # os dois primeiros médicos usam os arquivos reais do repositório
+        m.timbrados = dict(TIMBRADOS)
+        m.assinatura = ASSINATURA
+    import logging
+    logging.disable(logging.INFO)
+
+    casos = [(nome, f, args.repeticoes) for nome, f in casos_isolados(amb).items()]
+    casos += [(nome, f, args.repeticoes_documento) for nome, f in casos_documentos(amb).items()]
+    if args.filtro:
+        casos = [c for c in casos if re.search(args.filtro, c[0])]
+
+    commit = _commit()
+    anterior = _anterior(args.saida, commit)
+    base = (anterior or {}).get("resultados", {})
+    print(f"commit {commit or '?'}" + (f" (comparando com {anterior['commit']} de {anterior['quando']})"
+                                        if anterior else ""))
+    print(f"{'item':<52} {'p50 ms':>9} {'p95 ms':>9} {'ops/s':>9} {'Δ p50':>8}")
+
+    resultados, regressoes = {}, []
+    for nome, funcao, rep in casos:
+        try:
+            r = medir(funcao, rep)
+        except Pulado as e:
+            print(f"{nome:<52} {'pulado: ' + str(e)}")
+            continue
+        resultados[nome] = r
+        delta = ""
+        if nome in base and base[nome]["p50_ms"]:
+            pct = (r["p50_ms"] / base[nome]["p50_ms"] - 1) * 100
+            delta = f"{pct:+.0f}%"
+            if args.limite_regressao is not None and pct > args.limite_regressao:
+                regressoes.append((nome, pct))
+        print(f"{nome:<52} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['ops_s'] or 0:>9.0f} {delta:>8}")
+
+    if not args.sem_gravar:
+        os.makedirs(os.path.dirname(os.path.abspath(args.saida)), exist_ok=True)
+        with open(args.saida, "a", encoding="utf-8") as f:
+            f.write(json.dumps({
+                "commit": commit, "quando": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(), "maquina": platform.node(),
+                "resultados": resultados,
+            }, ensure_ascii=False) + "\n")
+        print(f"gravado em {args.saida}")
+    shutil.rmtree(amb.pasta, ignore_errors=True)
+
+    for nome, pct in regressoes:
+        print(f"REGRESSÃO: {nome} {pct:+.0f}%")
+    return 1 if regressoes else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
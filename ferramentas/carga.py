@@ -0,0 +1,346 @@
+# ferramentas/carga.py
+"""
+Teste de carga ponta a ponta, offline: quantos documentos por segundo um
+container do api-medicos gera e assina.
+
+Para cada configuração WORKERSxTHREADS sobe um gunicorn de verdade
+(gunicorn.conf.py do repositório: gthread, preload, aquecimento) com banco
+e assinador simulados (ferramentas/simulado.py; o banco fica num processo
+à parte, compartilhado pelos workers). Os clientes fazem HTTP de verdade
+numa mistura de POST /api/gerar-* e GET /validar_* dos documentos já
+criados, por `--duracao` segundos em cada nível de clientes. Sai a curva
+vazão x latência (p50/p95/p99) por configuração.
+
+    python ferramentas/carga.py
+    python ferramentas/carga.py --configuracoes 1x4,2x4,4x4,4x8 --clientes 8,32 --duracao 30
+    python ferramentas/carga.py --mix receita=50,pedido=30,validar=20 --latencia-assinatura-ms 150
+
+O servidor (`carga.py servir ...`) também roda sozinho, para apontar outra
+ferramenta para ele.
+"""
+import os, sys, json, random, signal, socket, statistics, subprocess, tempfile, threading, time, argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import simulado
+
+RAIZ = simulado.RAIZ
+
+ENDPOINTS = {
+    "receita": ("RECEITA", "/api/gerar-receita"),
+    "atestado": ("ATESTADO", "/api/gerar-atestado"),
+    "declaracao": ("DECLARACAO", "/api/gerar-declaracao"),
+    "pedido": ("PEDIDO_EXAMES", "/api/gerar-pedido-exames"),
+}
+VALIDACAO = {
+    "RECEITA": "/validar_receita/{id}",
+    "ATESTADO": "/validar_atestado/{id}",
+    "DECLARACAO": "/validar_declaracao/{id}",
+    "PEDIDO_EXAMES": "/validar_pedido_exame/{id}?mid={medico}",
+}
+MIX_PADRAO = "receita=40,atestado=15,declaracao=5,pedido=20,validar=20"
+
+MEDICAMENTOS = ["Dipirona 1g", "Amoxicilina 500mg", "Losartana 50mg", "Metformina 850mg",
+                "Omeprazol 20mg", "Sertralina 50mg", "Clonazepam 2mg", "Ibuprofeno 600mg"]
+EXAMES = ["Hemograma completo", "TSH", "T4 livre", "Glicemia de jejum", "Hemoglobina glicada",
+          "Creatinina", "Ureia", "Colesterol total e frações", "Triglicerídeos", "TGO", "TGP",
+          "Vitamina D", "Vitamina B12", "Ferritina", "EAS", "Urocultura"]
+
+
+# -------------------- servidor --------------------
+def servir(argv):
+    ap = argparse.ArgumentParser(prog="carga.py servir")
+    ap.add_argument("--porta", type=int, required=True)
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--threads", type=int, default=4)
+    ap.add_argument("--medicos", type=int, default=12)
+    ap.add_argument("--latencia-assinatura-ms", type=float, default=80.0)
+    ap.add_argument("--latencia-db-ms", type=float, default=1.0)
+    ap.add_argument("--pasta")
+    args = ap.parse_args(argv)
+
+    # o varredor de temporários olha também a pasta do código: no checkout
+    # de desenvolvimento não é para ele apagar nada
+    os.environ.setdefault("LIMPEZA_INTERVALO", "0")
+    amb = simulado.preparar_ambiente(medicos=args.medicos,
+                                     latencia_assinatura_ms=args.latencia_assinatura_ms,
+                                     latencia_db_ms=args.latencia_db_ms, pasta=args.pasta)
+    simulado.compartilhar_banco(amb)
+    import logging
+    logging.disable(logging.INFO)
+
+    from gunicorn.app.base import Application
+
+    class Servidor(Application):
+        def init(self, parser, opts, args):
+            return None
+
+        def load_config(self):
+            # mesma configuração da produção, só trocando endereço, tamanho e logs
+            self.load_config_from_file(os.path.join(RAIZ, "gunicorn.conf.py"))
+            for chave, valor in {"bind": f"127.0.0.1:{args.porta}", "workers": args.workers,
+                                 "threads": args.threads, "accesslog": None, "loglevel": "warning",
+                                 "max_requests": 0}.items():
+                self.cfg.set(chave, valor)
+
+        def load(self):
+            import app
+            return app.app
+
+    Servidor().run()
+
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Instancia:
+    """Um `carga.py servir` em subprocesso (grupo próprio, para derrubar mestre, workers e banco juntos)."""
+
+    def __init__(self, workers, threads, args):
+        self.porta = _porta_livre()
+        self.url = f"http://127.0.0.1:{self.porta}"
+        self.log = tempfile.NamedTemporaryFile(prefix=f"carga_{workers}x{threads}_", suffix=".log", delete=False)
+        cmd = [sys.executable, os.path.abspath(__file__), "servir", "--porta", str(self.porta),
+               "--workers", str(workers), "--threads", str(threads), "--medicos", str(args.medicos),
+               "--latencia-assinatura-ms", str(args.latencia_assinatura_ms),
+               "--latencia-db-ms", str(args.latencia_db_ms)]
+        self.proc = subprocess.Popen(cmd, stdout=self.log, stderr=subprocess.STDOUT, start_new_session=True)
+
+    def aguardar(self, sessao, limite=180):
+        fim = time.monotonic() + limite
+        while time.monotonic() < fim:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"servidor saiu com código {self.proc.returncode} (log: {self.log.name})")
+            try:
+                if sessao.get(self.url + "/api/pipeline", timeout=2).status_code == 200:
+                    return
+            except Exception:
+                pass
+            time.sleep(0.5)
+        raise RuntimeError(f"servidor não respondeu em {limite}s (log: {self.log.name})")
+
+    def parar(self):
+        try:
+            os.killpg(self.proc.pid, signal.SIGTERM)
+            self.proc.wait(timeout=40)
+        except subprocess.TimeoutExpired:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+            self.proc.wait()
+        except ProcessLookupError:
+            pass
+
+
+# -------------------- clientes --------------------
+def ler_mix(texto):
+    mix = {}
+    for parte in texto.split(","):
+        nome, _, peso = parte.partition("=")
+        nome = nome.strip()
+        if nome not in ENDPOINTS and nome != "validar":
+            raise SystemExit(f"mix: tipo desconhecido '{nome}' (use {', '.join(ENDPOINTS)}, validar)")
+        mix[nome] = float(peso or 1)
+    return mix
+
+
+def _payload(doc, medico_id, rnd, seq):
+    p = {"medico_id": medico_id, "nome_paciente": f"Paciente Carga {seq:06d}",
+         "cpf_paciente": f"{rnd.randrange(10 ** 10, 10 ** 11):011d}",
+         "data_nascimento": f"{rnd.randint(1940, 2015)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}",
+         "sexo": rnd.choice("FM")}
+    if doc == "RECEITA":
+        itens = rnd.sample(MEDICAMENTOS, rnd.randint(1, 5))
+        p["receita_texto"] = "\n".join(f"{i}) {m} — 1 comprimido de 8/8h por {rnd.randint(3, 30)} dias"
+                                       for i, m in enumerate(itens, 1))
+        p["receita_controlada"] = rnd.random() < 0.15
+    elif doc == "ATESTADO":
+        p.update(cid=rnd.choice(["J11", "A09", "M54.5", "J06.9"]), dias_afastamento=rnd.randint(1, 5))
+    elif doc == "DECLARACAO":
+        p.update(hora_inicio="08:00", hora_fim="09:30")
+    else:
+        p["lista_exames"] = rnd.sample(EXAMES, rnd.randint(2, 12))
+    return p
+
+
+class Carga:
+    def __init__(self, url, mix, medicos, semente):
+        self.url = url
+        self.tipos = list(mix)
+        self.pesos = [mix[t] for t in self.tipos]
+        self.medicos = medicos
+        self.semente = semente
+        self.criados = []                   # (doc_tipo, id, medico_id) para as validações
+        self.amostras = []                  # (tipo, ok, ms, fim)
+        self._lock = threading.Lock()
+        self._seq = iter(range(1, 10 ** 9))
+
+    def _requisicao(self, sessao, rnd):
+        tipo = rnd.choices(self.tipos, self.pesos)[0]
+        with self._lock:
+            alvo = rnd.choice(self.criados) if tipo == "validar" and self.criados else None
+            seq = next(self._seq)
+        if tipo == "validar" and alvo is None:
+            tipo = rnd.choice([t for t in self.tipos if t != "validar"] or list(ENDPOINTS))
+        inicio = time.perf_counter()
+        try:
+            if tipo == "validar":
+                doc, doc_id, medico_id = alvo
+                r = sessao.get(self.url + VALIDACAO[doc].format(id=doc_id, medico=medico_id), timeout=120)
+                ok = r.status_code == 200
+            else:
+                doc, rota = ENDPOINTS[tipo]
+                medico_id = rnd.randint(1, self.medicos)
+                r = sessao.post(self.url + rota, json=_payload(doc, medico_id, rnd, seq), timeout=120)
+                ok = r.status_code == 200
+                if ok and r.headers.get("X-Documento-Id"):
+                    with self._lock:
+                        self.criados.append((doc, int(r.headers["X-Documento-Id"]), medico_id))
+        except Exception:
+            ok = False
+        fim = time.perf_counter()
+        with self._lock:
+            self.amostras.append((tipo, ok, (fim - inicio) * 1000, fim))
+
+    def rodar(self, clientes, duracao, aquecimento):
+        import requests
+        inicio = time.perf_counter()
+        parar = inicio + aquecimento + duracao
+
+        def cliente(n):
+            rnd = random.Random(self.semente * 1000 + n)
+            with requests.Session() as sessao:
+                while time.perf_counter() < parar:
+                    self._requisicao(sessao, rnd)
+
+        with self._lock:
+            self.amostras = []
+        threads = [threading.Thread(target=cliente, args=(n,), daemon=True) for n in range(clientes)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # só conta o que terminou dentro da janela medida
+        janela = [a for a in self.amostras if inicio + aquecimento <= a[3] <= parar]
+        return resumir(janela, duracao)
+
+
+def _percentil(valores, p):
+    if not valores:
+        return None
+    return valores[min(len(valores) - 1, max(0, int(round(len(valores) * p / 100.0)) - 1))]
+
+
+def _estatisticas(latencias):
+    latencias = sorted(latencias)
+    return {
+        "n": len(latencias),
+        "p50_ms": statistics.median(latencias) if latencias else None,
+        "p95_ms": _percentil(latencias, 95),
+        "p99_ms": _percentil(latencias, 99),
+    }
+
+
+def resumir(amostras, duracao):
+    geracao = [a for a in amostras if a[0] != "validar"]
+    validacao = [a for a in amostras if a[0] == "validar"]
+    r = {
+        "requisicoes": len(amostras),
+        "erros": sum(1 for a in amostras if not a[1]),
+        "req_s": len(amostras) / duracao,
+        "docs_s": sum(1 for a in geracao if a[1]) / duracao,
+        "geracao": _estatisticas([a[2] for a in geracao if a[1]]),
+        "validacao": _estatisticas([a[2] for a in validacao if a[1]]),
+        "por_tipo": {},
+    }
+    for tipo in sorted({a[0] for a in amostras}):
+        r["por_tipo"][tipo] = _estatisticas([a[2] for a in amostras if a[0] == tipo and a[1]])
+    return r
+
+
+# -------------------- relatório --------------------
+def _ms(v):
+    return f"{v:>7.0f}" if v is not None else f"{'-':>7}"
+
+
+def imprimir_cabecalho():
+    print(f"{'config':>7} {'clien':>5} {'req/s':>7} {'docs/s':>7} "
+          f"{'ger p50':>7} {'p95':>7} {'p99':>7}  {'val p50':>7} {'p95':>7} {'p99':>7} {'erros':>6}")
+
+
+def imprimir_linha(config, clientes, r):
+    g, v = r["geracao"], r["validacao"]
+    print(f"{config:>7} {clientes:>5} {r['req_s']:>7.1f} {r['docs_s']:>7.1f} "
+          f"{_ms(g['p50_ms'])} {_ms(g['p95_ms'])} {_ms(g['p99_ms'])}  "
+          f"{_ms(v['p50_ms'])} {_ms(v['p95_ms'])} {_ms(v['p99_ms'])} {r['erros']:>6}")
+
+
+def ler_configuracoes(texto):
+    configs = []
+    for parte in texto.split(","):
+        w, _, t = parte.strip().lower().partition("x")
+        configs.append((int(w), int(t or 4)))
+    return configs
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "servir":
+        return servir(sys.argv[2:])
+
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--configuracoes", default="1x4,2x4,4x4", help="WORKERSxTHREADS separados por vírgula")
+    ap.add_argument("--clientes", default=None,
+                    help="níveis de clientes simultâneos (padrão: 1x e 2x workers*threads)")
+    ap.add_argument("--duracao", type=float, default=20.0, help="segundos medidos por nível")
+    ap.add_argument("--aquecimento", type=float, default=3.0, help="segundos descartados no início de cada nível")
+    ap.add_argument("--mix", default=MIX_PADRAO)
+    ap.add_argument("--medicos", type=int, default=12)
+    ap.add_argument("--latencia-assinatura-ms", type=float, default=80.0)
+    ap.add_argument("--latencia-db-ms", type=float, default=1.0)
+    ap.add_argument("--semente", type=int, default=1)
+    ap.add_argument("--saida", help="grava a curva em JSON")
+    ap.add_argument("--detalhar", action="store_true", help="latência por tipo de requisição")
+    args = ap.parse_args()
+
+    import requests
+    mix = ler_mix(args.mix)
+    print(f"mix {args.mix} | assinatura {args.latencia_assinatura_ms:.0f} ms | banco {args.latencia_db_ms:.0f} ms"
+          f" | {args.duracao:.0f}s por nível | CPUs {os.cpu_count()}")
+    imprimir_cabecalho()
+
+    curva, falhou = [], False
+    for workers, threads in ler_configuracoes(args.configuracoes):
+        config = f"{workers}x{threads}"
+        niveis = ([int(x) for x in args.clientes.split(",") if x.strip()] if args.clientes
+                  else sorted({workers * threads, workers * threads * 2}))
+        inst = Instancia(workers, threads, args)
+        try:
+            with requests.Session() as sessao:
+                inst.aguardar(sessao)
+            carga = Carga(inst.url, mix, args.medicos, args.semente)
+            for clientes in niveis:
+                r = carga.rodar(clientes, args.duracao, args.aquecimento)
+                imprimir_linha(config, clientes, r)
+                if args.detalhar:
+                    for tipo, e in r["por_tipo"].items():
+                        print(f"{'':>14} {tipo:<11} n={e['n']:<6} p50 {_ms(e['p50_ms'])} "
+                              f"p95 {_ms(e['p95_ms'])} p99 {_ms(e['p99_ms'])}")
+                curva.append({"workers": workers, "threads": threads, "clientes": clientes, **r})
+                falhou = falhou or r["erros"] > 0
+        except RuntimeError as e:
+            print(f"{config:>7} ! {e}")
+            falhou = True
+        finally:
+            inst.parar()
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump({"mix": mix, "latencia_assinatura_ms": args.latencia_assinatura_ms,
+                       "latencia_db_ms": args.latencia_db_ms, "duracao_s": args.duracao,
+                       "cpus": os.cpu_count(), "curva": curva}, f, ensure_ascii=False, indent=2)
+        print(f"curva gravada em {args.saida}")
+    return 1 if falhou else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
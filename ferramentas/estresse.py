@@ -0,0 +1,122 @@
+# ferramentas/estresse.py
+"""
+Teste de estresse: muitas gerações simultâneas, médicos diferentes, os 4
+endpoints, com banco e assinador simulados (ferramentas/simulado.py).
+
+Para cada PDF gerado confere se o paciente, a assinatura-imagem e o
+timbrado são os do pedido, e se nada de outro médico vazou para ele
+(o risco dos antigos arquivos temporários de nome fixo). Ao final mostra
+a vazão por nível de concorrência.
+
+    python ferramentas/estresse.py
+    python ferramentas/estresse.py --niveis 1,16,64 --requisicoes 400 --medicos 20
+
+Sai com código 1 se algum documento vier errado ou falhar.
+"""
+import os, sys, argparse, random, statistics, time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import simulado
+
+ENDPOINTS = {
+    "RECEITA": "/api/gerar-receita",
+    "ATESTADO": "/api/gerar-atestado",
+    "DECLARACAO": "/api/gerar-declaracao",
+    "PEDIDO_EXAMES": "/api/gerar-pedido-exames",
+}
+
+
+def _payload(doc, medico, paciente, cpf):
+    p = {"medico_id": medico.id, "nome_paciente": paciente, "cpf_paciente": cpf,
+         "data_nascimento": "1980-05-17", "sexo": "F"}
+    if doc == "RECEITA":
+        p["receita_texto"] = f"Uso contínuo para {paciente}\nDipirona 1g de 6/6h"
+    elif doc == "ATESTADO":
+        p.update(cid="J11", dias_afastamento=2)
+    elif doc == "DECLARACAO":
+        p.update(hora_inicio="08:00", hora_fim="09:30")
+    else:
+        p["lista_exames"] = ["Hemograma completo", "TSH", "Glicemia de jejum"]
+    return p
+
+
+def _executar(app, amb, doc, medico, seq):
+    paciente = f"Paciente {doc[:3]} {seq:05d} M{medico.id:02d}"
+    cpf = f"{seq:011d}"
+    cliente = app.test_client()
+    inicio = time.perf_counter()
+    r = cliente.post(ENDPOINTS[doc], json=_payload(doc, medico, paciente, cpf))
+    ms = (time.perf_counter() - inicio) * 1000
+    if r.status_code != 200:
+        return ms, [f"HTTP {r.status_code}: {r.get_data(as_text=True)[:200]}"]
+    if r.mimetype == "application/pdf":
+        pdf = r.data
+    else:
+        caminho = (r.get_json() or {}).get("caminho")
+        if not caminho or not os.path.isfile(caminho):
+            return ms, [f"arquivo não encontrado: {caminho}"]
+        with open(caminho, "rb") as f:
+            pdf = f.read()
+    return ms, simulado.conferir_pdf(pdf, medico, paciente, amb.medicos)
+
+
+def rodar_nivel(app, amb, concorrencia, total, semente):
+    rnd = random.Random(semente)
+    tarefas = [(rnd.choice(list(ENDPOINTS)), rnd.choice(amb.medicos), semente * 100000 + i)
+               for i in range(total)]
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as ex:
+        resultados = list(ex.map(lambda t: (t, _executar(app, amb, *t)), tarefas))
+    duracao = time.perf_counter() - inicio
+
+    latencias = sorted(ms for _, (ms, _) in resultados)
+    erros = [(t, p) for t, (_, p) in resultados if p]
+    return {
+        "concorrencia": concorrencia,
+        "requisicoes": total,
+        "erros": len(erros),
+        "duracao_s": duracao,
+        "req_s": total / duracao if duracao else 0.0,
+        "p50_ms": statistics.median(latencias),
+        "p95_ms": latencias[int(len(latencias) * 0.95) - 1] if latencias else 0.0,
+        "max_ms": latencias[-1] if latencias else 0.0,
+        "amostra_erros": erros[:5],
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--niveis", default="1,8,32,64", help="níveis de concorrência (threads)")
+    ap.add_argument("--requisicoes", type=int, default=200, help="requisições por nível")
+    ap.add_argument("--medicos", type=int, default=12)
+    ap.add_argument("--latencia-assinatura-ms", type=float, default=20.0)
+    ap.add_argument("--latencia-db-ms", type=float, default=0.0)
+    ap.add_argument("--pasta", help="pasta de trabalho (padrão: temporária)")
+    args = ap.parse_args()
+
+    amb = simulado.preparar_ambiente(medicos=args.medicos,
+                                     latencia_assinatura_ms=args.latencia_assinatura_ms,
+                                     latencia_db_ms=args.latencia_db_ms, pasta=args.pasta)
+    import logging
+    logging.disable(logging.INFO)
+    import app as aplicacao
+    app = aplicacao.app
+
+    print(f"pasta de trabalho: {amb.pasta}")
+    print(f"{'conc':>5} {'req':>6} {'erros':>6} {'tempo s':>8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    falhou = False
+    for n, nivel in enumerate(int(x) for x in args.niveis.split(",") if x.strip()):
+        r = rodar_nivel(app, amb, nivel, args.requisicoes, semente=n + 1)
+        print(f"{r['concorrencia']:>5} {r['requisicoes']:>6} {r['erros']:>6} {r['duracao_s']:>8.2f} "
+              f"{r['req_s']:>8.1f} {r['p50_ms']:>8.0f} {r['p95_ms']:>8.0f} {r['max_ms']:>8.0f}")
+        for (doc, medico, seq), problemas in r["amostra_erros"]:
+            print(f"      ! {doc} médico {medico.id} seq {seq}: {'; '.join(problemas)}")
+        falhou = falhou or r["erros"] > 0
+    print(f"assinaturas simuladas: {amb.assinador.assinaturas}, consultas ao banco: {amb.banco.consultas}")
+    print("FALHOU" if falhou else "OK: todos os documentos com paciente, timbrado e assinatura corretos")
+    return 1 if falhou else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+# ferramentas/migrar.py
+"""
+Aplica as migrações de migracoes/*.sql no banco do app (DB_HOST, DB_USER,
+DB_PASS, DB_NAME, os mesmos do db.py), em ordem de nome.
+
+- as aplicadas ficam na tabela `migracoes` (nome, aplicada_em); rodar de
+  novo só aplica as que faltam
+- um comando por `;` no fim da linha; linhas `--` são comentário
+- coluna/tabela/índice que já existe (ALTER feito à mão antes) não é erro:
+  o comando é pulado e a migração marcada como aplicada
+
+    python ferramentas/migrar.py              # aplica as pendentes
+    python ferramentas/migrar.py --listar     # só mostra o estado
+
+Sai com código 1 se alguma migração falhar (as seguintes não rodam).
+"""
+import os, sys, glob, argparse
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+PASTA = os.path.join(RAIZ, "migracoes")
+
+# 1050 tabela já existe, 1060 coluna duplicada, 1061 índice duplicado
+ERROS_JA_APLICADO = {1050, 1060, 1061}
+
+
+def comandos(caminho):
+    atual, saida = [], []
+    with open(caminho, encoding="utf-8") as f:
+        for linha in f:
+            if linha.strip().startswith("--"):
+                continue
+            atual.append(linha)
+            if linha.rstrip().endswith(";"):
+                sql = "".join(atual).strip().rstrip(";").strip()
+                if sql:
+                    saida.append(sql)
+                atual = []
+    resto = "".join(atual).strip()
+    if resto:
+        saida.append(resto)
+    return saida
+
+
+def pendentes(aplicadas):
+    arquivos = sorted(glob.glob(os.path.join(PASTA, "*.sql")))
+    return [a for a in arquivos if os.path.basename(a) not in aplicadas]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--listar", action="store_true")
+    args = ap.parse_args()
+
+    import pymysql
+    from db import conectar
+
+    conn = conectar()
+    cur = conn.cursor()
+    try:
+        cur.execute("CREATE TABLE IF NOT EXISTS migracoes ("
+                    " nome VARCHAR(190) NOT NULL PRIMARY KEY,"
+                    " aplicada_em DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP)")
+        cur.execute("SELECT nome FROM migracoes")
+        aplicadas = {r[0] for r in cur.fetchall()}
+
+        if args.listar:
+            for a in sorted(glob.glob(os.path.join(PASTA, "*.sql"))):
+                nome = os.path.basename(a)
+                print(f"{'aplicada ' if nome in aplicadas else 'pendente '} {nome}")
+            return 0
+
+        for arquivo in pendentes(aplicadas):
+            nome = os.path.basename(arquivo)
+            for sql in comandos(arquivo):
+                try:
+                    cur.execute(sql)
+                except pymysql.err.MySQLError as e:
+                    codigo = e.args[0] if e.args else None
+                    if codigo in ERROS_JA_APLICADO:
+                        print(f"  {nome}: já aplicado ({e.args[1] if len(e.args) > 1 else codigo})")
+                        continue
+                    print(f"FALHOU {nome}: {e}")
+                    return 1
+            cur.execute("INSERT INTO migracoes (nome) VALUES (%s)", (nome,))
+            print(f"aplicada  {nome}")
+        return 0
+    finally:
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
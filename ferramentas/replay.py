@@ -0,0 +1,280 @@
+# ferramentas/replay.py
+"""
+Reproduz uma captura de tráfego (captura.py, CAPTURA_ARQUIVO) contra uma
+instância rodando, com o mesmo ritmo de chegada (ou acelerado), e compara
+a latência entre builds.
+
+    # build atual
+    python ferramentas/replay.py tocar /srv/medicos/captura/trafego.jsonl \\
+        --url http://127.0.0.1:6969 --rotulo antes --saida antes.json
+    # depois do deploy do build novo, mesma captura
+    python ferramentas/replay.py tocar trafego.jsonl --url ... --rotulo depois --saida depois.json
+    python ferramentas/replay.py comparar antes.json depois.json
+
+- `--velocidade 1` respeita os intervalos originais; 4 = quatro vezes mais
+  rápido; 0 = tudo de uma vez (limitado por `--concorrencia`)
+- as validações (/validar_*) apontam para documentos criados durante a
+  captura; o replay troca o id pelo documento que ele mesmo gerou a partir
+  daquela requisição (X-Documento-Id). Sem correspondência (documento de
+  antes da captura, ou geração ainda em andamento) usa um documento do
+  mesmo tipo já gerado no replay, ou pula
+- `--medico` força um medico_id (homologação sem os mesmos médicos)
+- atraso_ms: quanto cada requisição saiu depois do horário previsto; se
+  cresce, o cliente (ou a `--concorrencia`) é o gargalo, não o servidor
+
+O requests.jsonl da raiz do repositório é o backlog do projeto, não uma
+captura: é recusado.
+"""
+import os, sys, re, json, random, statistics, subprocess, threading, time, argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROIBIDO = os.path.join(RAIZ, "requests.jsonl")
+
+GERAR = re.compile(r"^/api/gerar-([\w-]+)$")
+VALIDAR = re.compile(r"^/(validar_\w+)/(\d+)$")
+
+
+def ler_captura(caminho, limite=None):
+    if os.path.realpath(caminho) == os.path.realpath(PROIBIDO):
+        raise SystemExit(f"{caminho} é o backlog do repositório, não uma captura (ver CAPTURA_ARQUIVO)")
+    registros = []
+    with open(caminho, encoding="utf-8") as f:
+        for linha in f:
+            try:
+                r = json.loads(linha)
+            except ValueError:
+                continue
+            if isinstance(r, dict) and "ts" in r and "rota" in r:
+                registros.append(r)
+    registros.sort(key=lambda r: r["ts"])
+    return registros[:limite] if limite else registros
+
+
+def modelo_rota(rota):
+    """/validar_receita/123 -> /validar_receita/{id}, para agrupar."""
+    m = VALIDAR.match(rota)
+    return f"/{m.group(1)}/{{id}}" if m else rota
+
+
+class Replay:
+    def __init__(self, url, registros, velocidade, concorrencia, medico=None, timeout=120):
+        self.url = url.rstrip("/")
+        self.registros = registros
+        self.velocidade = velocidade
+        self.concorrencia = concorrencia
+        self.medico = medico
+        self.timeout = timeout
+        self.ids = {}               # (rota de validação, id capturado) -> id gerado no replay
+        self.gerados = {}           # rota de validação -> [ids gerados no replay]
+        self.resultados = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _sessao(self):
+        import requests
+        if not hasattr(self._local, "sessao"):
+            self._local.sessao = requests.Session()
+        return self._local.sessao
+
+    @staticmethod
+    def _rota_validacao(rota_gerar):
+        # /api/gerar-pedido-exames -> validar_pedido_exame; demais: validar_<tipo>
+        tipo = GERAR.match(rota_gerar).group(1)
+        return "validar_pedido_exame" if tipo.startswith("pedido") else f"validar_{tipo}"
+
+    def _alvo(self, reg):
+        """URL final da requisição (validações remapeadas) ou None para pular."""
+        query = dict(reg.get("query") or {})
+        m = VALIDAR.match(reg["rota"])
+        rota = reg["rota"]
+        if m:
+            nome, capturado = m.group(1), m.group(2)
+            with self._lock:
+                novo = self.ids.get((nome, capturado))
+                if novo is None and self.gerados.get(nome):
+                    novo = random.choice(self.gerados[nome])
+            if novo is None:
+                return None, query
+            rota = f"/{nome}/{novo}"
+            if self.medico and "mid" in query:
+                query["mid"] = self.medico
+        return self.url + rota, query
+
+    def _executar(self, i, reg, previsto):
+        saida = time.perf_counter()
+        url, query = self._alvo(reg)
+        base = {"i": i, "rota": modelo_rota(reg["rota"]), "ms_capturado": reg.get("ms"),
+                "status_capturado": reg.get("status"), "atraso_ms": round((saida - previsto) * 1000, 1)}
+        if url is None:
+            return {**base, "status": None, "ms": None, "pulado": True}
+        corpo = reg.get("corpo")
+        if self.medico and isinstance(corpo, dict) and "medico_id" in corpo:
+            corpo = {**corpo, "medico_id": self.medico}
+        inicio = time.perf_counter()
+        try:
+            if reg.get("metodo", "GET") == "POST":
+                r = self._sessao().post(url, params=query, json=corpo, timeout=self.timeout)
+            else:
+                r = self._sessao().get(url, params=query, timeout=self.timeout)
+            status = r.status_code
+            doc = r.headers.get("X-Documento-Id")
+        except Exception as e:
+            return {**base, "status": None, "ms": None, "erro": str(e)[:200]}
+        ms = (time.perf_counter() - inicio) * 1000
+        if doc and GERAR.match(reg["rota"]):
+            nome = self._rota_validacao(reg["rota"])
+            with self._lock:
+                self.gerados.setdefault(nome, []).append(doc)
+                if reg.get("documento_id"):
+                    self.ids[(nome, str(reg["documento_id"]))] = doc
+        return {**base, "status": status, "ms": round(ms, 1)}
+
+    def tocar(self, progresso=None):
+        if not self.registros:
+            return []
+        t0 = self.registros[0]["ts"]
+        inicio = time.perf_counter()
+        futuros = []
+        with ThreadPoolExecutor(max_workers=self.concorrencia) as ex:
+            for i, reg in enumerate(self.registros):
+                previsto = inicio + ((reg["ts"] - t0) / self.velocidade if self.velocidade > 0 else 0.0)
+                espera = previsto - time.perf_counter()
+                if espera > 0:
+                    time.sleep(espera)
+                futuros.append(ex.submit(self._executar, i, reg, previsto))
+                if progresso and (i + 1) % progresso == 0:
+                    print(f"  {i + 1}/{len(self.registros)} enviadas", file=sys.stderr)
+        self.resultados = [f.result() for f in futuros]
+        self.duracao = time.perf_counter() - inicio
+        return self.resultados
+
+
+# -------------------- resumo e comparação --------------------
+def _percentil(valores, p):
+    if not valores:
+        return None
+    return valores[min(len(valores) - 1, max(0, int(round(len(valores) * p / 100.0)) - 1))]
+
+
+def _estatisticas(amostras):
+    ms = sorted(a["ms"] for a in amostras if a.get("ms") is not None and a["status"] and a["status"] < 400)
+    capturado = sorted(a["ms_capturado"] for a in amostras if a.get("ms_capturado") is not None)
+    return {
+        "n": len(amostras),
+        # erro = falhou agora mas não tinha falhado na captura
+        "erros": sum(1 for a in amostras if not a.get("pulado") and (
+            a["status"] is None or (a["status"] >= 400 and (a.get("status_capturado") or 200) < 400))),
+        "pulados": sum(1 for a in amostras if a.get("pulado")),
+        "p50_ms": statistics.median(ms) if ms else None,
+        "p95_ms": _percentil(ms, 95),
+        "p99_ms": _percentil(ms, 99),
+        "capturado_p50_ms": statistics.median(capturado) if capturado else None,
+    }
+
+
+def resumir(resultados):
+    por_rota = {}
+    for a in resultados:
+        por_rota.setdefault(a["rota"], []).append(a)
+    resumo = {rota: _estatisticas(am) for rota, am in sorted(por_rota.items())}
+    resumo["(total)"] = _estatisticas(resultados)
+    atrasos = sorted(a["atraso_ms"] for a in resultados)
+    resumo["(total)"]["atraso_p95_ms"] = _percentil(atrasos, 95)
+    return resumo
+
+
+def _ms(v):
+    return f"{v:>8.0f}" if v is not None else f"{'-':>8}"
+
+
+def imprimir_resumo(resumo):
+    print(f"{'rota':<34} {'n':>6} {'erros':>6} {'pulados':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'capt p50':>8}")
+    for rota, e in resumo.items():
+        print(f"{rota:<34} {e['n']:>6} {e['erros']:>6} {e['pulados']:>7} {_ms(e['p50_ms'])} "
+              f"{_ms(e['p95_ms'])} {_ms(e['p99_ms'])} {_ms(e['capturado_p50_ms'])}")
+
+
+def _delta(a, b):
+    if a is None or b is None or not a:
+        return f"{'-':>7}"
+    return f"{(b / a - 1) * 100:>+6.0f}%"
+
+
+def comparar(base, novo):
+    rb, rn = base["resumo"], novo["resumo"]
+    print(f"{base['rotulo']} ({base['quando']}) -> {novo['rotulo']} ({novo['quando']})")
+    print(f"{'rota':<34} {'n':>6} " + " ".join(f"{p + ' ' + l:>8}" for p in ("p50", "p95", "p99")
+                                              for l in ("ant", "dep")) + f" {'Δp50':>7} {'Δp95':>7} {'Δp99':>7}")
+    for rota in [r for r in rn if r in rb]:
+        a, b = rb[rota], rn[rota]
+        print(f"{rota:<34} {b['n']:>6} "
+              + " ".join(f"{_ms(a[k])} {_ms(b[k])}" for k in ("p50_ms", "p95_ms", "p99_ms"))
+              + f" {_delta(a['p50_ms'], b['p50_ms'])} {_delta(a['p95_ms'], b['p95_ms'])}"
+              f" {_delta(a['p99_ms'], b['p99_ms'])}")
+    if base.get("arquivo") != novo.get("arquivo"):
+        print(f"atenção: capturas diferentes ({base.get('arquivo')} x {novo.get('arquivo')})")
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "-C", RAIZ, "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="comando", required=True)
+
+    t = sub.add_parser("tocar", help="reproduz uma captura contra --url")
+    t.add_argument("captura")
+    t.add_argument("--url", default="http://127.0.0.1:6969")
+    t.add_argument("--velocidade", type=float, default=1.0, help="1 = ritmo original; 0 = sem esperar")
+    t.add_argument("--concorrencia", type=int, default=64, help="requisições em voo no máximo")
+    t.add_argument("--limite", type=int, help="só as N primeiras requisições")
+    t.add_argument("--medico", type=int, help="força este medico_id em todas as requisições")
+    t.add_argument("--rotulo", help="nome do build (padrão: commit do checkout local)")
+    t.add_argument("--saida", help="grava resultado em JSON (para `comparar`)")
+
+    c = sub.add_parser("comparar", help="diferença de latência entre dois resultados de `tocar`")
+    c.add_argument("base")
+    c.add_argument("novo")
+    args = ap.parse_args()
+
+    if args.comando == "comparar":
+        with open(args.base, encoding="utf-8") as f:
+            base = json.load(f)
+        with open(args.novo, encoding="utf-8") as f:
+            novo = json.load(f)
+        comparar(base, novo)
+        return 0
+
+    registros = ler_captura(args.captura, args.limite)
+    if not registros:
+        print("captura vazia")
+        return 1
+    janela = registros[-1]["ts"] - registros[0]["ts"]
+    print(f"{len(registros)} requisições em {janela:.0f}s capturados; velocidade {args.velocidade:g}x -> {args.url}")
+    rp = Replay(args.url, registros, args.velocidade, args.concorrencia, args.medico)
+    resultados = rp.tocar(progresso=max(100, len(registros) // 10))
+    resumo = resumir(resultados)
+    print(f"duração {rp.duracao:.1f}s, {len(resultados) / rp.duracao:.1f} req/s, "
+          f"atraso p95 {resumo['(total)']['atraso_p95_ms'] or 0:.0f} ms")
+    imprimir_resumo(resumo)
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump({"rotulo": args.rotulo or _commit() or "?", "url": args.url,
+                       "arquivo": os.path.abspath(args.captura), "velocidade": args.velocidade,
+                       "quando": datetime.now().isoformat(timespec="seconds"), "duracao_s": rp.duracao,
+                       "resumo": resumo, "requisicoes": resultados}, f, ensure_ascii=False, indent=1)
+        print(f"resultado gravado em {args.saida}")
+    total = resumo["(total)"]
+    return 1 if total["erros"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
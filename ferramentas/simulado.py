@@ -0,0 +1,492 @@
+# ferramentas/simulado.py
+"""
+Ambiente simulado para as ferramentas de teste de carga: banco em memória,
+assinador de mentira e arquivos (timbrados, assinaturas, certificados)
+gerados por médico, de modo que cada PDF produzido dê para conferir.
+
+Por médico N:
+  - timbrado PDF com o texto "TIMBRADO-MNN-<papel>" (ou PNG de cor única,
+    para os médicos com N % 3 == 0, exercitando o caminho raster);
+  - assinatura-imagem PNG de cor única (COR_ASSINATURA(N));
+  - certificado PKCS12 autoassinado próprio;
+  - papel A4 (N par) ou A5 (N ímpar) para todos os documentos.
+
+Uso:
+    amb = preparar_ambiente(medicos=12)   # antes de importar o app
+    import app
+"""
+import os, sys, io, re, itertools, tempfile, threading, time
+from datetime import datetime, timedelta, timezone
+from multiprocessing import get_context
+from multiprocessing.managers import BaseManager
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+DOCS = ("RECEITA", "ATESTADO", "DECLARACAO", "PEDIDO_EXAMES")
+SENHA_CERT = "simulado"
+
+# tabelas/colunas que o information_schema simulado devolve
+TABELAS = {
+    "medicos": ["id", "nome", "crm", "certificado_path", "certificado_senha", "assinatura_img_path"],
+    "conselho": ["id", "medico_id", "tipo", "codigo", "uf"],
+    "papeis_timbrados": ["id", "medico_id", "tamanho", "caminho", "ativo"],
+    "preferencias_papel_medico": ["id", "medico_id", "doc_tipo", "tamanho_padrao"],
+    "pacientes": ["id", "nome", "cpf", "data_nascimento", "sexo", "criado_em"],
+    "receitas": ["id", "medico_id", "paciente_id", "texto", "data_emissao", "pdf_assinado_path",
+                 "assinado_em", "status", "pdf_sha256", "pdf_tamanho"],
+    "atestados": ["id", "medico_id", "paciente_id", "texto", "dias_afastamento", "data_emissao",
+                  "pdf_assinado_path", "assinado_em", "status", "pdf_sha256", "pdf_tamanho"],
+    "declaracoes": ["id", "medico_id", "paciente_id", "texto", "data_emissao", "pdf_assinado_path",
+                    "assinado_em", "status", "pdf_sha256", "pdf_tamanho"],
+    "pedidos_exames": ["id", "medico_id", "paciente_id", "nome_paciente", "cpf_paciente", "exames", "data_pedido", "pdf_assinado_path",
+                       "pdf_sha256", "pdf_tamanho"],
+    "clinica_config": ["chave", "valor"],
+    "invalidacoes_cache": ["id", "cache", "medico_id", "tipo", "documento_id", "criado_em"],
+    "jobs_documentos": ["id", "tipo", "status", "documento_id", "resultado", "erro", "criado_em",
+                        "iniciado_em", "concluido_em"],
+}
+
+
+def COR_ASSINATURA(n):
+    return (40 + (n * 53) % 200, 10 + (n * 97) % 200, 30 + (n * 29) % 200)
+
+
+def COR_TIMBRADO(n):
+    return (200 - (n * 31) % 150, 60 + (n * 17) % 180, 240 - (n * 71) % 200)
+
+
+def nome_medico(n):
+    return f"Medico Simulado M{n:02d}"
+
+
+def papel_medico(n):
+    return "A5" if n % 2 else "A4"
+
+
+# -------------------- arquivos por médico --------------------
+def _gerar_timbrado_pdf(caminho, marcador, pagesize):
+    from reportlab.pdfgen import canvas
+    c = canvas.Canvas(caminho, pagesize=pagesize)
+    w, h = pagesize
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(40, h - 40, marcador)
+    c.line(40, h - 48, w - 40, h - 48)
+    c.save()
+
+
+def _gerar_png(caminho, cor, tamanho):
+    from PIL import Image
+    Image.new("RGB", tamanho, cor).save(caminho)
+
+
+def _gerar_certificado(caminho, cn):
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.hazmat.primitives.serialization import pkcs12
+
+    chave = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    nome = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, cn)])
+    agora = datetime.now(timezone.utc)
+    cert = (x509.CertificateBuilder()
+            .subject_name(nome).issuer_name(nome)
+            .public_key(chave.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(agora - timedelta(days=1))
+            .not_valid_after(agora + timedelta(days=365))
+            .add_extension(x509.KeyUsage(True, True, False, False, False, False, False, False, False), critical=True)
+            .sign(chave, hashes.SHA256()))
+    dados = pkcs12.serialize_key_and_certificates(
+        cn.encode(), chave, cert, None, serialization.BestAvailableEncryption(SENHA_CERT.encode()))
+    with open(caminho, "wb") as f:
+        f.write(dados)
+
+
+class Medico:
+    def __init__(self, n, pasta):
+        from reportlab.lib.pagesizes import A4, A5
+        self.id = n
+        self.nome = nome_medico(n)
+        self.crm = f"{100000 + n}"
+        self.papel = papel_medico(n)
+        self.raster = (n % 3 == 0)
+        self.cor_assinatura = COR_ASSINATURA(n)
+        self.cor_timbrado = COR_TIMBRADO(n)
+        self.marcador = {t: f"TIMBRADO-M{n:02d}-{t}" for t in ("A4", "A5")}
+        self.assinatura = os.path.join(pasta, f"assinatura_m{n:02d}.png")
+        _gerar_png(self.assinatura, self.cor_assinatura, (300, 80))
+        self.timbrados = {}
+        for tam, ps in (("A4", A4), ("A5", A5)):
+            if self.raster:
+                caminho = os.path.join(pasta, f"timbrado_m{n:02d}_{tam}.png")
+                _gerar_png(caminho, self.cor_timbrado, (int(ps[0] / 4), int(ps[1] / 4)))
+            else:
+                caminho = os.path.join(pasta, f"timbrado_m{n:02d}_{tam}.pdf")
+                _gerar_timbrado_pdf(caminho, self.marcador[tam], ps)
+            self.timbrados[tam] = caminho
+        self.certificado = os.path.join(pasta, f"cert_m{n:02d}.pfx")
+        _gerar_certificado(self.certificado, self.nome)
+
+    def linhas_perfil(self):
+        """Linhas do SELECT único de perfil_medico (LEFT JOINs já aplicados)."""
+        base = (self.certificado, SENHA_CERT, self.assinatura, self.crm, self.nome, "CRM", self.crm, "SP")
+        return [base + (tam, caminho, doc, self.papel)
+                for tam, caminho in self.timbrados.items() for doc in DOCS]
+
+
+# -------------------- banco simulado --------------------
+class BancoSimulado:
+    def __init__(self, medicos, latencia_ms=0.0):
+        self.medicos = {m.id: m for m in medicos}
+        self.latencia = latencia_ms / 1000.0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.pacientes = {}     # cpf -> id
+        self.registros = {}     # (tabela, id) -> {coluna: valor} dos INSERT/UPDATE
+        self.jobs = {}          # job_id -> linha de jobs_documentos (chave não numérica)
+        self.consultas = 0
+
+    def conectar(self):
+        return _ConexaoSimulada(self, self.latencia)
+
+    def executar(self, q, args=None):
+        """(linhas, lastrowid, rowcount) de uma consulta."""
+        q = " ".join(q.split())
+        with self._lock:
+            self.consultas += 1
+        if " jobs_documentos " in q:
+            return self.executar_jobs(q, args)
+        if q.startswith("INSERT"):
+            novo = next(self._ids)
+            m = re.match(r"INSERT INTO (\w+) \(([^)]*)\)", q)
+            with self._lock:
+                if m:
+                    colunas = [c.strip() for c in m.group(2).split(",")]
+                    self.registros[(m.group(1), novo)] = dict(zip(colunas, args))
+                if "INTO pacientes" in q:
+                    self.pacientes[args[1]] = novo
+            return [], novo, 1
+        if q.startswith("UPDATE"):
+            tabela = q.split()[1]
+            colunas = re.findall(r"(\w+)=%s", q.split(" WHERE ")[0])
+            with self._lock:
+                reg = self.registros.get((tabela, int(args[-1])))
+                if reg is not None:
+                    reg.update(zip(colunas, args))
+            return [], None, 1 if reg is not None else 0
+        r = []
+        if " d WHERE d.id" in q or " d LEFT JOIN" in q or " d JOIN" in q:
+            r = self.linhas_validacao(q, args)
+        elif q.startswith("SELECT 1 FROM"):
+            with self._lock:
+                r = [(1,)] if (q.split()[3], int(args[0])) in self.registros else []
+        elif "FROM invalidacoes_cache" in q:
+            r = self.linhas_invalidacao(q, args)
+        elif "information_schema" in q:
+            r = [(t, c) for t, cs in TABELAS.items() for c in cs]
+        elif "FROM clinica_config" in q:
+            r = []
+        elif "FROM medicos m" in q:
+            m = self.medicos.get(int(args[0]))
+            r = m.linhas_perfil() if m else []
+        elif q.startswith("SELECT id FROM medicos"):
+            r = [(i,) for i in sorted(self.medicos, reverse=True)]
+        elif "FROM medicos WHERE id" in q:
+            m = self.medicos.get(int(args[0]))
+            if m and "nome, crm" in q:
+                r = [(m.nome, m.crm, m.assinatura)]
+            elif m:
+                r = [(m.certificado, SENHA_CERT, m.assinatura, m.crm, m.nome)]
+        elif "FROM pacientes WHERE cpf" in q:
+            with self._lock:
+                pid = self.pacientes.get(args[0])
+            r = [(pid,)] if pid else []
+        return r, None, len(r)
+
+    def executar_jobs(self, q, args):
+        colunas = TABELAS["jobs_documentos"]
+        with self._lock:
+            if q.startswith("INSERT"):
+                nomes = [c.strip() for c in re.search(r"\(([^)]*)\)", q).group(1).split(",")]
+                self.jobs[args[0]] = dict(zip(nomes, args))
+                return [], None, 1
+            if q.startswith("UPDATE"):
+                reg = self.jobs.get(args[-1])
+                if reg is not None:
+                    reg.update(zip(re.findall(r"(\w+)=%s", q.split(" WHERE ")[0]), args))
+                return [], None, 1 if reg is not None else 0
+            if q.startswith("DELETE"):
+                velhos = [k for k, r in self.jobs.items() if r.get("concluido_em") and r["concluido_em"] < args[0]]
+                for k in velhos:
+                    del self.jobs[k]
+                return [], None, len(velhos)
+            reg = self.jobs.get(args[0])
+            r = [tuple(reg.get(c) for c in colunas)] if reg else []
+            return r, None, len(r)
+
+    def linhas_invalidacao(self, q, args):
+        with self._lock:
+            ids = sorted(i for t, i in self.registros if t == "invalidacoes_cache")
+            if "MAX(id)" in q:
+                return [(ids[-1] if ids else None,)]
+            return [(i,) + tuple(self.registros[("invalidacoes_cache", i)].get(c)
+                                 for c in ("cache", "medico_id", "tipo", "documento_id"))
+                    for i in ids if i > args[0]]
+
+    def contagem(self):
+        return self.consultas
+
+    def linhas_validacao(self, q, args):
+        """SELECT único de validacao.py: colunas d.* pedidas + médico, paciente e conselho."""
+        tabela = re.search(r" FROM (\w+) d ", q).group(1)
+        campos = re.findall(r"d\.(\w+)", q.split(" m.id,")[0])
+        medico_param = "LEFT JOIN medicos m ON m.id = %s" in q or "COALESCE(d.medico_id, %s)" in q
+        doc_id = int(args[-1])
+        with self._lock:
+            reg = self.registros.get((tabela, doc_id))
+            pac = self.registros.get(("pacientes", int(reg.get("paciente_id") or 0))) if reg else None
+        if not reg:
+            return []
+        mid = (reg.get("medico_id") or args[0]) if medico_param else reg.get("medico_id")
+        m = self.medicos.get(int(mid)) if mid else None
+        medico = (m.id, m.nome, m.crm, m.assinatura) if m else (None, None, None, None)
+        conselho = ("CRM", m.crm, "SP") if m else (None, None, None)
+        paciente = (pac.get("nome"), pac.get("cpf")) if pac else (None, None)
+        return [tuple(reg.get(c) for c in campos) + medico + paciente + conselho]
+
+
+class _CursorSimulado:
+    def __init__(self, banco, latencia):
+        self.banco = banco
+        self.latencia = latencia
+        self.r = []
+        self.lastrowid = None
+        self.rowcount = 0
+        self.description = None
+
+    def execute(self, q, args=None):
+        if self.latencia:
+            time.sleep(self.latencia)
+        self.r, lastrowid, self.rowcount = self.banco.executar(q, args)
+        if lastrowid is not None:
+            self.lastrowid = lastrowid
+        return self.rowcount
+
+    def executemany(self, q, seq):
+        for args in seq:
+            self.execute(q, args)
+
+    def fetchone(self):
+        return self.r[0] if self.r else None
+
+    def fetchall(self):
+        return list(self.r)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *a):
+        pass
+
+
+class _ConexaoSimulada:
+    open = True
+
+    def __init__(self, banco, latencia=0.0):
+        self.banco = banco
+        self.latencia = latencia
+
+    def cursor(self, *a, **k):
+        return _CursorSimulado(self.banco, self.latencia)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def ping(self, reconnect=False):
+        pass
+
+    def close(self):
+        pass
+
+
+# -------------------- assinador simulado --------------------
+class BackendAssinaturaSimulado:
+    """Não assina de verdade: espera `latencia_ms` e marca o PDF com o certificado usado."""
+    nome = "simulado"
+
+    def __init__(self, latencia_ms=20.0):
+        self.latencia = latencia_ms / 1000.0
+        self.assinaturas = 0
+        self._lock = threading.Lock()
+
+    def assinar(self, pdf_bytes: bytes, cred) -> bytes:
+        if self.latencia:
+            time.sleep(self.latencia)
+        with self._lock:
+            self.assinaturas += 1
+        marca = f"\n%ASSINADO-SIMULADO {os.path.basename(cred.cert_path)}\n".encode()
+        return pdf_bytes + marca
+
+
+# -------------------- montagem --------------------
+class Ambiente:
+    def __init__(self, pasta, medicos, banco, assinador):
+        self.pasta = pasta
+        self.medicos = medicos
+        self.banco = banco
+        self.assinador = assinador
+
+    def medico(self, n):
+        return self.banco.medicos[n]
+
+
+def preparar_ambiente(medicos=12, latencia_assinatura_ms=20.0, latencia_db_ms=0.0, pasta=None):
+    """
+    Cria a pasta de trabalho (vira o cwd: receitas/, atestados/... vão para lá),
+    gera os arquivos dos médicos e liga banco e assinador simulados.
+    Chame ANTES de importar o app.
+    """
+    pasta = pasta or tempfile.mkdtemp(prefix="medicos_sim_")
+    os.makedirs(pasta, exist_ok=True)
+    arquivos = os.path.join(pasta, "_medicos")
+    os.makedirs(arquivos, exist_ok=True)
+    os.chdir(pasta)
+
+    os.environ["ASSINADOR_BACKEND"] = BackendAssinaturaSimulado.nome
+    os.environ.setdefault("PUBLIC_BASE_URL", "http://simulado")
+
+    lista = [Medico(n, arquivos) for n in range(1, medicos + 1)]
+    banco = BancoSimulado(lista, latencia_db_ms)
+
+    import db, assinador
+    db.pool._fabrica = banco.conectar
+    backend = BackendAssinaturaSimulado(latencia_assinatura_ms)
+    assinador.BACKENDS[backend.nome] = backend
+    assinador.ASSINADOR_BACKEND = backend.nome
+    return Ambiente(pasta, lista, banco, backend)
+
+
+class _GerenteBanco(BaseManager):
+    pass
+
+
+def _soltar_gerente(gerente):
+    # só quem criou o gerente o encerra/espera; o fork do gunicorn (que não
+    # passa pelo multiprocessing) herda o finalizador e a lista de filhos
+    import multiprocessing.process
+    gerente.shutdown.cancel()
+    multiprocessing.process._children.clear()
+
+
+def compartilhar_banco(amb):
+    """
+    Move o banco simulado para um processo próprio, para servir vários
+    workers do gunicorn (documento criado num worker precisa aparecer na
+    validação atendida por outro). Chame depois de preparar_ambiente e
+    antes do fork; cada processo abre seu proxy na primeira conexão.
+    """
+    banco = amb.banco
+    _GerenteBanco.register("banco", callable=lambda: banco, exposed=("executar", "contagem"))
+    gerente = _GerenteBanco(address=("127.0.0.1", 0), ctx=get_context("fork"))
+    gerente.start()
+    endereco, chave = gerente.address, gerente._authkey
+    proxies = {}
+
+    def conectar():
+        proxy = proxies.get(os.getpid())
+        if proxy is None:
+            g = _GerenteBanco(address=endereco, authkey=chave)
+            g.connect()
+            proxy = proxies[os.getpid()] = g.banco()
+        return _ConexaoSimulada(proxy, banco.latencia)
+
+    import db
+    db.pool._fabrica = conectar
+    amb.gerente = gerente       # sem referência o gerente é coletado e derruba o processo do banco
+    os.register_at_fork(after_in_child=lambda: _soltar_gerente(gerente))
+    return gerente
+
+
+# -------------------- conferência dos PDFs --------------------
+def _coletar(recursos, achados, vistos):
+    xobjs = (recursos or {}).get("/XObject")
+    if xobjs is None:
+        return
+    xobjs = xobjs.get_object()
+    for nome in xobjs:
+        ref = xobjs.raw_get(nome)
+        chave = getattr(ref, "idnum", None) or id(ref)
+        if chave in vistos:
+            continue
+        vistos.add(chave)
+        obj = xobjs[nome].get_object()
+        sub = obj.get("/Subtype")
+        if sub == "/Image":
+            try:
+                dados = obj.get_data()
+                if int(obj.get("/BitsPerComponent", 8)) == 8 and obj.get("/ColorSpace") == "/DeviceRGB":
+                    meio = (int(obj["/Height"]) // 2) * int(obj["/Width"]) + int(obj["/Width"]) // 2
+                    achados["cores"].add(tuple(dados[meio * 3: meio * 3 + 3]))
+            except Exception:
+                pass
+        elif sub == "/Form":
+            try:
+                achados["conteudo"] += obj.get_data()
+            except Exception:
+                pass
+            _coletar(obj.get("/Resources"), achados, vistos)
+
+
+def analisar_pdf(pdf_bytes):
+    """{"texto", "conteudo" (streams dos Form XObjects), "cores" (pixel central das imagens)}"""
+    from PyPDF2 import PdfReader
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    achados = {"texto": "", "conteudo": b"", "cores": set(), "paginas": len(reader.pages)}
+    vistos = set()
+    for page in reader.pages:
+        achados["texto"] += page.extract_text() or ""
+        _coletar(page.get("/Resources"), achados, vistos)
+    return achados
+
+
+def _normalizar(s):
+    return "".join(str(s).split()).lower()
+
+
+def conferir_pdf(pdf_bytes, medico, paciente, outros=(), assinado=True):
+    """Lista de problemas (vazia = PDF é do paciente/médico certos e só deles)."""
+    try:
+        a = analisar_pdf(pdf_bytes)
+    except Exception as e:
+        return [f"PDF ilegível: {e}"]
+    problemas = []
+    texto = _normalizar(a["texto"])
+    if _normalizar(paciente) not in texto:
+        problemas.append(f"paciente '{paciente}' ausente")
+    if medico.raster:
+        if medico.cor_timbrado not in a["cores"]:
+            problemas.append(f"timbrado raster do médico {medico.id} ausente")
+    elif medico.marcador[medico.papel].encode() not in a["conteudo"]:
+        problemas.append(f"timbrado {medico.marcador[medico.papel]} ausente")
+    if assinado and medico.cor_assinatura not in a["cores"]:
+        problemas.append(f"assinatura-imagem do médico {medico.id} ausente")
+    # nada de outro médico pode aparecer no documento
+    for outro in outros:
+        if outro.id == medico.id:
+            continue
+        if outro.cor_assinatura in a["cores"] or outro.cor_timbrado in a["cores"]:
+            problemas.append(f"imagem do médico {outro.id} presente")
+        if any(m.encode() in a["conteudo"] for m in outro.marcador.values()):
+            problemas.append(f"timbrado do médico {outro.id} presente")
+        if _normalizar(outro.nome) in texto:
+            problemas.append(f"nome do médico {outro.id} presente")
+    return problemas
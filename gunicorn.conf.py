@@ -0,0 +1,58 @@
+# gunicorn.conf.py
+"""
+Servidor de produção: gunicorn -c gunicorn.conf.py
+
+- pre-fork com GUNICORN_WORKERS processos x GUNICORN_THREADS threads (gthread)
+- preload_app: o app é importado e os caches aquecidos (aquecimento.py) no
+  mestre, antes do fork; os workers já nascem com fontes, perfis,
+  timbrados, rodapés e credenciais prontos
+- reload gracioso: `kill -HUP <pid do mestre>` reaquece os caches no mestre
+  e troca os workers sem derrubar requisições em andamento (com
+  preload_app, código novo exige restart do container)
+- app.py continua com o servidor de desenvolvimento (`python app.py`)
+"""
+import os, multiprocessing
+
+wsgi_app = "app:app"
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:6969")
+workers = int(os.getenv("GUNICORN_WORKERS", str(min(4, multiprocessing.cpu_count()))))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+worker_class = "gthread"
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOGLEVEL", "info")
+
+
+def when_ready(server):
+    # roda no mestre depois do preload e antes do 1º fork
+    # jobs.py só aceita ?async=1 com vários workers se o estado deles for compartilhado
+    os.environ["JOBS_PROCESSOS"] = str(server.num_workers)
+    from aquecimento import aquecer
+    server.log.info("Caches aquecidos: %s", aquecer())
+
+
+def on_reload(server):
+    # HUP: reaquece no mestre; os workers novos herdam os caches atualizados
+    from aquecimento import aquecer
+    from perfil_medico import invalidar_perfis
+    invalidar_perfis()
+    server.log.info("Caches reaquecidos: %s", aquecer())
+
+
+def post_fork(server, worker):
+    # pool de conexões, assinadores e executores se recriam sozinhos no
+    # worker (checam o pid); threads (varredor de temporários) só depois do fork
+    from limpeza import iniciar_varredor
+    iniciar_varredor()
+    server.log.info("Worker %s pronto", worker.pid)
+
+
+def worker_exit(server, worker):
+    from assinador import encerrar_assinadores
+    encerrar_assinadores()
@@ -0,0 +1,162 @@
+# invalidacao.py
+"""
+Invalidação de caches que chega a todos os workers do gunicorn.
+
+Perfis (perfil_medico.py), credenciais (credenciais.py), páginas de
+validação (validacao.py) e o snapshot de esquema (esquema.py) vivem na
+memória de cada processo. A rota de invalidação cai num worker só; os
+outros continuariam servindo o dado velho até o TTL.
+
+- `publicar(cache, ...)` aplica no processo atual e grava uma linha em
+  invalidacoes_cache (migracoes/003_invalidacoes_cache.sql)
+- `sincronizar()` roda antes de cada requisição: a cada
+  INVALIDACAO_INTERVALO segundos, no máximo, lê as linhas novas e aplica
+  as de outros processos; atraso máximo entre workers = esse intervalo
+- cada módulo de cache registra o seu invalidador com `registrar()`
+- sem a tabela (ou com o banco fora) a invalidação é só local e os outros
+  workers só se atualizam no fim do TTL de cada cache
+- linhas com mais de INVALIDACAO_RETENCAO segundos são apagadas por quem publica
+"""
+import os, threading, time, logging
+
+from db import conectar
+from esquema import esquema, recarregar_esquema
+
+INVALIDACAO_INTERVALO = float(os.getenv("INVALIDACAO_INTERVALO", "1"))
+INVALIDACAO_RETENCAO = float(os.getenv("INVALIDACAO_RETENCAO", "86400"))
+INVALIDACAO_TABELA = "invalidacoes_cache"
+
+logger = logging.getLogger(__name__)
+
+
+class Invalidacoes:
+    def __init__(self, intervalo: float = INVALIDACAO_INTERVALO, retencao: float = INVALIDACAO_RETENCAO):
+        self.intervalo = intervalo
+        self.retencao = retencao
+        self._invalidadores = {}        # cache -> funcao(**alvo) -> int
+        self._lock = threading.Lock()
+        self._sync = threading.Lock()
+        self._ultimo_id = None          # última linha já vista (None: ainda sem base)
+        self._proprias = set()          # ids publicados por este processo
+        self._proxima = 0.0
+        self._stats = {"publicadas": 0, "aplicadas": 0, "falhas_banco": 0}
+
+    def registrar(self, cache: str, funcao):
+        self._invalidadores[cache] = funcao
+
+    @staticmethod
+    def compartilhada() -> bool:
+        esq = esquema()
+        return esq.conhecido and esq.tem_tabela(INVALIDACAO_TABELA)
+
+    def _aplicar(self, cache, alvo) -> int:
+        funcao = self._invalidadores.get(cache)
+        if funcao is None:
+            return 0
+        return funcao(**{k: v for k, v in alvo.items() if v is not None}) or 0
+
+    def publicar(self, cache: str, medico_id=None, tipo=None, documento_id=None) -> int:
+        """Invalida aqui e avisa os outros processos. Retorna o que foi removido neste processo."""
+        if self.compartilhada():
+            conn = None
+            try:
+                conn = conectar()
+                cur = conn.cursor()
+                cur.execute(f"INSERT INTO {INVALIDACAO_TABELA} (cache, medico_id, tipo, documento_id, criado_em) "
+                            f"VALUES (%s, %s, %s, %s, %s)", (cache, medico_id, tipo, documento_id, time.time()))
+                novo = cur.lastrowid
+                cur.execute(f"DELETE FROM {INVALIDACAO_TABELA} WHERE criado_em < %s",
+                            (time.time() - self.retencao,))
+                conn.commit()
+                cur.close()
+                with self._lock:
+                    self._proprias.add(novo)
+                    self._stats["publicadas"] += 1
+            except Exception as e:
+                with self._lock:
+                    self._stats["falhas_banco"] += 1
+                logger.warning("[INVALIDACAO] %s só neste processo (falha gravando %s): %s",
+                               cache, INVALIDACAO_TABELA, e)
+            finally:
+                if conn is not None:
+                    conn.close()
+        return self._aplicar(cache, {"medico_id": medico_id, "tipo": tipo, "documento_id": documento_id})
+
+    def sincronizar(self, forcar: bool = False) -> int:
+        """Aplica as invalidações publicadas por outros processos. Barato quando não é hora."""
+        agora = time.monotonic()
+        if not forcar and agora < self._proxima:
+            return 0
+        if not self._sync.acquire(blocking=forcar):
+            return 0        # outra thread já está lendo
+        try:
+            self._proxima = agora + self.intervalo
+            if not self.compartilhada():
+                return 0
+            conn = conectar()
+            try:
+                cur = conn.cursor()
+                if self._ultimo_id is None:
+                    # base: o que foi publicado antes de o processo subir já está refletido nos caches
+                    cur.execute(f"SELECT MAX(id) FROM {INVALIDACAO_TABELA}")
+                    linha = cur.fetchone()
+                    self._ultimo_id = (linha[0] if linha else None) or 0
+                    cur.close()
+                    return 0
+                cur.execute(f"SELECT id, cache, medico_id, tipo, documento_id FROM {INVALIDACAO_TABELA} "
+                            f"WHERE id > %s ORDER BY id", (self._ultimo_id,))
+                linhas = cur.fetchall() or []
+                cur.close()
+            finally:
+                conn.close()
+            aplicadas = 0
+            for id_, cache, medico_id, tipo, documento_id in linhas:
+                self._ultimo_id = max(self._ultimo_id, id_)
+                with self._lock:
+                    if id_ in self._proprias:
+                        self._proprias.discard(id_)
+                        continue
+                self._aplicar(cache, {"medico_id": medico_id, "tipo": tipo, "documento_id": documento_id})
+                aplicadas += 1
+            if aplicadas:
+                with self._lock:
+                    self._stats["aplicadas"] += aplicadas
+            return aplicadas
+        except Exception as e:
+            with self._lock:
+                self._stats["falhas_banco"] += 1
+            logger.warning("[INVALIDACAO] falha lendo %s: %s", INVALIDACAO_TABELA, e)
+            return 0
+        finally:
+            self._sync.release()
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "compartilhada": self.compartilhada(),
+                "intervalo": self.intervalo,
+                "ultimo_id": self._ultimo_id,
+                "caches": sorted(self._invalidadores),
+                **self._stats,
+            }
+
+
+_invalidacoes = Invalidacoes()
+# clinica_config/esquema (mudança geral da clínica)
+_invalidacoes.registrar("esquema", lambda **_: 1 if recarregar_esquema() else 0)
+
+
+def registrar_invalidador(cache: str, funcao):
+    _invalidacoes.registrar(cache, funcao)
+
+
+def publicar_invalidacao(cache: str, medico_id=None, tipo=None, documento_id=None) -> int:
+    return _invalidacoes.publicar(cache, medico_id=medico_id, tipo=tipo, documento_id=documento_id)
+
+
+def sincronizar_invalidacoes(forcar: bool = False) -> int:
+    return _invalidacoes.sincronizar(forcar)
+
+
+def estatisticas_invalidacao():
+    return _invalidacoes.estatisticas()
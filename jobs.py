@@ -0,0 +1,296 @@
+# jobs.py
+"""
+Geração assíncrona de documentos.
+
+Os endpoints /api/gerar-* fazem só a parte rápida na requisição (validação
++ INSERT) e, no modo assíncrono, entregam o resto (render, assinatura,
+overlay, gravação) a um pool de threads limitado. A resposta é 202 com o
+id do job; o andamento fica em GET /api/jobs/<id>.
+
+- modo assíncrono: `?async=1` na URL ou `"async": true` no JSON
+- JOBS_WORKERS threads; no máximo JOBS_FILA_MAX jobs aguardando (503 acima disso)
+- jobs terminados ficam consultáveis por JOBS_RETENCAO segundos
+- o modo síncrono (padrão) continua igual
+- o job roda no worker do gunicorn que recebeu o POST, mas o GET pode cair
+  em outro: cada mudança de status é gravada na tabela jobs_documentos
+  (migracoes/002_jobs_documentos.sql) e `obter()` lê de lá o que não for
+  local. Sem a tabela, o modo assíncrono só é aceito com um processo
+  (JOBS_PROCESSOS, que o gunicorn.conf.py preenche com o nº de workers);
+  com mais, o POST assíncrono recebe 501 antes de criar o documento
+"""
+import os, re, json, threading, time, uuid, logging
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Blueprint, current_app, request
+
+from db import conectar
+from esquema import esquema
+
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "4"))
+JOBS_FILA_MAX = int(os.getenv("JOBS_FILA_MAX", "100"))
+JOBS_RETENCAO = float(os.getenv("JOBS_RETENCAO", "3600"))
+JOBS_TABELA = "jobs_documentos"
+
+_RE_JOB_ID = re.compile(r"^[0-9a-f]{32}$")
+
+logger = logging.getLogger(__name__)
+
+jobs_bp = Blueprint('jobs', __name__)
+
+
+class FilaCheia(RuntimeError):
+    pass
+
+
+class ErroGeracao(RuntimeError):
+    """Falha ao produzir o documento (vira 500 no modo síncrono, status "erro" no job)."""
+    pass
+
+
+class Job:
+    def __init__(self, tipo, documento_id=None):
+        self.id = uuid.uuid4().hex
+        self.tipo = tipo
+        self.documento_id = documento_id
+        self.status = "pendente"      # pendente | executando | concluido | erro
+        self.resultado = None
+        self.erro = None
+        self.criado_em = time.time()
+        self.iniciado_em = None
+        self.concluido_em = None
+
+    def como_dict(self):
+        d = {
+            "job_id": self.id,
+            "tipo": self.tipo,
+            "documento_id": self.documento_id,
+            "status": self.status,
+            "criado_em": self.criado_em,
+            "iniciado_em": self.iniciado_em,
+            "concluido_em": self.concluido_em,
+        }
+        if self.iniciado_em:
+            d["espera_ms"] = round((self.iniciado_em - self.criado_em) * 1000, 1)
+        if self.concluido_em and self.iniciado_em:
+            d["execucao_ms"] = round((self.concluido_em - self.iniciado_em) * 1000, 1)
+        if self.resultado is not None:
+            d["resultado"] = self.resultado
+        if self.erro:
+            d["erro"] = self.erro
+        return d
+
+    @classmethod
+    def de_linha(cls, linha):
+        """Job gravado por outro worker (SELECT de jobs_documentos)."""
+        job = cls.__new__(cls)
+        (job.id, job.tipo, job.status, job.documento_id, resultado, job.erro,
+         job.criado_em, job.iniciado_em, job.concluido_em) = linha
+        job.resultado = json.loads(resultado) if resultado else None
+        return job
+
+
+def processos() -> int:
+    """Quantos processos servem o app (lido a cada chamada: o gunicorn preenche depois do preload)."""
+    try:
+        return max(1, int(os.getenv("JOBS_PROCESSOS") or "1"))
+    except ValueError:
+        return 1
+
+
+class GerenciadorJobs:
+    def __init__(self, workers: int = JOBS_WORKERS, fila_max: int = JOBS_FILA_MAX,
+                 retencao: float = JOBS_RETENCAO):
+        self.workers = max(1, workers)
+        self.fila_max = max(1, fila_max)
+        self.retencao = retencao
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+        self._jobs = {}
+        self._pendentes = 0
+        self._limpeza_banco = 0.0
+        self._stats = {"submetidos": 0, "concluidos": 0, "erros": 0, "rejeitados": 0, "falhas_banco": 0}
+
+    def _garantir_executor(self):
+        # executor criado sob demanda e recriado após fork (threads não sobrevivem ao fork)
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+            self._pid = os.getpid()
+            self._jobs = {}
+            self._pendentes = 0
+
+    def _limpar(self):
+        limite = time.time() - self.retencao
+        velhos = [k for k, j in self._jobs.items() if j.concluido_em and j.concluido_em < limite]
+        for k in velhos:
+            del self._jobs[k]
+
+    # ---- estado compartilhado entre os workers
+    @staticmethod
+    def compartilhado() -> bool:
+        esq = esquema()
+        return esq.conhecido and esq.tem_tabela(JOBS_TABELA)
+
+    def aceita_assincrono(self) -> bool:
+        return processos() == 1 or self.compartilhado()
+
+    def _banco(self, sql, args=(), buscar=False):
+        conn = conectar()
+        try:
+            cur = conn.cursor()
+            cur.execute(sql, args)
+            linha = cur.fetchone() if buscar else None
+            conn.commit()
+            cur.close()
+            return linha
+        finally:
+            conn.close()
+
+    def _persistir(self, job, novo=False):
+        if not self.compartilhado():
+            return
+        resultado = json.dumps(job.resultado, ensure_ascii=False, default=str) if job.resultado is not None else None
+        try:
+            if novo:
+                self._banco(f"INSERT INTO {JOBS_TABELA} (id, tipo, status, documento_id, criado_em) "
+                            f"VALUES (%s, %s, %s, %s, %s)",
+                            (job.id, job.tipo, job.status, job.documento_id, job.criado_em))
+            else:
+                self._banco(f"UPDATE {JOBS_TABELA} SET status=%s, resultado=%s, erro=%s, iniciado_em=%s, "
+                            f"concluido_em=%s WHERE id=%s",
+                            (job.status, resultado, job.erro, job.iniciado_em, job.concluido_em, job.id))
+        except Exception as e:
+            with self._lock:
+                self._stats["falhas_banco"] += 1
+            logger.warning("Job %s: falha gravando %s em %s: %s", job.id, job.status, JOBS_TABELA, e)
+
+    def _limpar_banco(self):
+        agora = time.time()
+        with self._lock:
+            if agora - self._limpeza_banco < 60:
+                return
+            self._limpeza_banco = agora
+        try:
+            self._banco(f"DELETE FROM {JOBS_TABELA} WHERE concluido_em < %s", (agora - self.retencao,))
+        except Exception as e:
+            logger.warning("Falha limpando %s: %s", JOBS_TABELA, e)
+
+    def submeter(self, tipo, funcao, ctx, documento_id=None, app=None) -> Job:
+        """Agenda funcao(ctx); o dict retornado vira job.resultado. Levanta FilaCheia."""
+        job = Job(tipo, documento_id)
+        with self._lock:
+            self._garantir_executor()
+            self._limpar()
+            if self._pendentes >= self.fila_max:
+                self._stats["rejeitados"] += 1
+                raise FilaCheia(f"Fila de geração cheia ({self.fila_max} aguardando)")
+            self._pendentes += 1
+            self._stats["submetidos"] += 1
+            self._jobs[job.id] = job
+            executor = self._executor
+        if self.compartilhado():
+            self._persistir(job, novo=True)
+            self._limpar_banco()
+        executor.submit(self._executar, job, funcao, ctx, app)
+        return job
+
+    def _executar(self, job, funcao, ctx, app):
+        with self._lock:
+            self._pendentes -= 1
+        job.status = "executando"
+        job.iniciado_em = time.time()
+        self._persistir(job)
+        try:
+            if app is not None:
+                with app.app_context():
+                    res = funcao(ctx)
+            else:
+                res = funcao(ctx)
+            # bytes do PDF não ficam na memória do job: o arquivo já está gravado
+            job.resultado = {k: v for k, v in (res or {}).items() if k != "pdf_bytes"}
+            job.status = "concluido"
+            with self._lock:
+                self._stats["concluidos"] += 1
+        except Exception as e:
+            logger.exception("Job %s (%s) falhou", job.id, job.tipo)
+            job.erro = str(e)
+            job.status = "erro"
+            with self._lock:
+                self._stats["erros"] += 1
+        finally:
+            job.concluido_em = time.time()
+            self._persistir(job)
+
+    def obter(self, job_id):
+        """Job local ou, se outro worker o recebeu, o que estiver em jobs_documentos."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None or not _RE_JOB_ID.match(job_id or "") or not self.compartilhado():
+            return job
+        linha = self._banco(f"SELECT id, tipo, status, documento_id, resultado, erro, criado_em, iniciado_em, "
+                            f"concluido_em FROM {JOBS_TABELA} WHERE id=%s", (job_id,), buscar=True)
+        return Job.de_linha(linha) if linha else None
+
+    def estatisticas(self):
+        with self._lock:
+            executando = sum(1 for j in self._jobs.values() if j.status == "executando")
+            return {
+                "workers": self.workers,
+                "fila_max": self.fila_max,
+                "aguardando": self._pendentes,
+                "executando": executando,
+                "retidos": len(self._jobs),
+                "processos": processos(),
+                "compartilhado": self.compartilhado(),
+                **self._stats,
+            }
+
+
+gerenciador = GerenciadorJobs()
+
+
+def modo_assincrono(data=None) -> bool:
+    v = request.args.get("async")
+    if v is None and isinstance(data, dict):
+        v = data.get("async")
+    return str(v).strip().lower() in ("1", "true", "sim", "yes")
+
+
+def assincrono_indisponivel():
+    """Corpo/status de recusa do modo assíncrono, ou None se ele pode ser usado."""
+    if gerenciador.aceita_assincrono():
+        return None
+    return {"erro": f"Modo assíncrono indisponível: {processos()} processos sem a tabela {JOBS_TABELA} "
+                    f"(migracoes/002_jobs_documentos.sql); use o modo síncrono"}, 501
+
+
+def enfileirar(tipo, funcao, ctx, documento_id=None):
+    """Resposta 202 com o job (ou 503 se a fila estiver cheia)."""
+    try:
+        job = gerenciador.submeter(tipo, funcao, ctx, documento_id=documento_id,
+                                   app=current_app._get_current_object())
+    except FilaCheia as e:
+        return {"erro": str(e), "documento_id": documento_id}, 503
+    return {
+        "status": job.status,
+        "job_id": job.id,
+        "documento_id": documento_id,
+        "status_url": f"{ctx.get('base_url', '')}/api/jobs/{job.id}",
+    }, 202
+
+
+@jobs_bp.route('/api/jobs/<job_id>')
+def status_job(job_id):
+    try:
+        job = gerenciador.obter(job_id)
+    except Exception as e:
+        logger.warning("Job %s: falha lendo %s: %s", job_id, JOBS_TABELA, e)
+        return {"erro": "estado do job indisponível"}, 503
+    if job is None:
+        return {"erro": "job não encontrado"}, 404
+    return job.como_dict()
+
+
+@jobs_bp.route('/api/jobs')
+def status_jobs():
+    return gerenciador.estatisticas()
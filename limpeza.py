@@ -0,0 +1,172 @@
+# limpeza.py
+"""
+Varredor de arquivos temporários órfãos do assinador.
+
+Cada assinatura usa um diretório `jsign_*` só seu (assinador.assinar_pdf),
+removido logo depois da leitura; o que sobra é resto de processo morto no
+meio do caminho, ou os `tmp*_signed.pdf` que a versão antiga (saída no
+diretório do JSignPdf + glob) deixava para trás.
+
+Uma thread por processo varre, a cada LIMPEZA_INTERVALO segundos, o
+diretório temporário, ASSINADOR_TMPDIR, a pasta do app e o cwd (sem
+recursão) e apaga o que tiver mais de LIMPEZA_IDADE segundos:
+  - arquivos tmp*_signed.pdf
+  - diretórios jsign_*
+Bytes recuperados e o que sobrou na última passada ficam em
+`estatisticas_limpeza()` (GET /api/limpeza, e o /metrics lê dali).
+"""
+import os, fnmatch, shutil, tempfile, threading, time, logging
+
+from assinador import ASSINADOR_TMPDIR
+
+LIMPEZA_INTERVALO = float(os.getenv("LIMPEZA_INTERVALO", "600"))
+LIMPEZA_IDADE = float(os.getenv("LIMPEZA_IDADE", "3600"))
+
+ARQUIVOS = ("tmp*_signed.pdf",)
+DIRETORIOS = ("jsign_*",)
+
+logger = logging.getLogger(__name__)
+
+
+def _diretorios():
+    vistos, out = set(), []
+    for d in (tempfile.gettempdir(), ASSINADOR_TMPDIR,
+              os.path.dirname(os.path.abspath(__file__)), os.getcwd()):
+        if not d or not os.path.isdir(d):
+            continue
+        real = os.path.realpath(d)
+        if real not in vistos:
+            vistos.add(real)
+            out.append(real)
+    return out
+
+
+def _tamanho_dir(caminho):
+    total = 0
+    for raiz, _, arquivos in os.walk(caminho):
+        for nome in arquivos:
+            try:
+                total += os.path.getsize(os.path.join(raiz, nome))
+            except OSError:
+                pass
+    return total
+
+
+def varrer(idade: float = LIMPEZA_IDADE):
+    """Uma passada: {"arquivos", "diretorios", "bytes", "erros", "tempo_ms", "restantes"}.
+    `restantes` conta os temporários que ficaram depois da passada ({"arquivos",
+    "diretorios", "antigos"}); `antigos` são os mais velhos que `idade` que não
+    deu para apagar (vazados)."""
+    inicio = time.perf_counter()
+    limite = time.time() - idade
+    res = {"arquivos": 0, "diretorios": 0, "bytes": 0, "erros": 0}
+    restantes = {"arquivos": 0, "diretorios": 0, "antigos": 0}
+    for pasta in _diretorios():
+        try:
+            entradas = list(os.scandir(pasta))
+        except OSError:
+            continue
+        for e in entradas:
+            try:
+                if e.is_symlink():
+                    continue
+                if e.is_file() and any(fnmatch.fnmatch(e.name, p) for p in ARQUIVOS):
+                    tipo = "arquivos"
+                elif e.is_dir() and any(fnmatch.fnmatch(e.name, p) for p in DIRETORIOS):
+                    tipo = "diretorios"
+                else:
+                    continue
+                st = e.stat()
+            except OSError:
+                continue
+            if st.st_mtime >= limite:
+                restantes[tipo] += 1
+                continue
+            try:
+                if tipo == "arquivos":
+                    os.remove(e.path)
+                    res["bytes"] += st.st_size
+                else:
+                    tamanho = _tamanho_dir(e.path)
+                    shutil.rmtree(e.path)
+                    res["bytes"] += tamanho
+                res[tipo] += 1
+            except OSError as err:
+                res["erros"] += 1
+                restantes[tipo] += 1
+                restantes["antigos"] += 1
+                logger.debug("[LIMPEZA] %s: %s", e.path, err)
+    res["tempo_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+    res["restantes"] = restantes
+    return res
+
+
+class Varredor:
+    def __init__(self, intervalo: float = LIMPEZA_INTERVALO, idade: float = LIMPEZA_IDADE):
+        self.intervalo = intervalo
+        self.idade = idade
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        self._stats = {"passadas": 0, "arquivos": 0, "diretorios": 0, "bytes": 0, "erros": 0,
+                       "ultima": None, "ultima_em": None}
+
+    def iniciar(self):
+        """Sobe a thread neste processo (uma vez por pid; chamar depois do fork)."""
+        if self.intervalo <= 0:
+            return False
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return False
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._loop, name="limpeza", daemon=True)
+            self._thread.start()
+        return True
+
+    def _loop(self):
+        while True:
+            self.executar()
+            time.sleep(self.intervalo)
+
+    def executar(self):
+        try:
+            res = varrer(self.idade)
+        except Exception as e:
+            logger.warning("[LIMPEZA] varredura falhou: %s", e)
+            return None
+        with self._lock:
+            st = self._stats
+            st["passadas"] += 1
+            for k in ("arquivos", "diretorios", "bytes", "erros"):
+                st[k] += res[k]
+            st["ultima"] = res
+            st["ultima_em"] = time.time()
+        if res["arquivos"] or res["diretorios"]:
+            logger.info("[LIMPEZA] removidos %s arquivo(s) e %s diretório(s), %s bytes recuperados",
+                        res["arquivos"], res["diretorios"], res["bytes"])
+        return res
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "intervalo": self.intervalo,
+                "idade": self.idade,
+                "ativo": bool(self._thread and self._thread.is_alive() and self._pid == os.getpid()),
+                "diretorios_varridos": _diretorios(),
+                **self._stats,
+            }
+
+
+_varredor = Varredor()
+
+
+def iniciar_varredor():
+    return _varredor.iniciar()
+
+
+def varrer_agora():
+    return _varredor.executar()
+
+
+def estatisticas_limpeza():
+    return _varredor.estatisticas()
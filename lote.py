@@ -0,0 +1,129 @@
+# lote.py
+"""
+Geração em lote: vários documentos do mesmo tipo numa chamada só.
+
+POST /api/gerar-<tipo>/batch aceita
+- um array JSON de payloads,
+- {"padrao": {...campos comuns...}, "itens": [...]}, ou
+- NDJSON (um payload por linha, Content-Type application/x-ndjson).
+
+Campos de "padrao" (ex.: medico_id) valem para todos os itens. Os perfis dos
+médicos do lote são carregados uma vez antes de começar; timbrado, rodapé e
+credencial já são compartilhados pelos caches de processo.
+
+Os itens rodam em paralelo (LOTE_WORKERS threads) e a resposta é NDJSON em
+streaming: uma linha por item, na ordem em que terminam, e uma linha final
+com o resumo.
+"""
+import os, json, time, logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from flask import Response, current_app, request, stream_with_context
+
+from perfil_medico import obter_perfil
+
+LOTE_WORKERS = int(os.getenv("LOTE_WORKERS", "4"))
+LOTE_MAX_ITENS = int(os.getenv("LOTE_MAX_ITENS", "500"))
+
+logger = logging.getLogger(__name__)
+
+
+class LoteInvalido(ValueError):
+    pass
+
+
+def ler_itens():
+    """Lista de payloads do corpo da requisição (JSON ou NDJSON)."""
+    bruto = request.get_data(cache=False, as_text=True) or ""
+    tipo = (request.mimetype or "").lower()
+    if "ndjson" in tipo or "jsonlines" in tipo:
+        itens = []
+        for n, linha in enumerate(bruto.splitlines(), 1):
+            if linha.strip():
+                try:
+                    itens.append(json.loads(linha))
+                except ValueError:
+                    raise LoteInvalido(f"linha {n} não é JSON válido")
+        padrao = {}
+    else:
+        try:
+            corpo = json.loads(bruto) if bruto.strip() else None
+        except ValueError:
+            raise LoteInvalido("JSON inválido")
+        if isinstance(corpo, list):
+            itens, padrao = corpo, {}
+        elif isinstance(corpo, dict) and isinstance(corpo.get("itens"), list):
+            itens, padrao = corpo["itens"], corpo.get("padrao") or {}
+        else:
+            raise LoteInvalido("Envie um array de itens, {\"itens\": [...]} ou NDJSON")
+
+    if not itens:
+        raise LoteInvalido("Lote vazio")
+    if len(itens) > LOTE_MAX_ITENS:
+        raise LoteInvalido(f"Lote com {len(itens)} itens (máximo {LOTE_MAX_ITENS})")
+    if not all(isinstance(i, dict) for i in itens):
+        raise LoteInvalido("Todo item precisa ser um objeto JSON")
+    return [{**padrao, **i} for i in itens]
+
+
+def _processar_item(app, indice, item, preparar, produzir, base_url):
+    inicio = time.perf_counter()
+    with app.app_context():
+        try:
+            ctx, erro = preparar(item)
+            if erro:
+                corpo, status = erro
+                return {"indice": indice, "status": "erro", "http_status": status,
+                        "erro": corpo.get("erro") if isinstance(corpo, dict) else str(corpo)}
+            ctx["base_url"] = base_url
+            res = produzir(ctx)
+        except Exception as e:
+            logger.exception("Item %s do lote falhou", indice)
+            return {"indice": indice, "status": "erro", "http_status": 500, "erro": str(e)}
+    out = {"indice": indice, "status": "ok"}
+    out.update({k: v for k, v in (res or {}).items() if k not in ("pdf_bytes", "nome_download")})
+    out["tempo_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+    return out
+
+
+def responder_lote(tipo, preparar, produzir, base_url):
+    """Resposta NDJSON em streaming para o lote da requisição atual."""
+    try:
+        itens = ler_itens()
+    except LoteInvalido as e:
+        return {"erro": str(e)}, 400
+
+    # aquece o cache de perfil uma vez por médico do lote
+    for mid in {i.get("medico_id") for i in itens if i.get("medico_id")}:
+        try:
+            obter_perfil(int(mid))
+        except (TypeError, ValueError):
+            pass
+
+    app = current_app._get_current_object()
+
+    def gerar():
+        inicio = time.perf_counter()
+        ok = falhas = 0
+        executor = ThreadPoolExecutor(max_workers=max(1, min(LOTE_WORKERS, len(itens))),
+                                      thread_name_prefix=f"lote-{tipo.lower()}")
+        try:
+            futuros = [executor.submit(_processar_item, app, n, item, preparar, produzir, base_url)
+                       for n, item in enumerate(itens)]
+            for fut in as_completed(futuros):
+                res = fut.result()
+                if res["status"] == "ok":
+                    ok += 1
+                else:
+                    falhas += 1
+                yield json.dumps(res, ensure_ascii=False, default=str) + "\n"
+            yield json.dumps({"resumo": {
+                "tipo": tipo, "itens": len(itens), "ok": ok, "erros": falhas,
+                "tempo_ms": round((time.perf_counter() - inicio) * 1000, 1),
+            }}, ensure_ascii=False) + "\n"
+        finally:
+            # cliente desconectou: não começa o que ainda não saiu da fila
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    return Response(stream_with_context(gerar()), mimetype="application/x-ndjson",
+                    headers={"X-Accel-Buffering": "no", "Cache-Control": "no-cache"})
@@ -0,0 +1,222 @@
+# metricas.py
+"""
+GET /metrics no formato texto do Prometheus (sem dependência nova: o texto
+é montado aqui a partir dos `estatisticas_*()` que cada módulo já tem).
+
+- histogramas por tipo de documento e etapa do pipeline (pipeline.py):
+  persistir, perfil, layout, rodape, render, assinar, gravar, responder
+- assinador: processos do pool ocupados/vivos, fila de lotes, tempo por backend
+- pool do MySQL: conexões em uso, esperas e tempo esperando
+- caches (perfis, rodapés, timbrados, timbrados PDF, credenciais, páginas
+  de validação, hashes de download): hits, misses, itens
+- jobs assíncronos, armazenamento, downloads
+- temporários do assinador que sobraram na última passada do varredor e os
+  já removidos por ele (sem varrer o disco a cada scrape)
+
+Os contadores são por processo: com vários workers do gunicorn cada scrape
+cai num deles. Para somar, o Prometheus deve raspar cada worker (ou usar
+GUNICORN_WORKERS=1 por container e escalar containers).
+"""
+import os
+
+from flask import Blueprint, current_app
+
+from pipeline import estatisticas_pipeline
+from assinador import status_pool
+from db import estatisticas_pool
+from perfil_medico import estatisticas_perfis
+from rodape import estatisticas_rodapes
+from utils import estatisticas_timbrados
+from papel_timbrado import estatisticas_forms
+from validacao import estatisticas_validacao
+from entrega import estatisticas_entrega
+from armazenamento import estatisticas_armazenamento
+from limpeza import estatisticas_limpeza
+from jobs import gerenciador
+
+PREFIXO = (os.getenv("METRICAS_PREFIXO") or "medicos").strip("_")
+
+metricas_bp = Blueprint('metricas', __name__)
+
+
+def _rotulos(rotulos: dict) -> str:
+    if not rotulos:
+        return ""
+    partes = []
+    for k, v in rotulos.items():
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        partes.append(f'{k}="{v}"')
+    return "{" + ",".join(partes) + "}"
+
+
+def _numero(v) -> str:
+    if v is None:
+        return "NaN"
+    if isinstance(v, bool):
+        return "1" if v else "0"
+    if isinstance(v, int):
+        return str(v)
+    return repr(float(v))
+
+
+class Exposicao:
+    """Acumula famílias de métricas e gera o texto (um # HELP/# TYPE por família)."""
+
+    def __init__(self, prefixo: str = PREFIXO):
+        self.prefixo = prefixo
+        self._familias = {}     # nome -> (tipo, ajuda, [linhas])
+
+    def _familia(self, nome, tipo, ajuda):
+        nome = f"{self.prefixo}_{nome}"
+        if nome not in self._familias:
+            self._familias[nome] = (tipo, ajuda, [])
+        return nome, self._familias[nome][2]
+
+    def gauge(self, nome, ajuda, valor, **rotulos):
+        nome, linhas = self._familia(nome, "gauge", ajuda)
+        linhas.append(f"{nome}{_rotulos(rotulos)} {_numero(valor)}")
+
+    def contador(self, nome, ajuda, valor, **rotulos):
+        nome, linhas = self._familia(nome + "_total", "counter", ajuda)
+        linhas.append(f"{nome}{_rotulos(rotulos)} {_numero(valor or 0)}")
+
+    def resumo(self, nome, ajuda, soma, contagem, **rotulos):
+        nome, linhas = self._familia(nome, "summary", ajuda)
+        linhas.append(f"{nome}_sum{_rotulos(rotulos)} {_numero(soma or 0.0)}")
+        linhas.append(f"{nome}_count{_rotulos(rotulos)} {_numero(contagem or 0)}")
+
+    def histograma(self, nome, ajuda, buckets, soma, contagem, **rotulos):
+        """`buckets`: [(limite, acumulado), ...] sem o +Inf."""
+        nome, linhas = self._familia(nome, "histogram", ajuda)
+        for limite, acumulado in buckets:
+            linhas.append(f"{nome}_bucket{_rotulos({**rotulos, 'le': _numero(limite)})} {_numero(acumulado)}")
+        linhas.append(f"{nome}_bucket{_rotulos({**rotulos, 'le': '+Inf'})} {_numero(contagem)}")
+        linhas.append(f"{nome}_sum{_rotulos(rotulos)} {_numero(soma)}")
+        linhas.append(f"{nome}_count{_rotulos(rotulos)} {_numero(contagem)}")
+
+    def texto(self) -> str:
+        out = []
+        for nome, (tipo, ajuda, linhas) in self._familias.items():
+            out.append(f"# HELP {nome} {ajuda}")
+            out.append(f"# TYPE {nome} {tipo}")
+            out.extend(linhas)
+        return "\n".join(out) + "\n"
+
+
+# -------------------- coleta --------------------
+def _pipeline(m: Exposicao):
+    st = estatisticas_pipeline()
+    for tipo, etapas in st["etapas"].items():
+        for etapa, e in etapas.items():
+            buckets = [(int(limite) / 1000.0, n) for limite, n in e["buckets"].items() if limite != "+Inf"]
+            m.histograma("etapa_duracao_segundos", "Duração de cada etapa do pipeline de documentos",
+                         buckets, e["soma_ms"] / 1000.0, e["n"], tipo=tipo, etapa=etapa)
+    for tipo, d in st["documentos"].items():
+        m.contador("documentos_gerados", "Documentos gerados (PDF gravado)", d["gerados"], tipo=tipo)
+        m.contador("documentos_assinados", "Documentos com assinatura digital", d["assinados"], tipo=tipo)
+        m.contador("documentos_falhas_assinatura", "Assinaturas que falharam (PDF sai sem rodapé digital)",
+                   d["falhas_assinatura"], tipo=tipo)
+        m.contador("documentos_erros", "Documentos que não chegaram a ser gravados", d["erros"], tipo=tipo)
+
+
+def _assinador(m: Exposicao):
+    st = status_pool()
+    oc = st["ocupacao"]
+    m.gauge("assinador_processos", "Processos JSignPdf do pool neste worker", oc["processos"])
+    m.gauge("assinador_processos_ocupados", "Processos JSignPdf assinando agora", oc["ocupados"])
+    m.gauge("assinador_processos_vivos", "Processos JSignPdf vivos", oc["vivos"])
+    m.contador("assinador_reinicios", "Reinícios de processos JSignPdf",
+               sum(p["reinicios"] for p in st["processos"]))
+    fila = st["fila"]
+    m.gauge("assinador_fila_aguardando", "Pedidos esperando o próximo lote de assinatura", fila["aguardando"])
+    m.contador("assinador_lotes", "Lotes enviados ao assinador", fila["lotes"])
+    for backend, b in st["backends"].items():
+        m.resumo("assinatura_duracao_segundos", "Tempo de assinatura por backend",
+                 b["total_ms"] / 1000.0, b["assinaturas"], backend=backend)
+        m.contador("assinatura_falhas", "Falhas de assinatura por backend", b["falhas"], backend=backend)
+
+
+def _banco(m: Exposicao):
+    st = estatisticas_pool()
+    m.gauge("db_pool_tamanho", "Tamanho máximo do pool MySQL", st["tamanho"])
+    m.gauge("db_pool_abertas", "Conexões MySQL abertas", st["abertas"])
+    m.gauge("db_pool_em_uso", "Conexões MySQL em uso", st["em_uso"])
+    m.contador("db_pool_checkouts", "Conexões entregues pelo pool", st["checkouts"])
+    m.contador("db_pool_esperas", "Checkouts que esperaram por conexão livre", st["esperas"])
+    m.contador("db_pool_timeouts", "Checkouts que desistiram (PoolEsgotado)", st["timeouts"])
+    m.contador("db_pool_espera_segundos", "Tempo total esperando conexão", st["espera_total_ms"] / 1000.0)
+
+
+def _caches(m: Exposicao):
+    def cache(nome, hits, misses, itens):
+        m.contador("cache_hits", "Acertos por cache", hits, cache=nome)
+        m.contador("cache_misses", "Faltas por cache", misses, cache=nome)
+        m.gauge("cache_itens", "Itens em cada cache", itens, cache=nome)
+
+    p = estatisticas_perfis()
+    cache("perfis", p["hits"], p["misses"], p["itens"])
+    r = estatisticas_rodapes()
+    cache("rodapes", r["hits"], r["misses"], r["blocos"])
+    t = estatisticas_timbrados()
+    cache("timbrados", t["hits"], t["misses"], t["itens"])
+    m.gauge("timbrados_bytes", "Memória dos timbrados rasterizados", t["bytes"])
+    f = estatisticas_forms()
+    cache("timbrados_pdf", f["hits"], f["misses"], f["itens"])
+    c = status_pool()["credenciais"]
+    cache("credenciais", c["hits"], c["misses"], c["itens"])
+    v = estatisticas_validacao()
+    cache("validacao", v["hits"], v["misses"], v["itens"])
+    e = estatisticas_entrega()
+    cache("hashes_download", e["hash_cache"], e["hash_calculado"], e["hashes_em_cache"])
+
+
+def _entrega(m: Exposicao):
+    e = estatisticas_entrega()
+    for resultado in ("nginx", "flask", "nao_modificado", "nao_encontrado"):
+        m.contador("downloads", "Downloads de PDF por resultado", e[resultado], resultado=resultado)
+    a = estatisticas_armazenamento()
+    m.contador("armazenamento_gravados", "PDFs gravados", a["gravados"])
+    m.contador("armazenamento_deduplicados", "PDFs que já existiam (mesmo hash)", a["deduplicados"])
+    m.contador("armazenamento_bytes", "Bytes gravados", a["bytes"])
+
+
+def _jobs(m: Exposicao):
+    j = gerenciador.estatisticas()
+    m.gauge("jobs_aguardando", "Jobs na fila", j["aguardando"])
+    m.gauge("jobs_executando", "Jobs em execução", j["executando"])
+    for status in ("submetidos", "concluidos", "erros", "rejeitados"):
+        m.contador("jobs", "Jobs por desfecho", j[status], status=status)
+
+
+def _temporarios(m: Exposicao):
+    lz = estatisticas_limpeza()
+    if lz["ultima"] is not None:
+        # contagem da última passada; sem varredor (LIMPEZA_INTERVALO=0) os gauges não saem
+        o = lz["ultima"]["restantes"]
+        m.gauge("temporarios", "Temporários do assinador na última passada do varredor", o["arquivos"], tipo="arquivo")
+        m.gauge("temporarios", "Temporários do assinador na última passada do varredor", o["diretorios"], tipo="diretorio")
+        m.gauge("temporarios_orfaos", "Temporários mais velhos que LIMPEZA_IDADE que o varredor não apagou", o["antigos"])
+        m.gauge("limpeza_ultima_passada", "Epoch da última passada do varredor", lz["ultima_em"])
+    m.contador("limpeza_removidos", "Temporários removidos pelo varredor", lz["arquivos"], tipo="arquivo")
+    m.contador("limpeza_removidos", "Temporários removidos pelo varredor", lz["diretorios"], tipo="diretorio")
+    m.contador("limpeza_bytes", "Bytes recuperados pelo varredor", lz["bytes"])
+
+
+COLETORES = (_pipeline, _assinador, _banco, _caches, _entrega, _jobs, _temporarios)
+
+
+def gerar_metricas() -> str:
+    m = Exposicao()
+    m.gauge("processo_pid", "PID do worker que respondeu este scrape", os.getpid())
+    for coletor in COLETORES:
+        try:
+            coletor(m)
+        except Exception as e:
+            # uma fonte quebrada não derruba o scrape inteiro
+            current_app.logger.warning("[METRICAS] %s falhou: %s", coletor.__name__, e)
+    return m.texto()
+
+
+@metricas_bp.route('/metrics')
+def metrics():
+    return current_app.response_class(gerar_metricas(), mimetype="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,11 @@
+-- 001: hash e tamanho do PDF assinado (armazenamento.atualizar_registro)
+-- Colunas opcionais: sem elas o app continua gravando só pdf_assinado_path.
+-- Uma coluna por comando: se uma já existir, ferramentas/migrar.py pula só ela.
+ALTER TABLE receitas ADD COLUMN pdf_sha256 CHAR(64) NULL;
+ALTER TABLE receitas ADD COLUMN pdf_tamanho INT NULL;
+ALTER TABLE atestados ADD COLUMN pdf_sha256 CHAR(64) NULL;
+ALTER TABLE atestados ADD COLUMN pdf_tamanho INT NULL;
+ALTER TABLE declaracoes ADD COLUMN pdf_sha256 CHAR(64) NULL;
+ALTER TABLE declaracoes ADD COLUMN pdf_tamanho INT NULL;
+ALTER TABLE pedidos_exames ADD COLUMN pdf_sha256 CHAR(64) NULL;
+ALTER TABLE pedidos_exames ADD COLUMN pdf_tamanho INT NULL;
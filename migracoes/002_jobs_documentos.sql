@@ -0,0 +1,14 @@
+-- 002: estado dos jobs assíncronos (jobs.py), visível a todos os workers do gunicorn
+-- Sem esta tabela o modo assíncrono só é aceito com um processo (JOBS_PROCESSOS=1).
+CREATE TABLE IF NOT EXISTS jobs_documentos (
+    id CHAR(32) NOT NULL PRIMARY KEY,
+    tipo VARCHAR(32) NOT NULL,
+    status VARCHAR(16) NOT NULL,
+    documento_id BIGINT NULL,
+    resultado TEXT NULL,
+    erro TEXT NULL,
+    criado_em DOUBLE NOT NULL,
+    iniciado_em DOUBLE NULL,
+    concluido_em DOUBLE NULL,
+    KEY idx_jobs_documentos_concluido (concluido_em)
+);
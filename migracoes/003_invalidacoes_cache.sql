@@ -0,0 +1,11 @@
+-- 003: invalidações de cache publicadas para todos os workers (invalidacao.py)
+-- Sem esta tabela cada worker só vê a invalidação que ele mesmo recebeu.
+CREATE TABLE IF NOT EXISTS invalidacoes_cache (
+    id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    cache VARCHAR(32) NOT NULL,
+    medico_id INT NULL,
+    tipo VARCHAR(32) NULL,
+    documento_id BIGINT NULL,
+    criado_em DOUBLE NOT NULL,
+    KEY idx_invalidacoes_cache_criado (criado_em)
+);
@@ -0,0 +1,3 @@
+-- 004: médico que emitiu o pedido de exames (validacao do QR confere o ?mid= com ele)
+-- Pedidos antigos ficam com NULL: a página sai sem a imagem da assinatura e fora do cache.
+ALTER TABLE pedidos_exames ADD COLUMN medico_id INT NULL;
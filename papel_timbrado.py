@@ -0,0 +1,169 @@
+# papel_timbrado.py
+"""
+Papel timbrado vetorial, compartilhado por receita, atestado, declaração e pedido.
+
+Cada PDF de `papeis_timbrados` é lido uma única vez por processo; a primeira
+página vira um Form XObject (conteúdo + recursos), com rotação normalizada
+e escala para o tamanho da página do documento. Em cada documento o XObject
+é gravado uma vez e desenhado por baixo de todas as páginas
+(`q /FxTimbrado Do Q`), sem rasterizar nada.
+
+Timbrados PNG/JPG continuam no cache de imagens de utils.py. Com
+TIMBRADO_MODO=raster, os PDFs também voltam a ser rasterizados.
+"""
+import os, io, threading
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import (
+    ArrayObject, DecodedStreamObject, DictionaryObject, FloatObject, NameObject, NumberObject,
+)
+
+TIMBRADO_MODO = (os.getenv("TIMBRADO_MODO") or "vetorial").strip().lower()   # vetorial | raster
+TIMBRADO_VETORIAL = TIMBRADO_MODO != "raster"
+
+_NOME_XOBJ = NameObject("/FxTimbrado")
+
+_forms = {}
+_forms_lock = threading.Lock()
+_forms_stats = {"hits": 0, "misses": 0}
+
+
+def _mult(m1, m2):
+    """Composição de matrizes PDF [a b c d e f]: aplica m1 e depois m2."""
+    a1, b1, c1, d1, e1, f1 = m1
+    a2, b2, c2, d2, e2, f2 = m2
+    return (
+        a1 * a2 + b1 * c2, a1 * b2 + b1 * d2,
+        c1 * a2 + d1 * c2, c1 * b2 + d1 * d2,
+        e1 * a2 + f1 * c2 + e2, e1 * b2 + f1 * d2 + f2,
+    )
+
+
+class _FormTimbrado:
+    """Primeira página de um timbrado PDF, pronta para virar Form XObject."""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.reader = PdfReader(caminho)   # mantém vivos os objetos indiretos dos recursos
+        page = self.reader.pages[0]
+        conteudo = page.get_contents()
+        self.conteudo = conteudo.get_data() if conteudo is not None else b""
+        recursos = page.get("/Resources")
+        self.recursos = recursos.get_object() if recursos is not None else DictionaryObject()
+        mb = page.mediabox
+        self.bbox = (float(mb.left), float(mb.bottom), float(mb.right), float(mb.top))
+        try:
+            self.rotacao = (int(page.get("/Rotate", 0)) or 0) % 360
+        except Exception:
+            self.rotacao = 0
+        self._lock = threading.Lock()
+
+    def matriz(self, largura, altura):
+        """Matriz que leva o timbrado (já "desrotacionado") para largura x altura."""
+        x0, y0, x1, y1 = self.bbox
+        bw, bh = x1 - x0, y1 - y0
+        m = (1, 0, 0, 1, -x0, -y0)
+        if self.rotacao == 90:
+            m = _mult(m, (0, -1, 1, 0, 0, bw)); vw, vh = bh, bw
+        elif self.rotacao == 180:
+            m = _mult(m, (-1, 0, 0, -1, bw, bh)); vw, vh = bw, bh
+        elif self.rotacao == 270:
+            m = _mult(m, (0, 1, -1, 0, bh, 0)); vw, vh = bh, bw
+        else:
+            vw, vh = bw, bh
+        return _mult(m, (largura / vw, 0, 0, altura / vh, 0, 0))
+
+    def como_xobject(self, writer, largura, altura):
+        form = DecodedStreamObject()
+        form.set_data(self.conteudo)
+        # clone() consulta o reader de origem; serializa o acesso entre threads
+        with self._lock:
+            recursos = self.recursos.clone(writer)
+        form.update({
+            NameObject("/Type"): NameObject("/XObject"),
+            NameObject("/Subtype"): NameObject("/Form"),
+            NameObject("/FormType"): NumberObject(1),
+            NameObject("/BBox"): ArrayObject([FloatObject(v) for v in self.bbox]),
+            NameObject("/Matrix"): ArrayObject([FloatObject(v) for v in self.matriz(largura, altura)]),
+            NameObject("/Resources"): recursos,
+        })
+        return writer._add_object(form)
+
+
+def _obter_form(caminho):
+    chave = (caminho, os.path.getmtime(caminho))
+    with _forms_lock:
+        form = _forms.get(chave)
+        if form is not None:
+            _forms_stats["hits"] += 1
+            return form
+        _forms_stats["misses"] += 1
+    form = _FormTimbrado(caminho)
+    with _forms_lock:
+        # versões antigas do mesmo arquivo saem do cache
+        for k in [k for k in _forms if k[0] == caminho]:
+            del _forms[k]
+        _forms[chave] = form
+    return form
+
+
+def eh_timbrado_pdf(caminho) -> bool:
+    return bool(caminho) and (os.path.splitext(caminho)[1] or "").lower() == ".pdf"
+
+
+def carimbar_timbrado(reader, writer, caminho):
+    """Adiciona as páginas de `reader` em `writer` com o timbrado por baixo."""
+    form = _obter_form(caminho)
+    refs = {}
+    for page in reader.pages:
+        largura, altura = float(page.mediabox.width), float(page.mediabox.height)
+        pg = writer.add_page(page)
+        ref = refs.get((largura, altura))
+        if ref is None:
+            ref = refs[(largura, altura)] = form.como_xobject(writer, largura, altura)
+
+        recursos = pg.get("/Resources")
+        if recursos is None:
+            recursos = DictionaryObject()
+            pg[NameObject("/Resources")] = recursos
+        recursos = recursos.get_object()
+        xobjs = recursos.get("/XObject")
+        if xobjs is None:
+            xobjs = DictionaryObject()
+            recursos[NameObject("/XObject")] = xobjs
+        xobjs.get_object()[_NOME_XOBJ] = ref
+
+        fundo = DecodedStreamObject()
+        fundo.set_data(b"q /FxTimbrado Do Q\n")
+        conteudos = [writer._add_object(fundo)]
+        atual = pg.get("/Contents")
+        if atual is not None:
+            if isinstance(atual.get_object(), ArrayObject):
+                conteudos.extend(atual.get_object())
+            else:
+                conteudos.append(atual)
+        pg[NameObject("/Contents")] = ArrayObject(conteudos)
+
+
+def aplicar_timbrado(pdf_bytes: bytes, caminho) -> bytes:
+    """Carimba o timbrado PDF `caminho` sob todas as páginas de `pdf_bytes`."""
+    if not TIMBRADO_VETORIAL or not eh_timbrado_pdf(caminho) or not os.path.isfile(caminho):
+        return pdf_bytes
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    writer = PdfWriter()
+    carimbar_timbrado(reader, writer, caminho)
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def precarregar_timbrado(caminho) -> bool:
+    """Deixa o Form XObject do timbrado pronto no cache (aquecimento antes do fork)."""
+    if not TIMBRADO_VETORIAL or not eh_timbrado_pdf(caminho) or not os.path.isfile(caminho):
+        return False
+    _obter_form(caminho)
+    return True
+
+
+def estatisticas_forms():
+    with _forms_lock:
+        return {**_forms_stats, "itens": len(_forms)}
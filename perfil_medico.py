@@ -0,0 +1,275 @@
+# perfil_medico.py
+"""
+Perfil do médico para geração de documentos, carregado com UMA consulta.
+
+Antes cada documento fazia 4-5 idas ao banco (medicos, conselho,
+papeis_timbrados, preferencias_papel_medico, clinica_config). Agora
+`obter_perfil()` junta tudo num único SELECT e guarda o resultado por
+medico_id durante PERFIL_CACHE_TTL segundos. Quais tabelas entram no JOIN
+e os papéis padrão da clinica_config vêm do snapshot de esquema.py.
+
+Quando o admin da clínica muda cadastro/papel/timbrado, basta chamar
+`invalidar_perfis(medico_id)` (rota POST /api/medicos/perfil/invalidar).
+O cache é por processo: a invalidação chega aos outros workers do gunicorn
+por invalidacao.py, em até INVALIDACAO_INTERVALO s; sem a tabela
+invalidacoes_cache, eles seguem com o perfil velho até PERFIL_CACHE_TTL.
+"""
+import os, threading, time, logging
+
+from db import conectar
+from esquema import esquema, papel_valido
+from invalidacao import registrar_invalidador, publicar_invalidacao
+
+# por processo; outros workers: ver invalidacao.py (sem a tabela, até o TTL de atraso)
+PERFIL_CACHE_TTL = float(os.getenv("PERFIL_CACHE_TTL", "300"))
+
+logger = logging.getLogger(__name__)
+
+
+def _sql_perfil(esq):
+    """SELECT único; tabelas opcionais ausentes viram NULL (decidido pelo snapshot, não por query)."""
+    tem = esq.tem_tabela
+    campos = [
+        "COALESCE(m.certificado_path,''), COALESCE(m.certificado_senha,'')",
+        "COALESCE(m.assinatura_img_path,''), COALESCE(m.crm,''), COALESCE(m.nome,'')",
+        "c.tipo, c.codigo, c.uf" if tem("conselho") else "NULL, NULL, NULL",
+        "pt.tamanho, pt.caminho" if tem("papeis_timbrados") else "NULL, NULL",
+        "pp.doc_tipo, pp.tamanho_padrao" if tem("preferencias_papel_medico") else "NULL, NULL",
+    ]
+    joins = []
+    if tem("conselho"):
+        joins.append("LEFT JOIN conselho c"
+                     " ON c.id = (SELECT MAX(c2.id) FROM conselho c2 WHERE c2.medico_id = m.id)")
+    if tem("papeis_timbrados"):
+        joins.append("LEFT JOIN papeis_timbrados pt ON pt.medico_id = m.id AND pt.ativo = 1")
+    if tem("preferencias_papel_medico"):
+        joins.append("LEFT JOIN preferencias_papel_medico pp ON pp.medico_id = m.id")
+    return ("SELECT " + ",\n       ".join(campos) +
+            "\n  FROM medicos m\n  " + "\n  ".join(joins) + "\n WHERE m.id = %s")
+
+
+# fallback se o JOIN falhar (ex.: snapshot do esquema desatualizado)
+_SQL_SO_MEDICO = """
+    SELECT
+        COALESCE(certificado_path,''), COALESCE(certificado_senha,''),
+        COALESCE(assinatura_img_path,''), COALESCE(crm,''), COALESCE(nome,'')
+      FROM medicos WHERE id = %s
+"""
+
+
+def _clean(s):
+    if s is None:
+        return None
+    return str(s).strip().replace('\x00', '')
+
+
+def _clean_path(p):
+    if not p:
+        return None
+    return str(p).strip().strip('"').replace('\r', '').replace('\n', '')
+
+
+# -------------------- conselho --------------------
+# também usados pelas páginas de validação (validacao.py), que trazem
+# tipo/codigo/uf no próprio SELECT do documento
+def normalizar_conselho(tipo, codigo, uf):
+    """(tipo, codigo, uf) normalizado, ou None se não houver registro."""
+    if not (tipo or codigo):
+        return None
+    return ((tipo or '').strip().upper(), (codigo or '').strip(), (uf or '').strip().upper())
+
+
+def _conselho_ok(conselho):
+    if conselho:
+        tipo, codigo, uf = conselho
+        if tipo and codigo:
+            return tipo, codigo, uf
+    return None
+
+
+def formatar_conselho_label(conselho, crm_fallback: str = '') -> str:
+    c = _conselho_ok(conselho)
+    if c:
+        tipo, codigo, uf = c
+        return f"{tipo}-{uf} {codigo}" if uf else f"{tipo} {codigo}"
+    crm = (crm_fallback or '').strip()
+    return f"CRM {crm}" if crm else "Registro profissional"
+
+
+def formatar_conselho_rotulo(conselho, crm_fallback: str = '') -> tuple[str, str]:
+    c = _conselho_ok(conselho)
+    if c:
+        tipo, codigo, uf = c
+        return f"{tipo}: {codigo}{('-' + uf) if uf else ''}", tipo
+    crm = (crm_fallback or '').strip()
+    return f"CRM: {crm}", "CRM"
+
+
+class MedicoProfile:
+    """Tudo que os geradores precisam saber do médico para montar o documento."""
+
+    def __init__(self, medico_id: int, existe: bool = False):
+        self.medico_id = medico_id
+        self.existe = existe
+        self.cert_path = None
+        self.cert_senha = None
+        self.assinatura_img_path = None
+        self.crm = ''
+        self.nome = ''
+        self.conselho = None            # (tipo, codigo, uf) do último registro em `conselho`
+        self.timbrados = {'A4': None, 'A5': None}
+        self.preferencias = {}          # DOC_TIPO -> 'A4' | 'A5'
+        self.carregado_em = time.monotonic()
+
+    # ---- dados básicos (mesma tupla dos helpers antigos)
+    def dados_basicos(self):
+        """(cert_path, cert_senha, assinatura_img_path, crm, nome)"""
+        return (self.cert_path, self.cert_senha, self.assinatura_img_path, self.crm, self.nome)
+
+    # ---- papel
+    def papel(self, doc_tipo: str) -> str:
+        """preferencias_papel_medico -> clinica_config -> DEFAULT_PAPER_<DOC> -> A4"""
+        doc = (doc_tipo or "").strip().upper()
+        v = self.preferencias.get(doc) or esquema().papeis_clinica.get(doc)
+        if v:
+            return v
+        return papel_valido(os.getenv(f"DEFAULT_PAPER_{doc}") or "A4") or "A4"
+
+    def timbrado(self, tamanho: str):
+        return self.timbrados.get((tamanho or "").upper())
+
+    def cfg_papel(self, doc_tipo: str):
+        """Mesmo formato do antigo `_obter_cfg_papel`."""
+        return {"padrao": self.papel(doc_tipo),
+                "a4_path": self.timbrados.get('A4'),
+                "a5_path": self.timbrados.get('A5')}
+
+    # ---- conselho
+    def conselho_label(self, crm_fallback: str = None) -> str:
+        """'CRM-SP 123' / 'CRP 1234'; fallback 'CRM <crm>' ou 'Registro profissional'."""
+        return formatar_conselho_label(self.conselho, self.crm if crm_fallback is None else crm_fallback)
+
+    def conselho_rotulo(self, crm_fallback: str = None) -> tuple[str, str]:
+        """Formato do atestado: ('CRO: 0000-RJ', 'CRO'); fallback ('CRM: <crm>', 'CRM')."""
+        return formatar_conselho_rotulo(self.conselho, self.crm if crm_fallback is None else crm_fallback)
+
+    def como_dict(self):
+        return {
+            "medico_id": self.medico_id,
+            "existe": self.existe,
+            "nome": self.nome,
+            "conselho": self.conselho_label(),
+            "timbrados": dict(self.timbrados),
+            "preferencias": dict(self.preferencias),
+            "clinica_papel": dict(esquema().papeis_clinica),
+            "tem_certificado": bool(self.cert_path),
+            "tem_assinatura_img": bool(self.assinatura_img_path),
+        }
+
+
+def _montar_perfil(medico_id, rows, completo=True) -> MedicoProfile:
+    perfil = MedicoProfile(medico_id, existe=bool(rows))
+    if not rows:
+        return perfil
+    cert, senha, assin, crm, nome = map(_clean, rows[0][:5])
+    perfil.cert_path = _clean_path(cert)
+    perfil.cert_senha = (senha or '').strip()
+    perfil.assinatura_img_path = _clean_path(assin)
+    perfil.crm = crm or ''
+    perfil.nome = nome or ''
+    if not completo:
+        return perfil
+
+    perfil.conselho = normalizar_conselho(*rows[0][5:8])
+    for row in rows:
+        tam, caminho, doc, tam_pref = row[8:12]
+        tam = papel_valido(tam)
+        if tam and caminho:
+            perfil.timbrados[tam] = _clean_path(caminho)
+        pref = papel_valido(tam_pref)
+        if doc and pref:
+            perfil.preferencias[str(doc).strip().upper()] = pref
+    return perfil
+
+
+def _carregar(medico_id: int) -> MedicoProfile:
+    conn = conectar()
+    try:
+        cur = conn.cursor()
+        try:
+            cur.execute(_sql_perfil(esquema()), (medico_id,))
+            return _montar_perfil(medico_id, cur.fetchall() or [])
+        except Exception as e:
+            # pelo menos os dados de `medicos`
+            logger.warning("Perfil completo do médico %s indisponível (%s); usando só `medicos`", medico_id, e)
+            cur.execute(_SQL_SO_MEDICO, (medico_id,))
+            return _montar_perfil(medico_id, cur.fetchall() or [], completo=False)
+        finally:
+            cur.close()
+    finally:
+        conn.close()
+
+
+class CachePerfis:
+    def __init__(self, ttl: float = PERFIL_CACHE_TTL):
+        self.ttl = ttl
+        self._itens = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def obter(self, medico_id: int) -> MedicoProfile:
+        medico_id = int(medico_id)
+        with self._lock:
+            perfil = self._itens.get(medico_id)
+            if perfil and (time.monotonic() - perfil.carregado_em) < self.ttl:
+                self.hits += 1
+                return perfil
+            self.misses += 1
+        try:
+            perfil = _carregar(medico_id)
+        except Exception as e:
+            # mesmo comportamento dos helpers antigos: perfil vazio, sem cache
+            logger.exception("Erro ao carregar perfil do médico %s: %s", medico_id, e)
+            return MedicoProfile(medico_id)
+        if perfil.existe:
+            with self._lock:
+                self._itens[medico_id] = perfil
+        return perfil
+
+    def invalidar(self, medico_id=None) -> int:
+        with self._lock:
+            if medico_id is None:
+                n = len(self._itens)
+                self._itens.clear()
+                return n
+            return 1 if self._itens.pop(int(medico_id), None) else 0
+
+    def estatisticas(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "itens": len(self._itens),
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / total) if total else None,
+            }
+
+
+_cache = CachePerfis()
+registrar_invalidador("perfis", _cache.invalidar)
+
+
+def obter_perfil(medico_id: int) -> MedicoProfile:
+    """Perfil do médico (do cache quando possível). Nunca levanta: devolve perfil vazio."""
+    return _cache.obter(medico_id)
+
+
+def invalidar_perfis(medico_id=None) -> int:
+    """Invalida neste processo e publica para os outros workers."""
+    return publicar_invalidacao("perfis", medico_id=medico_id)
+
+
+def estatisticas_perfis():
+    return _cache.estatisticas()
@@ -0,0 +1,432 @@
+# pipeline.py
+"""
+Pipeline único de geração dos documentos (receita, atestado, declaração,
+pedido de exames). Cada tipo é uma subclasse de `Documento` e só fornece
+o que é dele: leitura do JSON (`ler`), colunas do INSERT (`registro`) e o
+desenho da página (`desenhar`). O resto é igual para os quatro:
+
+    persistir   paciente + INSERT (na requisição, `preparar`)
+    perfil      MedicoProfile, papel, timbrado, certificado, conselho
+    layout      desenho no canvas (fundo + `desenhar`)
+    rodape      bloco digital (QR + assinatura-imagem), desenhado ANTES de assinar
+    render      canvas.save + timbrado vetorial
+    assinar     assinar_documento (invisível)
+    gravar      armazenamento.gravar + UPDATE do registro
+    responder   resposta HTTP do modo síncrono
+
+O rodapé digital entra no conteúdo antes da assinatura: sobrepor depois
+(PyPDF2) reescrevia o arquivo e apagava a assinatura. Só é desenhado
+quando há certificado; se a assinatura falhar o PDF é refeito sem ele.
+
+Cada etapa é cronometrada (etapa aninhada não conta duas vezes). O tempo
+vai no resultado (`etapas_ms`), numa linha de log por documento, no
+cabeçalho Server-Timing da resposta síncrona e nos histogramas por tipo
+e etapa de `estatisticas_pipeline()` (GET /api/pipeline). A resposta
+síncrona leva também X-Documento-Id (o PDF de receita/atestado não diz
+qual registro foi criado).
+"""
+import os, io, time, threading, logging
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytz
+from flask import request, send_file, make_response
+from reportlab.lib.pagesizes import A4, A5
+from reportlab.pdfgen import canvas
+
+from db import conectar
+from perfil_medico import obter_perfil
+from rodape import desenhar_rodape_digital
+from assinador import assinar_documento
+from utils import desenhar_fundo_papel, get_or_create_paciente
+from papel_timbrado import aplicar_timbrado
+from jobs import ErroGeracao, modo_assincrono, assincrono_indisponivel, enfileirar
+from lote import responder_lote
+from armazenamento import gravar, atualizar_registro
+
+TZ = pytz.timezone('America/Sao_Paulo')
+PUBLIC_BASE_URL = (os.getenv("PUBLIC_BASE_URL") or os.getenv("NGROK_URL") or "").rstrip("/")
+
+ETAPAS = ("persistir", "perfil", "layout", "rodape", "render", "assinar", "gravar", "responder")
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+logger = logging.getLogger(__name__)
+
+
+def _clean_path(p):
+    if not p:
+        return None
+    return str(p).strip().strip('"').replace('\r', '').replace('\n', '')
+
+
+def ler_inteiro(data, campo, padrao=None):
+    """(int, None) de data[campo] (ausente/vazio -> padrao) ou (None, (corpo, 400)) para os `ler`."""
+    v = data.get(campo)
+    if v is None or (isinstance(v, str) and not v.strip()):
+        return padrao, None
+    try:
+        if isinstance(v, bool):
+            raise ValueError
+        return (int(v) if isinstance(v, (int, float)) else int(str(v).strip())), None
+    except (TypeError, ValueError, OverflowError):
+        return None, ({'erro': f'{campo} inválido: {v!r} (esperado um inteiro)'}, 400)
+
+
+# -------------------- cronômetro das etapas --------------------
+class Etapas:
+    """Tempo (ms) por etapa de um documento; o tempo de uma etapa aninhada sai da de fora."""
+
+    def __init__(self, ms=None):
+        self.ms = dict(ms or {})
+        self._pilha = []
+
+    @contextmanager
+    def medir(self, nome):
+        self._pilha.append(0.0)
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            total = (time.perf_counter() - inicio) * 1000
+            filhos = self._pilha.pop()
+            self.ms[nome] = self.ms.get(nome, 0.0) + total - filhos
+            if self._pilha:
+                self._pilha[-1] += total
+
+
+def em_ordem(ms: dict) -> dict:
+    """Etapas na ordem do pipeline (a aninhada termina antes da de fora)."""
+    ordem = {e: i for i, e in enumerate(ETAPAS)}
+    return dict(sorted(ms.items(), key=lambda kv: ordem.get(kv[0], len(ordem))))
+
+
+def server_timing(ms: dict) -> str:
+    return ", ".join(f"{nome};dur={v:.1f}" for nome, v in ms.items())
+
+
+class MetricasPipeline:
+    """Contagem, soma, máximo e histograma (BUCKETS_MS) por (tipo, etapa)."""
+
+    def __init__(self, buckets=BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._etapas = {}       # (tipo, etapa) -> [n, soma, max, contagens por bucket (+ acima do último)]
+        self._documentos = {}   # tipo -> {"gerados", "assinados", "falhas_assinatura", "erros"}
+
+    def registrar(self, tipo, ms: dict):
+        with self._lock:
+            for etapa, v in ms.items():
+                item = self._etapas.get((tipo, etapa))
+                if item is None:
+                    item = self._etapas[(tipo, etapa)] = [0, 0.0, 0.0, [0] * (len(self.buckets) + 1)]
+                item[0] += 1
+                item[1] += v
+                item[2] = max(item[2], v)
+                i = 0
+                while i < len(self.buckets) and v > self.buckets[i]:
+                    i += 1
+                item[3][i] += 1
+
+    def contar(self, tipo, chave, n=1):
+        with self._lock:
+            docs = self._documentos.setdefault(
+                tipo, {"gerados": 0, "assinados": 0, "falhas_assinatura": 0, "erros": 0})
+            docs[chave] += n
+
+    def estatisticas(self):
+        with self._lock:
+            etapas = {}
+            for (tipo, etapa), (n, soma, maximo, contagens) in self._etapas.items():
+                acumulado, hist = 0, {}
+                for limite, c in zip(self.buckets, contagens):
+                    acumulado += c
+                    hist[str(limite)] = acumulado
+                hist["+Inf"] = n
+                etapas.setdefault(tipo, {})[etapa] = {
+                    "n": n, "soma_ms": round(soma, 3), "media_ms": round(soma / n, 3) if n else None,
+                    "max_ms": round(maximo, 3), "buckets": hist,
+                }
+            for tipo in etapas:
+                etapas[tipo] = em_ordem(etapas[tipo])
+            return {"etapas": etapas, "documentos": {t: dict(d) for t, d in self._documentos.items()},
+                    "buckets_ms": list(self.buckets)}
+
+
+_metricas = MetricasPipeline()
+
+
+def estatisticas_pipeline():
+    return _metricas.estatisticas()
+
+
+# -------------------- o que o layout recebe --------------------
+class Montagem:
+    """Médico, papel e certificado resolvidos para um documento + helpers de página."""
+
+    def __init__(self, documento, ctx, etapas):
+        self.documento = documento
+        self.etapas = etapas
+        self.medico_id = int(ctx["medico_id"])
+        self.perfil = obter_perfil(self.medico_id)
+        cert_path, cert_senha, assinatura_img_path, crm, nome = self.perfil.dados_basicos()
+        self.nome_medico = nome
+        self.crm = crm
+        self.conselho_label = documento.rotulo_conselho(self.perfil, crm)
+        self.assinatura_img_path = _clean_path(assinatura_img_path)
+        self.cert_path = _clean_path(cert_path)
+        self.cert_senha = str(cert_senha or "")
+        self.pode_assinar = bool(self.cert_path and os.path.isfile(self.cert_path) and self.cert_senha.strip())
+
+        self.tamanho_papel = self.perfil.papel(documento.doc_tipo)
+        self.pagesize = A5 if self.tamanho_papel == 'A5' else A4
+        self.largura, self.altura = self.pagesize
+        self.timbrado = self.perfil.timbrado(self.tamanho_papel)
+
+        self.data_emissao = ctx["data_emissao_dt"].strftime('%d/%m/%Y')
+        self.url_validacao = documento.url_validacao(ctx)
+        self.digital = False        # rodapé digital neste render (definido pelo pipeline)
+
+    def fundo(self, pdf):
+        if self.timbrado and os.path.exists(self.timbrado):
+            desenhar_fundo_papel(pdf, self.timbrado, self.largura, self.altura)
+
+    def rodape(self, pdf):
+        if not self.digital:
+            return
+        with self.etapas.medir("rodape"):
+            desenhar_rodape_digital(pdf, self.largura, self.url_validacao, self.medico_id,
+                                    self.documento.doc_tipo, self.tamanho_papel,
+                                    self.nome_medico, self.conselho_label, self.assinatura_img_path)
+
+    def nova_pagina(self, pdf):
+        """Fecha a página atual (rodapé, se o tipo põe em todas) e abre outra com o fundo."""
+        if self.documento.rodape_todas_paginas:
+            self.rodape(pdf)
+        pdf.showPage()
+        self.fundo(pdf)
+
+    def linha_assinatura_manual(self, pdf, y_linha=100):
+        pdf.setLineWidth(1)
+        cx = self.largura / 2.0
+        linha_w = 320 if self.tamanho_papel == 'A4' else 260
+        pdf.line(cx - linha_w / 2, y_linha, cx + linha_w / 2, y_linha)
+        pdf.setFont("Helvetica", 10)
+        pdf.drawCentredString(cx, y_linha - 12, "Assinatura e carimbo do médico")
+
+
+# -------------------- documento --------------------
+class Documento(ABC):
+    """Base dos quatro tipos; subclasses definem os atributos e `ler`/`desenhar`."""
+
+    doc_tipo = None             # RECEITA | ATESTADO | DECLARACAO | PEDIDO_EXAMES
+    tabela = None
+    pasta = None
+    rota_arquivos = None        # /<rota_arquivos>/<relativo> serve o PDF
+    rota_validacao = None
+    com_paciente = True         # get_or_create_paciente antes do INSERT
+    rodape_todas_paginas = False
+    nome_download = ("documento.pdf", "documento_assinado.pdf")   # (sem, com assinatura)
+
+    # ---- o que cada tipo fornece
+    @abstractmethod
+    def ler(self, data):
+        """(campos, None) ou (None, (corpo, status)). Só validação, sem banco."""
+
+    def registro(self, ctx) -> dict:
+        """Colunas do INSERT."""
+        return {
+            "medico_id": ctx["medico_id"],
+            "paciente_id": int(ctx["paciente_id"]),
+            "texto": ctx["texto"],
+            "data_emissao": ctx["data_emissao_dt"].strftime('%Y-%m-%d'),
+            "pdf_assinado_path": "TEMP",
+            "assinado_em": ctx["data_emissao_dt"].strftime('%Y-%m-%d %H:%M:%S'),
+            "status": 1,
+        }
+
+    @abstractmethod
+    def desenhar(self, pdf, ctx, m: Montagem):
+        """Conteúdo da página (fundo e rodapé ficam com a Montagem)."""
+
+    def rotulo_conselho(self, perfil, crm):
+        return perfil.conselho_label(crm)
+
+    def url_validacao(self, ctx):
+        return f"{ctx['base_url']}/{self.rota_validacao}/{ctx['documento_id']}"
+
+    def conferir(self, ctx):
+        """Checagens que dependem do perfil/banco, antes do INSERT: None ou (corpo, status)."""
+        return None
+
+    def ler_requisicao(self):
+        """JSON do corpo; None (corpo vazio ou inválido) vira 400."""
+        return request.get_json(force=True, silent=True)
+
+    def resposta(self, res):
+        """Resposta do modo síncrono (padrão: o PDF para download)."""
+        return send_file(io.BytesIO(res["pdf_bytes"] or b""), mimetype='application/pdf',
+                         as_attachment=True, download_name=res["nome_download"])
+
+    # ---- pipeline
+    def base_url(self):
+        return PUBLIC_BASE_URL if PUBLIC_BASE_URL else request.url_root.rstrip("/")
+
+    def preparar(self, data):
+        """Parte rápida (na requisição): valida, resolve paciente e cria o registro."""
+        try:
+            ctx, erro = self.ler(data)
+        except (TypeError, ValueError, OverflowError) as e:
+            # rede de segurança: campo com tipo errado que o `ler` não validou
+            return None, ({'erro': f'Campo inválido: {e}'}, 400)
+        except Exception as e:
+            logger.exception("[%s] Falha lendo a requisição", self.doc_tipo)
+            _metricas.contar(self.doc_tipo, "erros")
+            return None, ({'erro': f'Falha ao ler a requisição: {e}'}, 500)
+        if erro:
+            return None, erro
+        ctx.setdefault("data_emissao_dt", datetime.now(TZ))
+        etapas = Etapas()
+        try:
+            with etapas.medir("persistir"):
+                erro = self.conferir(ctx)
+                if erro:
+                    return None, erro
+                conn = conectar()
+                try:
+                    if self.com_paciente:
+                        ctx["paciente_id"] = get_or_create_paciente(
+                            conn, ctx["nome_paciente"], ctx["cpf_paciente"], ctx.get("nasc_sql"), ctx.get("sexo"))
+                    colunas = self.registro(ctx)
+                    cur = conn.cursor()
+                    cur.execute(f"INSERT INTO {self.tabela} ({', '.join(colunas)}) "
+                                f"VALUES ({', '.join(['%s'] * len(colunas))})", tuple(colunas.values()))
+                    ctx["documento_id"] = cur.lastrowid
+                    conn.commit()
+                    cur.close()
+                finally:
+                    conn.close()
+        except Exception as e:
+            logger.exception("[%s] Falha INSERT %s", self.doc_tipo, self.tabela)
+            _metricas.contar(self.doc_tipo, "erros")
+            return None, ({'erro': f'Falha ao salvar no banco: {e}'}, 500)
+        ctx["etapas_ms"] = etapas.ms
+        return ctx, None
+
+    def _renderizar(self, ctx, m: Montagem, etapas: Etapas, digital: bool) -> bytes:
+        m.digital = digital
+        try:
+            with etapas.medir("layout"):
+                buffer = io.BytesIO()
+                pdf = canvas.Canvas(buffer, pagesize=m.pagesize)
+                m.fundo(pdf)
+                self.desenhar(pdf, ctx, m)
+                m.rodape(pdf)
+            with etapas.medir("render"):
+                pdf.save()
+                return aplicar_timbrado(buffer.getvalue(), m.timbrado)
+        except Exception as e:
+            raise ErroGeracao(f'Falha ao gerar PDF base: {e}')
+
+    def produzir(self, ctx):
+        """Perfil, layout, rodapé, render, assinatura e gravação. Roda na requisição ou num worker (jobs.py)."""
+        documento_id = ctx["documento_id"]
+        etapas = Etapas(ctx.get("etapas_ms"))
+        try:
+            with etapas.medir("perfil"):
+                m = Montagem(self, ctx, etapas)
+
+            pdf_bytes = self._renderizar(ctx, m, etapas, digital=m.pode_assinar)
+
+            assinou = False
+            if m.pode_assinar:
+                with etapas.medir("assinar"):
+                    try:
+                        res = assinar_documento(pdf_bytes, m.cert_path, m.cert_senha,
+                                                doc_tipo=self.doc_tipo, medico_id=m.medico_id)
+                        pdf_bytes = res.pdf_bytes
+                        assinou = True
+                    except Exception as e:
+                        logger.exception("[%s] %s: assinatura digital falhou: %s", self.doc_tipo, documento_id, e)
+                if not assinou:
+                    # o rodapé digital promete uma assinatura que não houve
+                    _metricas.contar(self.doc_tipo, "falhas_assinatura")
+                    pdf_bytes = self._renderizar(ctx, m, etapas, digital=False)
+
+            with etapas.medir("gravar"):
+                try:
+                    doc = gravar(self.pasta, pdf_bytes, ctx["data_emissao_dt"])
+                except OSError as e:
+                    raise ErroGeracao(f'Falha ao gravar PDF: {e}')
+                try:
+                    conn = conectar()
+                    try:
+                        cur = conn.cursor()
+                        atualizar_registro(cur, self.tabela, documento_id, doc)
+                        conn.commit()
+                        cur.close()
+                    finally:
+                        conn.close()
+                except Exception as e:
+                    # sem o UPDATE o registro fica com o caminho TEMP/NULL: a validação não acha o PDF
+                    logger.exception("[%s] %s: UPDATE caminho PDF falhou: %s", self.doc_tipo, documento_id, e)
+                    raise ErroGeracao(f'PDF gravado ({doc.relativo}), mas falha ao atualizar {self.tabela}: {e}')
+        except Exception:
+            _metricas.contar(self.doc_tipo, "erros")
+            raise
+
+        etapas.ms = em_ordem(etapas.ms)
+        _metricas.registrar(self.doc_tipo, etapas.ms)
+        _metricas.contar(self.doc_tipo, "gerados")
+        if assinou:
+            _metricas.contar(self.doc_tipo, "assinados")
+        logger.info("[%s] %s assinado=%s %s", self.doc_tipo, documento_id, assinou,
+                    " ".join(f"{k}={v:.0f}ms" for k, v in etapas.ms.items()))
+
+        base = ctx["base_url"]
+        return {
+            "documento_id": documento_id,
+            "caminho": doc.caminho.replace('\\', '/'),
+            "url": f"{base}/{self.rota_arquivos}/{doc.relativo}",
+            "validar": m.url_validacao if assinou else None,
+            "assinado": assinou,
+            "nome_download": self.nome_download[1 if assinou else 0],
+            "etapas_ms": {k: round(v, 1) for k, v in etapas.ms.items()},
+            "pdf_bytes": pdf_bytes,
+        }
+
+    # ---- rotas
+    def gerar(self):
+        """POST /api/gerar-<tipo>: síncrono (padrão) ou `?async=1` (202 + job)."""
+        data = self.ler_requisicao()
+        if not isinstance(data, dict):
+            return {"erro": "JSON inválido ou vazio (esperado um objeto)"}, 400
+        assincrono = modo_assincrono(data)
+        if assincrono:
+            # recusa antes do INSERT, para não deixar documento sem job
+            recusa = assincrono_indisponivel()
+            if recusa:
+                return recusa
+        ctx, erro = self.preparar(data)
+        if erro:
+            return erro
+        ctx["base_url"] = self.base_url()
+
+        if assincrono:
+            return enfileirar(self.doc_tipo, self.produzir, ctx, documento_id=ctx["documento_id"])
+
+        try:
+            res = self.produzir(ctx)
+        except ErroGeracao as e:
+            return {'erro': str(e)}, 500
+        etapas = Etapas(res["etapas_ms"])
+        with etapas.medir("responder"):
+            resp = make_response(self.resposta(res))
+        _metricas.registrar(self.doc_tipo, {"responder": etapas.ms["responder"]})
+        resp.headers["Server-Timing"] = server_timing(etapas.ms)
+        resp.headers["X-Documento-Id"] = str(res["documento_id"])
+        return resp
+
+    def gerar_lote(self):
+        """POST /api/gerar-<tipo>/batch: NDJSON (ver lote.py)."""
+        return responder_lote(self.doc_tipo, self.preparar, self.produzir, self.base_url())
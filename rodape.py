@@ -0,0 +1,188 @@
+# rodape.py
+"""
+Bloco de rodapé da assinatura digital (QR + assinatura-imagem + textos).
+
+Tudo que não muda de um documento para outro fica pronto em cache:
+- assinatura-imagem já recortada (getbbox) e redimensionada para o papel,
+  como ImageReader decodificado, por (caminho, mtime, papel);
+- o bloco por (médico, papel, doc_tipo): cabeçalho "nome | conselho",
+  frases legais, fontes e larguras já medidas com stringWidth.
+
+Por documento só o QR code (URL de validação) é gerado, direto como
+path vetorial (utils.desenhar_qrcode), sem PIL/PNG.
+Sem arquivos temporários: nada de assinatura_tmp_*.png compartilhado.
+"""
+import os, threading, logging
+from collections import OrderedDict
+
+from PIL import Image
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+from utils import desenhar_qrcode
+
+RODAPE_CACHE_MAX = int(os.getenv("RODAPE_CACHE_MAX", "256"))
+
+logger = logging.getLogger(__name__)
+
+QR_SIZE = 60
+QR_GAP = 14
+FRASE_MP = "Assinatura digital válida conforme MP 2.200-2/2001"
+
+# posição de cada documento (igual ao que cada blueprint desenhava)
+#   centro_y: linha do meio do texto; assin_dy: base da assinatura-imagem acima de centro_y
+#   centralizado: bloco QR+texto centrado na página (pedido) ou QR na margem esquerda
+LAYOUTS = {
+    "RECEITA": {
+        "centro_y": 120, "assin_dy": 18, "centralizado": False,
+        "frase": "Para verificar a autenticidade da receita, leia o QR code ao lado.",
+        "fontes": {"A4": (11, 9), "A5": (11, 9)},
+    },
+    "ATESTADO": {
+        "centro_y": 135, "assin_dy": 15, "centralizado": False,
+        "frase": "Para verificar a autenticidade do atestado, leia o QR code ao lado.",
+        "fontes": {"A4": (11, 9), "A5": (11, 9)},
+    },
+    "DECLARACAO": {
+        "centro_y": 135, "assin_dy": 18, "centralizado": False,
+        "frase": "Para verificar a autenticidade da declaração, leia o QR code ao lado.",
+        "fontes": {"A4": (11, 9), "A5": (11, 9)},
+    },
+    "PEDIDO_EXAMES": {
+        "centro_y": 135, "assin_dy": 25, "centralizado": True,
+        "frase": "Para verificar a autenticidade, leia o QR code ao lado.",
+        "fontes": {"A4": (11, 9), "A5": (10, 8)},
+    },
+}
+
+_assinaturas = OrderedDict()
+_blocos = OrderedDict()
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "assinaturas_carregadas": 0}
+
+
+def _limite_assinatura(tamanho_papel):
+    return (330, 75) if tamanho_papel == 'A4' else (260, 54)
+
+
+def _preparar_assinatura(caminho, tamanho_papel):
+    max_w, max_h = _limite_assinatura(tamanho_papel)
+    with Image.open(caminho) as img:
+        if img.mode != "RGBA":
+            img = img.convert("RGBA")
+        bbox = img.getbbox()
+        if bbox:
+            img = img.crop(bbox)
+        iw, ih = img.size
+        ratio = min(max_w / iw, max_h / ih, 1.0)
+        nw, nh = int(iw * ratio), int(ih * ratio)
+        img = img.resize((nw, nh), Image.LANCZOS)
+    reader = ImageReader(img)
+    reader.getRGBData()   # decodifica agora: o mesmo reader é desenhado por várias threads
+    return reader, nw, nh
+
+
+def _obter_assinatura(caminho, tamanho_papel):
+    """(ImageReader, largura, altura) da assinatura-imagem, ou None."""
+    if not caminho or not caminho.lower().endswith(('.png', '.jpg', '.jpeg')):
+        return None
+    try:
+        mtime = os.path.getmtime(caminho)
+    except OSError:
+        return None
+    chave = (caminho, mtime, tamanho_papel)
+    with _lock:
+        item = _assinaturas.get(chave)
+        if item is not None:
+            _assinaturas.move_to_end(chave)
+            return item
+    try:
+        item = _preparar_assinatura(caminho, tamanho_papel)
+    except Exception as e:
+        logger.warning("[RODAPE] falha ao preparar assinatura-imagem %s (%s): %s", caminho, tamanho_papel, e)
+        return None
+    with _lock:
+        _stats["assinaturas_carregadas"] += 1
+        _assinaturas[chave] = item
+        while len(_assinaturas) > RODAPE_CACHE_MAX:
+            _assinaturas.popitem(last=False)
+    return item
+
+
+class BlocoRodape:
+    """Parte fixa do rodapé de um médico num papel/tipo de documento."""
+
+    def __init__(self, doc_tipo, tamanho_papel, nome_medico, conselho_label, assinatura):
+        layout = LAYOUTS[doc_tipo]
+        self.doc_tipo = doc_tipo
+        self.tamanho_papel = tamanho_papel
+        self.centro_y = layout["centro_y"]
+        self.assin_dy = layout["assin_dy"]
+        self.centralizado = layout["centralizado"]
+        self.header_size, self.body_size = layout["fontes"].get(tamanho_papel, layout["fontes"]["A4"])
+        self.header = f"{nome_medico}    |    {conselho_label}"
+        self.linhas = (layout["frase"], FRASE_MP)
+        self.header_w = stringWidth(self.header, "Helvetica-Bold", self.header_size)
+        self.linhas_w = tuple(stringWidth(t, "Helvetica", self.body_size) for t in self.linhas)
+        self.assinatura, self.assin_w, self.assin_h = assinatura or (None, 0, 0)
+
+    def desenhar(self, pdf, largura, url_validacao):
+        """Desenha o bloco inteiro; só o QR depende do documento."""
+        cy = self.centro_y
+        if self.centralizado:
+            texto_w = max(self.header_w, *self.linhas_w, self.assin_w)
+            qr_x = (largura - (QR_SIZE + QR_GAP + texto_w)) / 2.0
+        else:
+            qr_x = 50
+        qr_y = cy - QR_SIZE // 2
+        text_x = qr_x + QR_SIZE + QR_GAP
+
+        desenhar_qrcode(pdf, url_validacao, qr_x, qr_y, QR_SIZE)
+
+        if self.assinatura is not None:
+            w, h = self.assin_w, self.assin_h
+            if self.centralizado:
+                # assinatura alinhada ao texto, sem passar da margem direita
+                w = min(w, max(60, int(largura - 50 - text_x)))
+                x_ass = text_x
+            else:
+                x_ass = int(largura / 2.0 - w / 2.0)
+            pdf.drawImage(self.assinatura, x_ass, cy + self.assin_dy, width=w, height=h, mask='auto')
+
+        pdf.setFont("Helvetica-Bold", self.header_size)
+        pdf.drawString(text_x, cy + 15, self.header)
+        pdf.setFont("Helvetica", self.body_size)
+        pdf.drawString(text_x, cy, self.linhas[0])
+        pdf.drawString(text_x, cy - 15, self.linhas[1])
+
+
+def obter_bloco_rodape(medico_id, doc_tipo, tamanho_papel, nome_medico, conselho_label, assinatura_img_path):
+    """BlocoRodape do cache (chave inclui nome/conselho/assinatura: mudou, gera outro)."""
+    doc_tipo = doc_tipo.upper()
+    tamanho_papel = 'A5' if (tamanho_papel or '').upper() == 'A5' else 'A4'
+    assinatura = _obter_assinatura(assinatura_img_path, tamanho_papel)
+    chave = (medico_id, tamanho_papel, doc_tipo, nome_medico, conselho_label, assinatura)
+    with _lock:
+        bloco = _blocos.get(chave)
+        if bloco is not None:
+            _blocos.move_to_end(chave)
+            _stats["hits"] += 1
+            return bloco
+        _stats["misses"] += 1
+    bloco = BlocoRodape(doc_tipo, tamanho_papel, nome_medico, conselho_label, assinatura)
+    with _lock:
+        _blocos[chave] = bloco
+        while len(_blocos) > RODAPE_CACHE_MAX:
+            _blocos.popitem(last=False)
+    return bloco
+
+
+def desenhar_rodape_digital(pdf, largura, url_validacao, medico_id, doc_tipo, tamanho_papel,
+                            nome_medico, conselho_label, assinatura_img_path):
+    obter_bloco_rodape(medico_id, doc_tipo, tamanho_papel, nome_medico,
+                       conselho_label, assinatura_img_path).desenhar(pdf, largura, url_validacao)
+
+
+def estatisticas_rodapes():
+    with _lock:
+        return {**_stats, "blocos": len(_blocos), "assinaturas": len(_assinaturas)}
@@ -1,52 +1,25 @@
 import os
-import tempfile
+import threading
+from collections import OrderedDict
 from pdf2image import convert_from_path
 from PIL import Image
+from reportlab.lib.utils import ImageReader
+from papel_timbrado import TIMBRADO_VETORIAL, eh_timbrado_pdf, precarregar_timbrado
 import qrcode
 from io import BytesIO
-import pymysql
 import pytz
 from datetime import datetime
 
 TZ = pytz.timezone('America/Sao_Paulo')
 
-def obter_dados_medico(medico_id):
-    import os
-    try:
-        conn = pymysql.connect(
-            host=os.getenv("DB_HOST"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASS"),
-            database=os.getenv("DB_NAME"),
-            connect_timeout=15
-        )
-        cursor = conn.cursor()
-        query = """
-            SELECT certificado_path, certificado_senha, assinatura_img_path, crm, nome, papel_timbrado_path_a4, papel_timbrado_path_a5
-            FROM medicos WHERE id = %s
-        """
-        cursor.execute(query, (medico_id,))
-        resultado = cursor.fetchone()
-        cursor.close()
-        conn.close()
-        if resultado:
-            return (
-                resultado[0].strip() if resultado[0] else None,   # certificado_path
-                resultado[1].strip() if resultado[1] else None,   # certificado_senha
-                resultado[2].strip() if resultado[2] else None,   # assinatura_img_path
-                resultado[3].strip() if resultado[3] else '',     # crm
-                resultado[4].strip() if resultado[4] else '',     # nome
-                resultado[5].strip() if resultado[5] else None,   # papel_timbrado_path_a4
-                resultado[6].strip() if resultado[6] else None    # papel_timbrado_path_a5
-            )
-        else:
-            return (None,) * 7
-    except Exception as e:
-        print("Erro ao consultar certificado:", e)
-        return (None,) * 7
+# máscara do QR: "auto" (padrão) é a escolha por penalidade da norma, que evita
+# manchas grandes e falsos padrões de localização (importa no papel escaneado);
+# 0-7 fixa a máscara e pula a pontuação das 8 (opcional, ~3 ms a menos por QR)
+_mascara = (os.getenv("QR_MASCARA") or "auto").strip().lower()
+QR_MASCARA = None if _mascara == "auto" else int(_mascara)
 
 def gerar_qrcode(url):
-    qr = qrcode.QRCode(box_size=3, border=1)
+    qr = qrcode.QRCode(box_size=3, border=1, mask_pattern=QR_MASCARA)
     qr.add_data(url)
     qr.make(fit=True)
     img = qr.make_image(fill_color="black", back_color="white")
@@ -55,48 +28,186 @@ def gerar_qrcode(url):
     buffer.seek(0)
     return buffer
 
+def desenhar_qrcode(pdf, url, x, y, tamanho):
+    """QR vetorial: módulos pretos viram retângulos de um único path (sem PNG/PIL).
+    Mesma versão e borda do gerar_qrcode (1 módulo, fundo branco), em tamanho x tamanho pt,
+    com a máscara QR_MASCARA."""
+    qr = qrcode.QRCode(border=1, mask_pattern=QR_MASCARA)
+    qr.add_data(url)
+    qr.make(fit=True)
+    matriz = qr.get_matrix()
+    n = len(matriz)
+
+    pdf.saveState()
+    # 1 unidade = 1 módulo, origem no canto superior esquerdo: coordenadas inteiras e curtas
+    pdf.translate(x, y + tamanho)
+    pdf.scale(tamanho / float(n), -tamanho / float(n))
+    pdf.setFillColorRGB(1, 1, 1)
+    pdf.rect(0, 0, n, n, stroke=0, fill=1)
+    pdf.setFillColorRGB(0, 0, 0)
+    ops = []
+    for i, linha in enumerate(matriz):
+        j = 0
+        while j < n:
+            if linha[j]:
+                ini = j
+                while j < n and linha[j]:
+                    j += 1
+                ops.append(f"{ini} {i} {j - ini} 1 re")   # uma sequência horizontal = um retângulo
+            else:
+                j += 1
+    if ops:
+        ops.append("f")
+        pdf.addLiteral("\n".join(ops))
+    pdf.restoreState()
+
+# -------------------- cache de papel timbrado --------------------
+# Papel timbrado já rasterizado/redimensionado, por processo. Chave:
+# (caminho, mtime, largura, altura, dpi). Limite de memória com LRU.
+TIMBRADO_DPI = int(os.getenv("TIMBRADO_DPI", "300"))
+TIMBRADO_CACHE_MB = int(os.getenv("TIMBRADO_CACHE_MB", "128"))
+
+_timbrados = OrderedDict()
+_timbrados_bytes = 0
+_timbrados_lock = threading.Lock()
+_timbrados_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+def _rasterizar_timbrado(papel_timbrado_path, largura, altura, dpi):
+    ext = (os.path.splitext(papel_timbrado_path)[1] or "").lower()
+    if ext == ".pdf":
+        paginas = convert_from_path(papel_timbrado_path, dpi=dpi, size=(int(largura), int(altura)),
+                                    first_page=1, last_page=1)
+        return paginas[0].convert("RGB")
+    if ext in (".png", ".jpg", ".jpeg"):
+        with Image.open(papel_timbrado_path) as bg:
+            return bg.convert("RGB").resize((int(largura), int(altura)), Image.LANCZOS)
+    return None
+
+def obter_timbrado(papel_timbrado_path, largura, altura, dpi=TIMBRADO_DPI):
+    """ImageReader pronto para drawImage (do cache quando possível), ou None."""
+    global _timbrados_bytes
+    if not papel_timbrado_path:
+        return None
+    chave = (papel_timbrado_path, os.path.getmtime(papel_timbrado_path), int(largura), int(altura), dpi)
+    with _timbrados_lock:
+        item = _timbrados.get(chave)
+        if item is not None:
+            _timbrados.move_to_end(chave)
+            _timbrados_stats["hits"] += 1
+            return item[0]
+        _timbrados_stats["misses"] += 1
+
+    img = _rasterizar_timbrado(papel_timbrado_path, largura, altura, dpi)
+    if img is None:
+        return None
+    reader = ImageReader(img)
+    reader.getRGBData()  # decodifica agora, fora do caminho de cada documento
+    tamanho = img.size[0] * img.size[1] * 3
+
+    with _timbrados_lock:
+        if chave not in _timbrados:
+            _timbrados[chave] = (reader, tamanho)
+            _timbrados_bytes += tamanho
+        limite = TIMBRADO_CACHE_MB * 1024 * 1024
+        while _timbrados_bytes > limite and len(_timbrados) > 1:
+            _, (_, t) = _timbrados.popitem(last=False)
+            _timbrados_bytes -= t
+            _timbrados_stats["evictions"] += 1
+    return reader
+
+def estatisticas_timbrados():
+    with _timbrados_lock:
+        return {**_timbrados_stats, "itens": len(_timbrados), "bytes": _timbrados_bytes}
+
+def precarregar_fundo_papel(papel_timbrado_path, largura, altura) -> bool:
+    """Carrega o timbrado no cache que desenhar_fundo_papel/aplicar_timbrado vão usar."""
+    if not papel_timbrado_path or not os.path.isfile(papel_timbrado_path):
+        return False
+    if TIMBRADO_VETORIAL and eh_timbrado_pdf(papel_timbrado_path):
+        return precarregar_timbrado(papel_timbrado_path)
+    return obter_timbrado(papel_timbrado_path, largura, altura) is not None
+
 def desenhar_fundo_papel(pdf, papel_timbrado_path, largura, altura):
     if not papel_timbrado_path:
         return
-    ext = os.path.splitext(papel_timbrado_path)[1].lower()
+    if TIMBRADO_VETORIAL and eh_timbrado_pdf(papel_timbrado_path):
+        return  # aplicado depois do render como Form XObject (papel_timbrado.aplicar_timbrado)
     try:
-        if ext == ".pdf":
-            paginas = convert_from_path(papel_timbrado_path, dpi=300, size=(int(largura), int(altura)))
-            img_bg = paginas[0]
-            temp_bg_path = os.path.join(tempfile.gettempdir(), "tmp_papel_timbrado.png")
-            img_bg.save(temp_bg_path, format="PNG", quality=95)
-            pdf.drawImage(temp_bg_path, 0, 0, width=largura, height=altura, mask='auto')
-            os.remove(temp_bg_path)
-        elif ext in [".png", ".jpg", ".jpeg"]:
-            with Image.open(papel_timbrado_path) as bg:
-                bg = bg.convert("RGB")
-                bg = bg.resize((int(largura), int(altura)), Image.LANCZOS)
-                temp_bg_path = os.path.join(tempfile.gettempdir(), "tmp_papel_timbrado.png")
-                bg.save(temp_bg_path, quality=95)
-                pdf.drawImage(temp_bg_path, 0, 0, width=largura, height=altura, mask='auto')
-                os.remove(temp_bg_path)
+        img_bg = obter_timbrado(papel_timbrado_path, largura, altura)
+        if img_bg is not None:
+            pdf.drawImage(img_bg, 0, 0, width=largura, height=altura, mask='auto')
     except Exception as e:
         print(f"Erro ao processar fundo do papel timbrado: {e}")
 
 def desenhar_texto_multilinha(pdf, texto, x, y, largura_caixa, fontname="Helvetica", fontsize=11, leading=14):
+    """Quebra por largura; preserva ENTERs e linhas em branco. Devolve o y seguinte."""
     from reportlab.pdfbase.pdfmetrics import stringWidth
-    linhas = []
-    palavras = texto.split(' ')
-    linha_atual = ""
-    for palavra in palavras:
-        test_line = linha_atual + (" " if linha_atual else "") + palavra
-        if stringWidth(test_line, fontname, fontsize) < largura_caixa:
-            linha_atual = test_line
-        else:
-            linhas.append(linha_atual)
-            linha_atual = palavra
-    if linha_atual:
-        linhas.append(linha_atual)
-    for linha in linhas:
-        pdf.drawString(x, y, linha)
-        y -= leading
+    texto = str(texto or "").replace('\r\n', '\n').replace('\r', '\n')
+    for bloco in texto.split('\n'):
+        if bloco.strip() == "":
+            y -= leading
+            continue
+        linha_atual = ""
+        for palavra in bloco.split(' '):
+            test_line = linha_atual + (" " if linha_atual else "") + palavra
+            if stringWidth(test_line, fontname, fontsize) < largura_caixa:
+                linha_atual = test_line
+            else:
+                if linha_atual:
+                    pdf.drawString(x, y, linha_atual)
+                    y -= leading
+                linha_atual = palavra
+        if linha_atual:
+            pdf.drawString(x, y, linha_atual)
+            y -= leading
     return y
 
+# -------------------- formatação --------------------
+def fmt_cpf(cpf):
+    s = ''.join(ch for ch in str(cpf or '') if ch.isdigit())
+    if len(s) == 11:
+        return f"{s[:3]}.{s[3:6]}.{s[6:9]}-{s[9:]}"
+    return str(cpf or '')
+
+def fmt_data(d):
+    """dd/mm/aaaa a partir de ISO, YYYY-MM-DD, YYYYMMDD, etc."""
+    if not d:
+        return ''
+    s = str(d).strip()
+    try:
+        s2 = s.replace('Z', '+00:00')
+        dt = datetime.fromisoformat(s2[:26])
+        return dt.strftime('%d/%m/%Y')
+    except Exception:
+        pass
+    if len(s) >= 10 and s[4] == '-' and s[7] == '-':
+        y, m, d2 = s[:4], s[5:7], s[8:10]
+        return f"{d2}/{m}/{y}"
+    if len(s) == 8 and s.isdigit():
+        y, m, d2 = s[:4], s[4:6], s[6:8]
+        return f"{d2}/{m}/{y}"
+    return s
+
+def norm_date_sql(d):
+    """Para salvar YYYY-MM-DD no DB."""
+    if not d:
+        return None
+    s = str(d).strip()
+    try:
+        s2 = s.replace('Z', '+00:00')
+        dt = datetime.fromisoformat(s2[:26])
+        return dt.strftime('%Y-%m-%d')
+    except Exception:
+        pass
+    if len(s) >= 10 and s[4] == '-' and s[7] == '-':
+        return s[:10]
+    if len(s) == 10 and s[2] == '/' and s[5] == '/':
+        d2, m, y = s[:2], s[3:5], s[6:10]
+        return f"{y}-{m}-{d2}"
+    if len(s) == 8 and s.isdigit():
+        return f"{s[:4]}-{s[4:6]}-{s[6:8]}"
+    return s
+
 def get_or_create_paciente(conn, nome, cpf, data_nascimento, sexo):
     cursor = conn.cursor()
     cursor.execute("SELECT id FROM pacientes WHERE cpf = %s", (cpf,))
@@ -0,0 +1,277 @@
+# validacao.py
+"""
+Páginas públicas de validação (QR code): /validar_receita, /validar_atestado,
+/validar_declaracao, /validar_pedido_exame.
+
+- uma consulta só: documento + médico + paciente + último `conselho` no
+  mesmo SELECT (`consultar_documento`); o rótulo do conselho sai dali, sem
+  outra conexão
+- o HTML pronto fica em cache por documento (VALIDACAO_CACHE_TTL segundos,
+  LRU com VALIDACAO_CACHE_MAX páginas); só entram páginas de documentos
+  finalizados (PDF já gravado)
+- troca de status é feita pelo painel da clínica direto no banco, que
+  depois chama POST /api/validacao/invalidar; o cache é por processo e
+  a invalidação chega aos outros workers por invalidacao.py (sem a
+  tabela invalidacoes_cache, só no fim de VALIDACAO_CACHE_TTL)
+- HTTP: ETag forte do HTML + Cache-Control private, max-age=VALIDACAO_MAX_AGE;
+  If-None-Match responde 304 direto do cache
+- a imagem da assinatura deixou de ir em base64 dentro do HTML: é um
+  recurso próprio (/validacao/assinatura/<medico_id>?v=<mtime>&t=<token>),
+  com cache longo no navegador. O token é um HMAC do médico com
+  VALIDACAO_SEGREDO e só vai em páginas de documentos daquele médico:
+  contar ids na rota da imagem dá 404. No pedido de exames o médico vem do
+  ?mid= do QR; a URL só é assinada (e a página só entra no cache) quando
+  pedidos_exames.medico_id confere com ele (migracoes/004); mid de outro
+  médico dá 404 e pedido antigo, sem médico gravado, sai sem a imagem.
+  Sem segredo configurado, um sorteado a cada subida (no mestre, antes do
+  fork: os workers usam o mesmo)
+"""
+import os, hmac, hashlib, threading, time
+from collections import OrderedDict
+
+from flask import Blueprint, request, send_file, url_for, current_app, abort
+
+from db import conectar
+from esquema import esquema
+from perfil_medico import obter_perfil, normalizar_conselho, formatar_conselho_label, formatar_conselho_rotulo
+from invalidacao import registrar_invalidador, publicar_invalidacao
+
+# por processo; outros workers: ver invalidacao.py (sem a tabela, até o TTL de atraso)
+VALIDACAO_CACHE_TTL = float(os.getenv("VALIDACAO_CACHE_TTL", "300"))
+VALIDACAO_CACHE_MAX = int(os.getenv("VALIDACAO_CACHE_MAX", "5000"))
+VALIDACAO_MAX_AGE = int(os.getenv("VALIDACAO_MAX_AGE", "60"))
+ASSINATURA_MAX_AGE = int(os.getenv("ASSINATURA_MAX_AGE", "86400"))
+VALIDACAO_SEGREDO = (os.getenv("VALIDACAO_SEGREDO") or "").encode() or os.urandom(32)
+
+validacao_bp = Blueprint('validacao', __name__)
+
+
+# -------------------- consulta única --------------------
+class DadosValidacao:
+    """Colunas do documento (`doc`, na ordem pedida) + médico, paciente e conselho."""
+
+    def __init__(self, doc, medico_id, nome_medico, crm, assinatura_img_path, nome_paciente, cpf_paciente, conselho):
+        self.doc = doc
+        self.medico_id = medico_id
+        self.nome_medico = nome_medico or ""
+        self.crm = crm or ""
+        self.assinatura_img_path = _clean_path(assinatura_img_path)
+        self.nome_paciente = nome_paciente or ""
+        self.cpf_paciente = cpf_paciente or ""
+        self.conselho = conselho
+
+    def conselho_label(self) -> str:
+        return formatar_conselho_label(self.conselho, self.crm)
+
+    def conselho_rotulo(self) -> tuple[str, str]:
+        return formatar_conselho_rotulo(self.conselho, self.crm)
+
+    def assinatura_url(self):
+        return url_assinatura(self.medico_id, self.assinatura_img_path)
+
+
+def _clean_path(p):
+    if not p:
+        return None
+    return str(p).strip().replace('\r', '').replace('\n', '')
+
+
+def _sql_documento(tabela: str, campos, medico_por_parametro: bool) -> str:
+    tem_conselho = esquema().tem_tabela("conselho")
+    selecao = list(campos) + [
+        "m.id, COALESCE(m.nome,''), COALESCE(m.crm,''), COALESCE(m.assinatura_img_path,'')",
+        "p.nome, p.cpf",
+        "c.tipo, c.codigo, c.uf" if tem_conselho else "NULL, NULL, NULL",
+    ]
+    if medico_por_parametro:
+        # pedidos antigos não guardam o médico: vem do ?mid= da URL do QR
+        medico = "COALESCE(d.medico_id, %s)" if esquema().tem_coluna(tabela, "medico_id") else "%s"
+        joins = ["LEFT JOIN pacientes p ON p.id = d.paciente_id",
+                 f"LEFT JOIN medicos m ON m.id = {medico}"]
+    else:
+        joins = ["JOIN medicos m ON m.id = d.medico_id",
+                 "JOIN pacientes p ON p.id = d.paciente_id"]
+    if tem_conselho:
+        joins.append("LEFT JOIN conselho c"
+                     " ON c.id = (SELECT MAX(c2.id) FROM conselho c2 WHERE c2.medico_id = m.id)")
+    return ("SELECT " + ",\n       ".join(selecao) +
+            f"\n  FROM {tabela} d\n  " + "\n  ".join(joins) + "\n WHERE d.id = %s")
+
+
+def consultar_documento(tabela: str, campos, documento_id: int, medico_id=None, medico_por_parametro=False):
+    """
+    Um SELECT para a página de validação; `campos` são colunas de `d` (o documento).
+    Devolve DadosValidacao ou None se o documento não existe.
+    """
+    sql = _sql_documento(tabela, campos, medico_por_parametro)
+    args = (medico_id, documento_id) if medico_por_parametro else (documento_id,)
+    conn = conectar()
+    try:
+        cur = conn.cursor()
+        cur.execute(sql, args)
+        row = cur.fetchone()
+        cur.close()
+    finally:
+        conn.close()
+    if not row:
+        return None
+    n = len(campos)
+    mid, nome_med, crm, ass, nome_pac, cpf_pac, tipo, codigo, uf = row[n:n + 9]
+    return DadosValidacao(tuple(row[:n]), mid, nome_med, crm, ass, nome_pac, cpf_pac,
+                          normalizar_conselho(tipo, codigo, uf))
+
+
+# -------------------- cache das páginas --------------------
+class Pagina:
+    def __init__(self, html: str, medico_id=None, cacheavel: bool = True):
+        self.html = html
+        self.medico_id = medico_id
+        self.cacheavel = cacheavel
+        self.etag = hashlib.sha256(html.encode("utf-8")).hexdigest()[:32]
+        self.criada_em = time.monotonic()
+
+
+class CacheValidacao:
+    def __init__(self, ttl: float = VALIDACAO_CACHE_TTL, maximo: int = VALIDACAO_CACHE_MAX):
+        self.ttl = ttl
+        self.maximo = maximo
+        self._itens = OrderedDict()     # (tipo, chave) -> Pagina
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidadas = 0
+
+    def obter(self, tipo, chave):
+        with self._lock:
+            pag = self._itens.get((tipo, chave))
+            if pag and (time.monotonic() - pag.criada_em) < self.ttl:
+                self._itens.move_to_end((tipo, chave))
+                self.hits += 1
+                return pag
+            if pag:
+                del self._itens[(tipo, chave)]
+            self.misses += 1
+            return None
+
+    def guardar(self, tipo, chave, pag: Pagina):
+        if self.ttl <= 0 or not pag.cacheavel:
+            return
+        with self._lock:
+            self._itens[(tipo, chave)] = pag
+            self._itens.move_to_end((tipo, chave))
+            while len(self._itens) > self.maximo:
+                self._itens.popitem(last=False)
+
+    def invalidar(self, tipo=None, documento_id=None, medico_id=None) -> int:
+        with self._lock:
+            if tipo is None and documento_id is None and medico_id is None:
+                n = len(self._itens)
+                self._itens.clear()
+            else:
+                alvo = [k for k, pag in self._itens.items()
+                        if (tipo is None or k[0] == tipo)
+                        and (documento_id is None or _id_da_chave(k[1]) == documento_id)
+                        and (medico_id is None or pag.medico_id == medico_id)]
+                for k in alvo:
+                    del self._itens[k]
+                n = len(alvo)
+            self.invalidadas += n
+            return n
+
+    def estatisticas(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "itens": len(self._itens),
+                "maximo": self.maximo,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / total) if total else None,
+                "invalidadas": self.invalidadas,
+            }
+
+
+def _id_da_chave(chave):
+    # pedido usa (pedido_id, mid) como chave
+    return chave[0] if isinstance(chave, tuple) else chave
+
+
+_cache = CacheValidacao()
+registrar_invalidador("validacao", _cache.invalidar)
+
+
+def _resposta(pag: Pagina):
+    if request.if_none_match.contains(pag.etag):
+        resp = current_app.response_class(status=304)
+    else:
+        resp = current_app.response_class(pag.html, mimetype="text/html")
+    resp.set_etag(pag.etag)
+    resp.headers["Cache-Control"] = f"private, max-age={VALIDACAO_MAX_AGE}"
+    return resp
+
+
+def responder_validacao(tipo: str, chave, gerar, nao_encontrado):
+    """
+    Página de validação de `tipo`/`chave` do cache, ou `gerar()` (-> Pagina | None).
+    None vira `nao_encontrado` (não entra no cache).
+    """
+    pag = _cache.obter(tipo, chave)
+    if pag is None:
+        pag = gerar()
+        if pag is None:
+            return nao_encontrado
+        _cache.guardar(tipo, chave, pag)
+    return _resposta(pag)
+
+
+def invalidar_validacao(tipo=None, documento_id=None, medico_id=None) -> int:
+    """Invalida neste processo e publica para os outros workers."""
+    return publicar_invalidacao("validacao", medico_id=medico_id, tipo=tipo, documento_id=documento_id)
+
+
+def estatisticas_validacao():
+    return _cache.estatisticas()
+
+
+# -------------------- assinatura como recurso estático --------------------
+def token_assinatura(medico_id) -> str:
+    return hmac.new(VALIDACAO_SEGREDO, f"assinatura:{int(medico_id)}".encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def url_assinatura(medico_id, caminho):
+    """URL versionada (mtime) e assinada da imagem de assinatura, ou None se o arquivo não existe."""
+    if not medico_id or not caminho:
+        return None
+    try:
+        versao = int(os.stat(caminho).st_mtime)
+    except OSError:
+        return None
+    return url_for('validacao.assinatura', medico_id=int(medico_id), v=versao, t=token_assinatura(medico_id))
+
+
+@validacao_bp.route('/validacao/assinatura/<int:medico_id>')
+def assinatura(medico_id):
+    if not hmac.compare_digest(request.args.get("t", "").encode(), token_assinatura(medico_id).encode()):
+        return abort(404)
+    caminho = obter_perfil(medico_id).assinatura_img_path
+    if not caminho or not os.path.isfile(caminho):
+        return abort(404)
+    ext = caminho.lower()
+    mime = "image/jpeg" if ext.endswith(".jpg") or ext.endswith(".jpeg") else "image/png"
+    return send_file(caminho, mimetype=mime, conditional=True, max_age=ASSINATURA_MAX_AGE)
+
+
+# -------------------- rotas de manutenção --------------------
+@validacao_bp.route('/api/validacao/invalidar', methods=['POST'])
+def validacao_invalidar():
+    # painel da clínica, depois de mudar documento/status direto no banco
+    tipo = (request.args.get('tipo') or "").upper() or None
+    documento_id = request.args.get('documento_id', type=int)
+    medico_id = request.args.get('medico_id', type=int)
+    return {"removidas": invalidar_validacao(tipo, documento_id, medico_id)}
+
+
+@validacao_bp.route('/api/validacao/cache')
+def validacao_cache():
+    return estatisticas_validacao()